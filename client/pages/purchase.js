@@ -414,6 +414,7 @@ const Purchase = () => {
 
   // Handle purchase confirmation (call backend)
   const handlePurchaseConfirm = async () => {
+    if (purchaseLoading) return; // Ignore double-clicks while the order is in flight
     setPurchaseLoading(true);
     setPurchaseError(null);
 
@@ -422,6 +423,8 @@ const Purchase = () => {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          // Retries of the same quote replay the original order instead of placing another
+          'Idempotency-Key': quote.quoteId,
         },
         body: JSON.stringify({
           quoteId: quote.quoteId,
@@ -6,6 +6,7 @@ from datetime import datetime
 
 import web3
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 from eth_account import Account
 import secrets
 
@@ -86,8 +87,11 @@ async def create_user(user_data: UserSignup) -> UserResponse:
         "private_key": private_key
     }
     
-    # Insert user into database
-    result = await database.users.insert_one(user_doc)
+    # Insert user into database; the unique email index catches a concurrent signup
+    try:
+        result = await database.users.insert_one(user_doc)
+    except DuplicateKeyError:
+        raise ValueError(f"User with this email already exists {user_data.email}")
     
     # Return user response (without password hash)
     return UserResponse(
@@ -0,0 +1,199 @@
+"""
+Durable queue for recording completed orders on chain.
+
+/purchase writes the order to order_history with blockchain_status "pending"
+and returns; a background worker picks up due jobs, runs the on-chain calls
+and stores the outcome on the same record. Because the queue lives in the
+database, jobs left behind by a restart are picked up again: while a job is
+running its next attempt time doubles as a lease, so a job whose worker died
+becomes due again once the lease runs out.
+"""
+
+import os
+import asyncio
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from dotenv import load_dotenv
+from .database import db
+from .resilience import backoff_delay
+
+# Load environment variables
+load_dotenv()
+
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# handler(order, checkpoint) -> blockchain record; checkpoint(fields) persists progress on the order
+JobHandler = Callable[[dict, Callable[[dict], Awaitable[None]]], Awaitable[dict]]
+
+
+def initial_job_fields(now: Optional[datetime] = None) -> dict:
+    """Fields that enqueue an order when written with its order_history record"""
+    now = now or datetime.utcnow()
+    return {
+        "blockchain_status": PENDING,
+        "blockchain_attempts": 0,
+        "blockchain_next_attempt_at": now,
+        "blockchain_last_error": None,
+        "blockchain_record": None,
+        "blockchain_updated_at": now
+    }
+
+
+class BlockchainJobQueue:
+    """Background worker for the blockchain jobs stored on order_history"""
+
+    def __init__(self, handler: JobHandler):
+        self.handler = handler
+        self.max_attempts = int(os.getenv("BLOCKCHAIN_JOB_MAX_ATTEMPTS", "5"))
+        self.poll_interval = float(os.getenv("BLOCKCHAIN_JOB_POLL_INTERVAL", "10"))
+        self.lease_seconds = float(os.getenv("BLOCKCHAIN_JOB_LEASE", "600"))
+        self.backoff_base = float(os.getenv("BLOCKCHAIN_JOB_BACKOFF_BASE", "10"))
+        self.backoff_cap = float(os.getenv("BLOCKCHAIN_JOB_BACKOFF_CAP", "600"))
+        self.batch_size = 20
+        self.wakeup = asyncio.Event()
+        self.worker_task: Optional[asyncio.Task] = None
+        # Soonest retry this worker scheduled, so it wakes for it before the next poll
+        self.next_retry_at: Optional[datetime] = None
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+
+    async def start(self):
+        """Start the worker (called from the app startup hook)"""
+        if self.worker_task is None:
+            self.worker_task = asyncio.create_task(self._worker_loop())
+
+    async def stop(self):
+        if self.worker_task is not None:
+            self.worker_task.cancel()
+            try:
+                await self.worker_task
+            except asyncio.CancelledError:
+                pass
+            self.worker_task = None
+
+    def notify(self):
+        """Wake the worker after a new job was written"""
+        self.wakeup.set()
+
+    async def _worker_loop(self):
+        while True:
+            try:
+                await self.run_due()
+            except Exception as e:
+                print(f"Blockchain job worker error: {e}")
+            timeout = self.poll_interval
+            if self.next_retry_at is not None:
+                timeout = min(timeout, max(0.0, (self.next_retry_at - datetime.utcnow()).total_seconds()))
+                self.next_retry_at = None
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+
+    async def run_due(self) -> int:
+        """Run every job that is due; returns how many this worker ran"""
+        collection = db.database.order_history
+        ran = 0
+        while True:
+            due = await collection.find({
+                "blockchain_status": {"$in": [PENDING, RUNNING]},
+                "blockchain_next_attempt_at": {"$lte": datetime.utcnow()}
+            }).sort("blockchain_next_attempt_at", 1).limit(self.batch_size).to_list(self.batch_size)
+            if not due:
+                return ran
+            for job in due:
+                if await self._claim(collection, job):
+                    await self._run(collection, job)
+                    ran += 1
+
+    async def _claim(self, collection, job: dict) -> bool:
+        """Take the job unless another worker changed it since it was read"""
+        now = datetime.utcnow()
+        attempts = job.get("blockchain_attempts", 0) + 1
+        fields = {
+            "blockchain_status": RUNNING,
+            "blockchain_attempts": attempts,
+            "blockchain_next_attempt_at": now + timedelta(seconds=self.lease_seconds),
+            "blockchain_updated_at": now
+        }
+        result = await collection.update_one(
+            {
+                "_id": job["_id"],
+                "blockchain_status": job["blockchain_status"],
+                "blockchain_next_attempt_at": job["blockchain_next_attempt_at"]
+            },
+            {"$set": fields}
+        )
+        if result.matched_count != 1:
+            return False
+        job.update(fields)
+        return True
+
+    async def _run(self, collection, job: dict):
+        async def checkpoint(fields: dict):
+            await collection.update_one({"_id": job["_id"]}, {"$set": fields})
+            job.update(fields)
+
+        attempts = job["blockchain_attempts"]
+        order_id = job.get("order_id")
+        try:
+            record = await self.handler(job, checkpoint)
+        except Exception as e:
+            now = datetime.utcnow()
+            if attempts >= self.max_attempts:
+                self.failed += 1
+                print(f"Blockchain job for order {order_id} failed after {attempts} attempts: {e}")
+                fields = {"blockchain_status": FAILED}
+            else:
+                self.retried += 1
+                delay = self.backoff_base + backoff_delay(attempts, self.backoff_base, self.backoff_cap)
+                print(f"Blockchain job for order {order_id} failed (attempt {attempts}), retrying in {delay:.0f}s: {e}")
+                retry_at = now + timedelta(seconds=delay)
+                fields = {"blockchain_status": PENDING, "blockchain_next_attempt_at": retry_at}
+                if self.next_retry_at is None or retry_at < self.next_retry_at:
+                    self.next_retry_at = retry_at
+            fields.update({"blockchain_last_error": str(e), "blockchain_updated_at": now})
+            await collection.update_one({"_id": job["_id"]}, {"$set": fields})
+            return
+
+        self.succeeded += 1
+        print(f"Blockchain job for order {order_id} succeeded (attempt {attempts})")
+        await collection.update_one({"_id": job["_id"]}, {"$set": {
+            "blockchain_status": SUCCEEDED,
+            "blockchain_record": record,
+            "blockchain_last_error": None,
+            "blockchain_updated_at": datetime.utcnow()
+        }})
+
+    def stats(self) -> dict:
+        return {
+            "workerRunning": self.worker_task is not None and not self.worker_task.done(),
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retried": self.retried,
+            "maxAttempts": self.max_attempts
+        }
+
+
+def job_status(order: dict) -> dict:
+    """API view of the blockchain job stored on an order_history record"""
+    def iso(value):
+        return value.isoformat() if hasattr(value, "isoformat") else value
+
+    status = order.get("blockchain_status")
+    return {
+        "orderId": order.get("order_id"),
+        "status": status,
+        "attempts": order.get("blockchain_attempts", 0),
+        "nextAttemptAt": iso(order.get("blockchain_next_attempt_at")) if status in (PENDING, RUNNING) else None,
+        "lastError": order.get("blockchain_last_error"),
+        "projectAddress": order.get("blockchain_project_address"),
+        "record": order.get("blockchain_record"),
+        "updatedAt": iso(order.get("blockchain_updated_at"))
+    }
@@ -0,0 +1,291 @@
+"""
+In-process caches for Carbonmark data that rarely changes
+"""
+
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class CacheEntry:
+    __slots__ = ("value", "fetched_at")
+
+    def __init__(self, value: Any, fetched_at: float):
+        self.value = value
+        self.fetched_at = fetched_at
+
+
+class ExpiringCache:
+    """
+    Plain bounded TTL cache for short-lived data such as price books, where
+    serving an expired copy is never acceptable.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Return the live entry for key, or None if missing or expired"""
+        entry = self.entries.get(key)
+        if entry is None or time.monotonic() - entry.fetched_at >= self.ttl:
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def set(self, key: str, value: Any) -> CacheEntry:
+        entry = CacheEntry(value, time.monotonic())
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
+
+    def age(self, key: str) -> Optional[float]:
+        """Seconds since key was stored, or None if it isn't cached"""
+        entry = self.entries.get(key)
+        return time.monotonic() - entry.fetched_at if entry is not None else None
+
+    def invalidate(self, key: str):
+        if self.entries.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations
+        }
+
+
+class RefreshingTTLCache:
+    """
+    TTL cache that refreshes entries in the background before they expire
+    and keeps serving the stale copy when the upstream call fails.
+    """
+
+    def __init__(self, ttl: float, refresh_ahead: float = 0.8):
+        self.ttl = ttl
+        # Fraction of the TTL after which a hit triggers a background refresh
+        self.refresh_ahead = refresh_ahead
+        self.entries: Dict[str, CacheEntry] = {}
+        self.refreshing: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+        self.refresh_failures = 0
+
+    async def get(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for key, loading it with loader() when missing or expired"""
+        entry = self.entries.get(key)
+        now = time.monotonic()
+
+        if entry is not None:
+            age = now - entry.fetched_at
+            if age < self.ttl:
+                self.hits += 1
+                if age >= self.ttl * self.refresh_ahead:
+                    self._schedule_refresh(key, loader)
+                return entry.value
+
+        self.misses += 1
+        try:
+            return await self._refresh(key, loader)
+        except Exception as e:
+            if entry is None:
+                raise
+            # Upstream failed - serve the last good copy rather than an error
+            self.stale_served += 1
+            print(f"Cache refresh for '{key}' failed, serving stale copy: {e}")
+            return entry.value
+
+    def _schedule_refresh(self, key: str, loader: Callable[[], Awaitable[Any]]):
+        if key in self.refreshing:
+            return
+        task = asyncio.create_task(self._background_refresh(key, loader))
+        self.refreshing[key] = task
+
+    async def _background_refresh(self, key: str, loader: Callable[[], Awaitable[Any]]):
+        try:
+            await self._load(key, loader)
+        except Exception as e:
+            print(f"Background refresh for '{key}' failed: {e}")
+        finally:
+            self.refreshing.pop(key, None)
+
+    async def _refresh(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        # Piggyback on a background refresh that is already in flight
+        task = self.refreshing.get(key)
+        if task is not None:
+            await asyncio.shield(task)
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry.fetched_at < self.ttl:
+                return entry.value
+        return await self._load(key, loader)
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await loader()
+        except Exception:
+            self.refresh_failures += 1
+            raise
+        self.entries[key] = CacheEntry(value, time.monotonic())
+        return value
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "entries": len(self.entries),
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "staleServed": self.stale_served,
+            "refreshFailures": self.refresh_failures,
+            "ages": {key: round(now - entry.fetched_at, 3) for key, entry in self.entries.items()}
+        }
+
+
+class RevalidatingEntry:
+    __slots__ = ("status", "payload", "etag", "last_modified", "fetched_at")
+
+    def __init__(self, status: int, payload: Any, etag: Optional[str], last_modified: Optional[str], fetched_at: float):
+        self.status = status
+        self.payload = payload
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+
+
+class RevalidatingLRUCache:
+    """
+    Bounded LRU cache of upstream JSON payloads with stale-while-revalidate.
+
+    Fresh entries are served directly. Entries past fresh_ttl but within
+    stale_ttl are served immediately while a conditional request
+    (If-None-Match / If-Modified-Since) revalidates them in the background.
+    404 responses are cached for negative_ttl so unknown IDs don't hit upstream.
+    """
+
+    def __init__(self, max_entries: int, fresh_ttl: float, stale_ttl: float, negative_ttl: float):
+        self.max_entries = max_entries
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.entries: "OrderedDict[str, RevalidatingEntry]" = OrderedDict()
+        self.revalidating: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+
+    async def get(self, key: str, fetch: Callable[[Dict[str, str]], Awaitable[Any]]):
+        """
+        Return (status, payload) for key. fetch(headers) performs the upstream
+        GET with the given conditional headers and returns the response.
+        """
+        entry = self.entries.get(key)
+        now = time.monotonic()
+
+        if entry is not None:
+            self.entries.move_to_end(key)
+            age = now - entry.fetched_at
+            if entry.status == 404:
+                if age < self.negative_ttl:
+                    self.hits += 1
+                    return entry.status, entry.payload
+            elif age < self.fresh_ttl:
+                self.hits += 1
+                return entry.status, entry.payload
+            elif age < self.fresh_ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._schedule_revalidation(key, fetch)
+                return entry.status, entry.payload
+
+        self.misses += 1
+        try:
+            entry = await self._revalidate(key, fetch)
+        except Exception as e:
+            if entry is None or entry.status != 200:
+                raise
+            print(f"Revalidation of '{key}' failed, serving stale copy: {e}")
+            return entry.status, entry.payload
+        return entry.status, entry.payload
+
+    def _schedule_revalidation(self, key: str, fetch: Callable[[Dict[str, str]], Awaitable[Any]]):
+        if key in self.revalidating:
+            return
+        self.revalidating[key] = asyncio.create_task(self._background_revalidate(key, fetch))
+
+    async def _background_revalidate(self, key: str, fetch: Callable[[Dict[str, str]], Awaitable[Any]]):
+        try:
+            await self._revalidate(key, fetch)
+        except Exception as e:
+            print(f"Background revalidation of '{key}' failed: {e}")
+        finally:
+            self.revalidating.pop(key, None)
+
+    async def _revalidate(self, key: str, fetch: Callable[[Dict[str, str]], Awaitable[Any]]) -> RevalidatingEntry:
+        entry = self.entries.get(key)
+        headers = {}
+        if entry is not None and entry.status == 200:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        response = await fetch(headers)
+        now = time.monotonic()
+
+        if response.status_code == 304:
+            # The entry may have been evicted or replaced while the request was in flight
+            current = self.entries.get(key)
+            if current is not None and current.status == 200:
+                self.not_modified += 1
+                if current is entry:
+                    current.fetched_at = now
+                return current
+            # Nothing left to revalidate - a 304 has no body, so fetch the payload again
+            response = await fetch({})
+            now = time.monotonic()
+
+        if response.status_code == 404:
+            return self._store(key, RevalidatingEntry(404, None, None, None, now))
+
+        response.raise_for_status()
+        return self._store(key, RevalidatingEntry(
+            200,
+            response.json(),
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+            now
+        ))
+
+    def _store(self, key: str, entry: RevalidatingEntry) -> RevalidatingEntry:
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return entry
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "maxEntries": self.max_entries,
+            "hits": self.hits,
+            "staleHits": self.stale_hits,
+            "misses": self.misses,
+            "notModified": self.not_modified,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,310 @@
+"""
+Shared async HTTP client for Carbonmark API calls.
+
+One pooled aiohttp session lives for the lifetime of the app so upstream calls
+reuse keep-alive connections and never block the event loop.
+"""
+
+import os
+import asyncio
+import json as jsonlib
+from urllib.parse import urlencode, urlsplit
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+import aiohttp
+from dotenv import load_dotenv
+from .resilience import CircuitBreaker, RetryBudget, backoff_delay
+
+# Load environment variables
+load_dotenv()
+
+CARBONMARK_API_URL = "https://api.carbonmark.com"
+CARBONMARK_V17_API_URL = "https://v17.api.carbonmark.com"
+
+
+class CarbonmarkRequestError(Exception):
+    """Network-level failure talking to Carbonmark (connection error, timeout)"""
+
+
+class CircuitOpenError(CarbonmarkRequestError):
+    """The endpoint's circuit is open, so the call failed fast without reaching Carbonmark"""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        super().__init__(f"Carbonmark endpoint '{endpoint}' is temporarily unavailable (circuit open)")
+
+
+class CarbonmarkHTTPError(CarbonmarkRequestError):
+    """Carbonmark answered with a non-2xx status"""
+
+    def __init__(self, response: "CarbonmarkResponse"):
+        self.response = response
+        super().__init__(f"Carbonmark API error {response.status_code} for {response.url}")
+
+
+class CarbonmarkResponse:
+    """Fully read upstream response, exposing the parts of requests.Response we use"""
+
+    def __init__(self, status_code: int, headers, body: bytes, url: str):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.url = url
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+    def json(self):
+        return jsonlib.loads(self.body)
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise CarbonmarkHTTPError(self)
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: the first caller for a key runs the
+    call, later callers await the same in-flight task instead of repeating it.
+    """
+
+    def __init__(self):
+        self.calls: Dict[Hashable, asyncio.Task] = {}
+        self.waiters: Dict[Hashable, int] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self.calls.get(key)
+        if task is None:
+            # Run as a task so a cancelled caller doesn't cancel the call for everyone else
+            task = asyncio.ensure_future(fn())
+            self.calls[key] = task
+            self.waiters[key] = 0
+            self.executed += 1
+            task.add_done_callback(lambda done, key=key: self._finished(key, done))
+        else:
+            self.coalesced += 1
+
+        self.waiters[key] = self.waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if key in self.waiters and self.calls.get(key) is task:
+                self.waiters[key] -= 1
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+            self.waiters.pop(key, None)
+        # Mark the exception as retrieved even if every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        in_flight: Dict[str, int] = {}
+        for key, count in self.waiters.items():
+            label = " ".join(str(part) for part in key[:2])
+            if len(key) > 2 and key[2]:
+                label += "?" + urlencode(key[2])
+            in_flight[label] = in_flight.get(label, 0) + count
+        return {
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "inFlight": in_flight
+        }
+
+
+class CarbonmarkClient:
+    """App-lifetime aiohttp session with keep-alive pooling and configurable timeouts"""
+
+    # Only idempotent reads are coalesced or retried; POSTs create quotes/orders upstream
+    COALESCED_METHODS = ("GET", "HEAD")
+    RETRYABLE_METHODS = ("GET", "HEAD")
+    # Responses that count against the circuit breaker (and are retried for reads)
+    FAILURE_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self):
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.single_flight = SingleFlight()
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.failure_threshold = int(os.getenv("CARBONMARK_BREAKER_FAILURES", "5"))
+        self.reset_timeout = float(os.getenv("CARBONMARK_BREAKER_RESET", "30"))
+        self.max_retries = int(os.getenv("CARBONMARK_MAX_RETRIES", "2"))
+        self.backoff_base = float(os.getenv("CARBONMARK_BACKOFF_BASE", "0.2"))
+        self.backoff_cap = float(os.getenv("CARBONMARK_BACKOFF_CAP", "2"))
+        self.retry_budget = RetryBudget(
+            ratio=float(os.getenv("CARBONMARK_RETRY_RATIO", "0.2")),
+            min_per_second=float(os.getenv("CARBONMARK_RETRY_MIN_PER_SECOND", "1")),
+            max_tokens=float(os.getenv("CARBONMARK_RETRY_MAX_TOKENS", "10"))
+        )
+        self.total_timeout = float(os.getenv("CARBONMARK_TIMEOUT", "30"))
+        self.connect_timeout = float(os.getenv("CARBONMARK_CONNECT_TIMEOUT", "5"))
+        self.pool_limit = int(os.getenv("CARBONMARK_POOL_LIMIT", "100"))
+        self.pool_limit_per_host = int(os.getenv("CARBONMARK_POOL_LIMIT_PER_HOST", "20"))
+        self.keepalive_timeout = float(os.getenv("CARBONMARK_KEEPALIVE_TIMEOUT", "30"))
+
+    async def start(self):
+        """Open the pooled session (called from the app startup hook)"""
+        if self.session and not self.session.closed:
+            return
+
+        connector = aiohttp.TCPConnector(
+            limit=self.pool_limit,
+            limit_per_host=self.pool_limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=300
+        )
+        timeout = aiohttp.ClientTimeout(total=self.total_timeout, connect=self.connect_timeout)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        print(f"Carbonmark client started (pool={self.pool_limit}, per_host={self.pool_limit_per_host}, timeout={self.total_timeout}s)")
+
+    async def close(self):
+        """Close the pooled session (called from the app shutdown hook)"""
+        if self.session and not self.session.closed:
+            await self.session.close()
+            print("Carbonmark client closed")
+        self.session = None
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        json: Optional[Any] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None
+    ) -> CarbonmarkResponse:
+        """Send a request, sharing one upstream call among identical concurrent GETs"""
+        # aiohttp only accepts str/int query values
+        if params:
+            params = {key: str(value) for key, value in params.items() if value is not None}
+
+        async def send():
+            return await self._send_with_retries(method, url, params, json, headers, timeout)
+
+        if method.upper() not in self.COALESCED_METHODS:
+            return await send()
+
+        # Headers are part of the key: auth and conditional headers change the answer
+        key = (
+            method.upper(),
+            url,
+            tuple(sorted((params or {}).items())),
+            tuple(sorted((headers or {}).items()))
+        )
+        return await self.single_flight.do(key, send)
+
+    @staticmethod
+    def endpoint_name(url: str) -> str:
+        """Breaker key: host plus first path segment, e.g. api.carbonmark.com/prices"""
+        parts = urlsplit(url)
+        segment = parts.path.strip("/").split("/", 1)[0]
+        return f"{parts.netloc}/{segment}"
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        name = self.endpoint_name(url)
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name, self.failure_threshold, self.reset_timeout)
+            self.breakers[name] = breaker
+        return breaker
+
+    def circuit_open(self, url: str) -> bool:
+        """Whether calls to url's endpoint would currently fail fast"""
+        return self.breaker(url).is_open()
+
+    async def _send_with_retries(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Dict[str, str]],
+        json: Optional[Any],
+        headers: Optional[Dict[str, str]],
+        timeout: Optional[float]
+    ) -> CarbonmarkResponse:
+        """Send through the endpoint's circuit breaker, retrying reads within the retry budget"""
+        breaker = self.breaker(url)
+        self.retry_budget.record_request()
+        attempt = 0
+
+        while True:
+            if not breaker.allow_request():
+                raise CircuitOpenError(breaker.name)
+
+            error = None
+            response = None
+            try:
+                response = await self._send(method, url, params, json, headers, timeout)
+            except CarbonmarkRequestError as e:
+                error = e
+
+            if response is not None and response.status_code not in self.FAILURE_STATUSES:
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+
+            can_retry = (
+                method.upper() in self.RETRYABLE_METHODS
+                and attempt < self.max_retries
+                and not breaker.is_open()
+                and self.retry_budget.try_withdraw()
+            )
+            if not can_retry:
+                if response is not None:
+                    return response
+                raise error
+
+            delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+            attempt += 1
+            print(f"Retrying {method} {url} (attempt {attempt + 1}) in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Dict[str, str]],
+        json: Optional[Any],
+        headers: Optional[Dict[str, str]],
+        timeout: Optional[float]
+    ) -> CarbonmarkResponse:
+        """Send a request and read the whole body so the connection goes back to the pool"""
+        if self.session is None or self.session.closed:
+            await self.start()
+
+        request_kwargs = {"params": params, "json": json, "headers": headers}
+        if timeout:
+            # Per-call override; otherwise the session-wide timeout applies
+            request_kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout, connect=self.connect_timeout)
+
+        try:
+            async with self.session.request(method, url, **request_kwargs) as response:
+                body = await response.read()
+                return CarbonmarkResponse(response.status, response.headers.copy(), body, str(response.url))
+        except aiohttp.ClientError as e:
+            raise CarbonmarkRequestError(f"Request to {url} failed: {e}") from e
+        except asyncio.TimeoutError as e:
+            raise CarbonmarkRequestError(f"Request to {url} timed out") from e
+
+    def stats(self) -> dict:
+        return {
+            "coalescing": self.single_flight.stats(),
+            "breakers": {name: breaker.to_dict() for name, breaker in self.breakers.items()},
+            "retryBudget": self.retry_budget.to_dict()
+        }
+
+    async def get(self, url: str, **kwargs) -> CarbonmarkResponse:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> CarbonmarkResponse:
+        return await self.request("POST", url, **kwargs)
+
+
+# Global client instance shared by all endpoints
+carbonmark_client = CarbonmarkClient()
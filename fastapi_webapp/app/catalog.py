@@ -0,0 +1,367 @@
+"""
+Local mirror of the Carbonmark project catalog with in-memory faceted indexes.
+
+A background task pages through carbonProjects with conditional requests
+(If-None-Match / If-Modified-Since), so unchanged pages come back as an empty
+304 and a sync where nothing changed skips re-indexing. Changed pages re-index
+only projects whose updatedAt changed, and projects that disappeared upstream
+are dropped. /search then answers from the indexes instead of forwarding every
+keystroke to Carbonmark, until the mirror is older than CATALOG_MAX_STALENESS.
+"""
+
+import os
+import re
+import time
+import asyncio
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from .carbonmark_client import carbonmark_client, CARBONMARK_V17_API_URL
+
+# Load environment variables
+load_dotenv()
+
+# Longest word prefix stored in the name index; longer query words are post-filtered
+MAX_PREFIX_LENGTH = 12
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def name_tokens(name: str) -> List[str]:
+    return WORD_PATTERN.findall((name or "").lower())
+
+
+class ProjectCatalog:
+    """In-memory project catalog with country/category/registry/name-prefix indexes"""
+
+    def __init__(self):
+        self.sync_interval = float(os.getenv("CATALOG_SYNC_INTERVAL", "300"))
+        self.page_size = int(os.getenv("CATALOG_PAGE_SIZE", "500"))
+        # Past this age without a successful sync the mirror stops answering /search
+        self.max_staleness = float(os.getenv("CATALOG_MAX_STALENESS", str(self.sync_interval * 3)))
+        self.projects: Dict[str, dict] = {}
+        self.by_country: Dict[str, Set[str]] = defaultdict(set)
+        self.by_category: Dict[str, Set[str]] = defaultdict(set)
+        self.by_registry: Dict[str, Set[str]] = defaultdict(set)
+        self.by_name_prefix: Dict[str, Set[str]] = defaultdict(set)
+        # Position of each project in name order, so results sort without comparing names
+        self.name_rank: Dict[str, int] = {}
+        # Validators and items of each page from the last sync: page -> (etag, last_modified, items, total)
+        self.pages: Dict[int, Tuple[Optional[str], Optional[str], List[dict], Optional[int]]] = {}
+        self.loaded = False
+        self.last_synced_at: Optional[float] = None
+        self.last_success: Optional[float] = None
+        self.last_sync_duration: Optional[float] = None
+        self.last_sync_changes = 0
+        self.last_sync_pages_fetched = 0
+        self.last_sync_pages_unchanged = 0
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+        self.sync_task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        """Loaded and synced recently enough to answer /search"""
+        return self.loaded and self.staleness() <= self.max_staleness
+
+    def staleness(self) -> Optional[float]:
+        """Seconds since the last successful sync"""
+        if self.last_success is None:
+            return None
+        return time.monotonic() - self.last_success
+
+    # --- background sync ---
+
+    async def start(self):
+        """Start the periodic sync loop (called from the app startup hook)"""
+        if self.sync_task is None:
+            self.sync_task = asyncio.create_task(self._sync_loop())
+
+    async def stop(self):
+        """Stop the sync loop (called from the app shutdown hook)"""
+        if self.sync_task is not None:
+            self.sync_task.cancel()
+            try:
+                await self.sync_task
+            except asyncio.CancelledError:
+                pass
+            self.sync_task = None
+
+    async def _sync_loop(self):
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                self.consecutive_failures += 1
+                self.last_error = str(e)
+                print(f"Catalog sync failed ({self.consecutive_failures} in a row): {e}")
+            await asyncio.sleep(self.sync_interval)
+
+    async def fetch_page(self, page: int):
+        """
+        Fetch one page, conditional on the validators from the last sync.
+        Returns the page entry and whether it changed; an unchanged page reuses the stored items.
+        """
+        headers = {}
+        previous = self.pages.get(page)
+        if previous is not None:
+            etag, last_modified, _, _ = previous
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        async def fetch(headers: dict):
+            return await carbonmark_client.get(
+                f"{CARBONMARK_V17_API_URL}/carbonProjects",
+                params={"limit": self.page_size, "page": page, "minSupply": 1},
+                headers=headers or None
+            )
+
+        response = await fetch(headers)
+        if response.status_code == 304:
+            if previous is not None:
+                return previous, False
+            # Nothing stored to reuse (e.g. an intermediary cache answered) - fetch the page unconditionally
+            response = await fetch({})
+
+        response.raise_for_status()
+        data = response.json()
+        page_items = data.get("items", []) if isinstance(data, dict) else data
+        total = data.get("itemsCount") if isinstance(data, dict) else None
+        return (response.headers.get("ETag"), response.headers.get("Last-Modified"), page_items, total), True
+
+    async def fetch_all_projects(self) -> Tuple[List[dict], bool]:
+        """Page through carbonProjects; returns every listed project and whether any page changed"""
+        items: List[dict] = []
+        seen_keys = set()
+        pages = {}
+        page = 0
+        changed = False
+        self.last_sync_pages_fetched = 0
+        self.last_sync_pages_unchanged = 0
+        while True:
+            pages[page], page_changed = await self.fetch_page(page)
+            _, _, page_items, total = pages[page]
+            changed = changed or page_changed
+            if page_changed:
+                self.last_sync_pages_fetched += 1
+            else:
+                self.last_sync_pages_unchanged += 1
+
+            new_items = [item for item in page_items if item.get("key") not in seen_keys]
+            seen_keys.update(item.get("key") for item in new_items)
+            items.extend(new_items)
+
+            # Stop on a short page, once itemsCount is reached, or if paging stopped advancing
+            if len(page_items) < self.page_size or not new_items or (total is not None and len(items) >= total):
+                # A catalog that lost pages has changed even if every remaining page is a 304
+                changed = changed or any(number not in pages for number in self.pages)
+                # Validators are only kept once every page was read, so a failed sync is retried in full
+                self.pages = pages
+                return items, changed
+            page += 1
+
+    async def sync(self):
+        """Fetch the pages that changed since the last sync and apply the delta to the local indexes"""
+        started = time.monotonic()
+        upstream, changed = await self.fetch_all_projects()
+
+        if changed or not self.loaded:
+            changes = self._apply(upstream)
+        else:
+            changes = 0
+
+        self.loaded = True
+        self.last_synced_at = time.time()
+        self.last_success = time.monotonic()
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.last_sync_duration = time.monotonic() - started
+        self.last_sync_changes = changes
+        print(f"Catalog synced: {len(self.projects)} projects, {changes} changed, "
+              f"{self.last_sync_pages_unchanged} pages unchanged in {self.last_sync_duration:.2f}s")
+
+    def _apply(self, upstream: List[dict]) -> int:
+        """Re-index projects whose updatedAt changed and drop the ones no longer listed"""
+        changes = 0
+        seen = set()
+        for project in upstream:
+            key = project.get("key")
+            if not key:
+                continue
+            seen.add(key)
+
+            existing = self.projects.get(key)
+            if existing is not None:
+                updated_at = project.get("updatedAt")
+                if updated_at is not None and updated_at == existing.get("updatedAt"):
+                    continue
+                self._unindex(key, existing)
+
+            self.projects[key] = project
+            self._index(key, project)
+            changes += 1
+
+        # Projects that sold out or were delisted upstream
+        for key in [key for key in self.projects if key not in seen]:
+            self._unindex(key, self.projects.pop(key))
+            changes += 1
+
+        if changes or not self.loaded:
+            ordered = sorted(self.projects, key=lambda k: (self.projects[k].get("name") or "").lower())
+            self.name_rank = {key: rank for rank, key in enumerate(ordered)}
+        return changes
+
+    # --- index maintenance ---
+
+    @staticmethod
+    def _facets(project: dict):
+        country = (project.get("country") or "").lower()
+        categories = {
+            (methodology.get("category") or "").lower()
+            for methodology in project.get("methodologies") or []
+            if isinstance(methodology, dict) and methodology.get("category")
+        }
+        registry = (project.get("registry") or "").lower()
+        return country, categories, registry
+
+    @staticmethod
+    def _prefixes(project: dict) -> Set[str]:
+        prefixes = set()
+        for token in name_tokens(project.get("name")):
+            for length in range(1, min(len(token), MAX_PREFIX_LENGTH) + 1):
+                prefixes.add(token[:length])
+        return prefixes
+
+    def _index(self, key: str, project: dict):
+        country, categories, registry = self._facets(project)
+        if country:
+            self.by_country[country].add(key)
+        for category in categories:
+            self.by_category[category].add(key)
+        if registry:
+            self.by_registry[registry].add(key)
+        for prefix in self._prefixes(project):
+            self.by_name_prefix[prefix].add(key)
+
+    def _unindex(self, key: str, project: dict):
+        country, categories, registry = self._facets(project)
+        self._discard(self.by_country, country, key)
+        for category in categories:
+            self._discard(self.by_category, category, key)
+        self._discard(self.by_registry, registry, key)
+        for prefix in self._prefixes(project):
+            self._discard(self.by_name_prefix, prefix, key)
+
+    @staticmethod
+    def _discard(index: Dict[str, Set[str]], value: str, key: str):
+        keys = index.get(value)
+        if keys is None:
+            return
+        keys.discard(key)
+        if not keys:
+            del index[value]
+
+    # --- queries ---
+
+    def _match_name(self, name: str) -> Set[str]:
+        matches: Optional[Set[str]] = None
+        for token in name_tokens(name):
+            keys = self.by_name_prefix.get(token[:MAX_PREFIX_LENGTH], set())
+            if len(token) > MAX_PREFIX_LENGTH:
+                keys = {
+                    key for key in keys
+                    if any(word.startswith(token) for word in name_tokens(self.projects[key].get("name")))
+                }
+            matches = keys if matches is None else matches & keys
+            if not matches:
+                return set()
+        return matches if matches is not None else set(self.projects)
+
+    def search(
+        self,
+        country: Optional[str] = None,
+        category: Optional[str] = None,
+        registry: Optional[str] = None,
+        name: Optional[str] = None,
+        page: int = 1,
+        limit: int = 100
+    ) -> dict:
+        """Filter by facets and name prefix, returning one page plus facet counts"""
+        candidate_sets = []
+        if country:
+            candidate_sets.append(self.by_country.get(country.lower(), set()))
+        if category:
+            candidate_sets.append(self.by_category.get(category.lower(), set()))
+        if registry:
+            candidate_sets.append(self.by_registry.get(registry.lower(), set()))
+        if name and name.strip():
+            candidate_sets.append(self._match_name(name))
+
+        if candidate_sets:
+            # Intersect starting from the smallest set
+            candidate_sets.sort(key=len)
+            matches = set(candidate_sets[0])
+            for keys in candidate_sets[1:]:
+                matches &= keys
+        else:
+            matches = set(self.projects)
+
+        ordered = sorted(matches, key=lambda key: self.name_rank.get(key, 0))
+        start = (page - 1) * limit
+        items = [self.projects[key] for key in ordered[start:start + limit]]
+
+        return {
+            "items": items,
+            "itemsCount": len(ordered),
+            "page": page,
+            "limit": limit,
+            "facets": self.facet_counts(matches)
+        }
+
+    def facet_counts(self, keys: Set[str]) -> dict:
+        countries: Dict[str, int] = defaultdict(int)
+        categories: Dict[str, int] = defaultdict(int)
+        registries: Dict[str, int] = defaultdict(int)
+        for key in keys:
+            project = self.projects[key]
+            if project.get("country"):
+                countries[project["country"]] += 1
+            for category in {
+                methodology.get("category")
+                for methodology in project.get("methodologies") or []
+                if isinstance(methodology, dict) and methodology.get("category")
+            }:
+                categories[category] += 1
+            if project.get("registry"):
+                registries[project["registry"]] += 1
+        return {
+            "country": dict(countries),
+            "category": dict(categories),
+            "registry": dict(registries)
+        }
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "loaded": self.loaded,
+            "projects": len(self.projects),
+            "countries": len(self.by_country),
+            "categories": len(self.by_category),
+            "registries": len(self.by_registry),
+            "lastSyncedAt": self.last_synced_at,
+            "lastSyncDuration": self.last_sync_duration,
+            "lastSyncChanges": self.last_sync_changes,
+            "lastSyncPagesFetched": self.last_sync_pages_fetched,
+            "lastSyncPagesUnchanged": self.last_sync_pages_unchanged,
+            "staleness": self.staleness(),
+            "maxStaleness": self.max_staleness,
+            "consecutiveFailures": self.consecutive_failures,
+            "lastError": self.last_error
+        }
+
+
+# Global catalog instance
+project_catalog = ProjectCatalog()
@@ -1,9 +1,17 @@
 import os
+import json
+import asyncio
+import base64
+from datetime import datetime
+from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import MongoClient
+from pymongo import MongoClient, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
 from typing import Optional
 from dotenv import load_dotenv
 from .fallback_db import FallbackClient
+from .impact import impact_updates, project_retirement_updates, rebuild_pipeline, project_rebuild_pipeline
+from .rollups import RollupAccumulator, bucket_start, rollup_updates
 
 # Load environment variables
 load_dotenv()
@@ -18,6 +26,80 @@ db = Database()
 async def get_database():
     return db.database
 
+# Indexes the app relies on, created at connect time. Each entry is
+# (collection, keys, options); options are passed to create_index.
+INDEXES = [
+    # Signup/login and get_user_by_id look users up by email
+    ("users", [("email", 1)], {"name": "users_email_unique", "unique": True}),
+    # get_user_by_crypto_address; users without an address (e.g. dev users, which
+    # store wallet_address) are left out so they do not collide on null
+    ("users", [("address", 1)], {
+        "name": "users_address_unique", "unique": True,
+        "partialFilterExpression": {"address": {"$type": "string"}}
+    }),
+    # GET /orders/{user_id}: equality on user_id, keyset sort on (created_at, _id)
+    ("order_history", [("user_id", 1), ("created_at", -1), ("_id", -1)], {"name": "order_history_user_created"}),
+    # GET /orders/{order_id}/blockchain; not unique, failed upstream responses record "unknown"
+    ("order_history", [("order_id", 1)], {"name": "order_history_order_id"}),
+    # Blockchain job worker: due jobs by status and next attempt time
+    ("order_history", [("blockchain_status", 1), ("blockchain_next_attempt_at", 1)],
+     {"name": "order_history_blockchain_due"}),
+    # Rollup backfill streams orders by time
+    ("order_history", [("created_at", 1)], {"name": "order_history_created_at"}),
+    # GET /rollups, for one key or every key of a dimension
+    ("order_rollups", [("granularity", 1), ("dimension", 1), ("key", 1), ("bucket_start", 1)],
+     {"name": "order_rollups_key_start"}),
+    ("order_rollups", [("granularity", 1), ("dimension", 1), ("bucket_start", 1)],
+     {"name": "order_rollups_start"}),
+    # Shared quote store (QUOTE_BACKEND=mongo): Mongo's TTL monitor deletes quotes once expiresAt has passed
+    ("quotes", [("expiresAt", 1)], {"name": "quotes_expiresAt_ttl", "expireAfterSeconds": 0}),
+]
+
+async def ensure_indexes():
+    """Create every index in INDEXES; a failing index is logged and does not stop startup"""
+    database = await get_database()
+    created = 0
+    for collection, keys, options in INDEXES:
+        try:
+            await database.get_collection(collection).create_index(keys, **options)
+            created += 1
+        except Exception as e:
+            # e.g. duplicate emails already stored, or the same keys under another name
+            print(f"WARNING: Could not create index {options['name']} on {collection}: {e}")
+    print(f"Ensured {created}/{len(INDEXES)} database indexes")
+
+async def index_usage_report():
+    """
+    Per collection, how often each index has been used since the server started
+    ($indexStats), and which registry indexes are missing.
+    """
+    database = await get_database()
+    if db.is_fallback:
+        return {"available": False, "reason": "in-memory fallback database has no index statistics"}
+
+    report = {"available": True, "collections": {}}
+    for collection in sorted({collection for collection, _, _ in INDEXES}):
+        expected = [options["name"] for name, _, options in INDEXES if name == collection]
+        try:
+            stats = await database.get_collection(collection).aggregate([{"$indexStats": {}}]).to_list(length=None)
+        except Exception as e:
+            report["collections"][collection] = {"error": str(e)}
+            continue
+        indexes = {
+            stat["name"]: {
+                "key": dict(stat["key"]),
+                "ops": stat.get("accesses", {}).get("ops", 0),
+                "since": stat.get("accesses", {}).get("since")
+            }
+            for stat in stats
+        }
+        report["collections"][collection] = {
+            "indexes": indexes,
+            "missing": [name for name in expected if name not in indexes],
+            "unused": [name for name in expected if name in indexes and indexes[name]["ops"] == 0]
+        }
+    return report
+
 async def connect_to_mongo():
     """Create database connection - tries MongoDB Atlas first, falls back to in-memory"""
     # Use MONGODB_CONNECTION_STRING for Atlas connection
@@ -34,6 +116,7 @@ async def connect_to_mongo():
             await db.client.admin.command('ping')
             print("SUCCESS: Connected to MongoDB Atlas successfully!")
             db.is_fallback = False
+            await ensure_indexes()
             return
 
         except Exception as e:
@@ -68,6 +151,7 @@ async def save_order_to_history(order_data: dict):
         # Insert the order record
         result = await orders_collection.insert_one(order_data)
         print(f"Order saved to history with ID: {result.inserted_id}")
+        await update_order_summaries([order_data])
         return str(result.inserted_id)
         
     except Exception as e:
@@ -75,21 +159,211 @@ async def save_order_to_history(order_data: dict):
         # Don't fail the order if we can't save to history
         return None
 
-async def get_user_orders(user_id: str):
-    """Get all orders for a specific user"""
+async def save_orders_to_history(orders: list):
+    """Save many completed orders with one insert; returns how many were written"""
+    if not orders:
+        return 0
     try:
         database = await get_database()
-        orders_collection = database.order_history
-        
-        # Find all orders for this user, sorted by creation date (newest first)
-        cursor = orders_collection.find({"user_id": user_id}).sort("created_at", -1)
-        orders = await cursor.to_list(length=None)
-        
-        return orders
-        
+        result = await database.order_history.insert_many(orders, ordered=False)
+        print(f"Saved {len(result.inserted_ids)} orders to history")
+        await update_order_summaries(orders)
+        return len(result.inserted_ids)
+
+    except BulkWriteError as e:
+        # Unordered: every order except the failed ones was inserted, so count those
+        failed = {error["index"] for error in e.details.get("writeErrors", [])}
+        inserted = [order for index, order in enumerate(orders) if index not in failed]
+        print(f"Saved {len(inserted)} of {len(orders)} orders to history: {len(failed)} failed")
+        await update_order_summaries(inserted)
+        return len(inserted)
+
+    except Exception as e:
+        print(f"Error saving orders to history: {e}")
+        return 0
+
+async def _apply_summary_updates(collection, updates: dict):
+    """Upsert a batch of counter updates (keyed by _id) in one unordered bulk write"""
+    if not updates:
+        return
+    try:
+        await collection.bulk_write(
+            [UpdateOne({"_id": key}, update, upsert=True) for key, update in updates.items()],
+            ordered=False
+        )
     except Exception as e:
-        print(f"Error fetching user orders: {e}")
-        return []
+        print(f"Error updating {collection.name} (run rebuild_order_summaries.py to repair): {e}")
+
+async def update_order_summaries(orders: list):
+    """
+    Add saved orders to the user_impact and project_retirements counters and
+    the order_rollups buckets with atomic $inc upserts: one bulk write per
+    collection, the three sent concurrently. A failure is logged and leaves the
+    orders saved; rebuild_order_summaries.py recomputes the summaries from
+    order_history.
+    """
+    database = await get_database()
+    await asyncio.gather(
+        _apply_summary_updates(database.user_impact, impact_updates(orders)),
+        _apply_summary_updates(database.project_retirements, project_retirement_updates(orders)),
+        _apply_summary_updates(database.order_rollups, rollup_updates(orders))
+    )
+
+async def get_user_impact(user_id: str):
+    """user_impact summary document of a user, or None if they have no orders"""
+    database = await get_database()
+    return await database.user_impact.find_one({"_id": user_id})
+
+async def get_project_retirements(project_ids: list) -> dict:
+    """project_retirements counters of many projects with one _id lookup, keyed by project ID"""
+    database = await get_database()
+    cursor = database.project_retirements.find({"_id": {"$in": project_ids}})
+    return {counters["_id"]: counters async for counters in cursor}
+
+async def _rebuild_summaries(collection_name: str, pipeline: list, only_id: Optional[str] = None) -> int:
+    """
+    Replace the documents of a counters collection with the results of an
+    aggregation over order_history, for every _id or only only_id. Documents
+    the aggregation no longer produces (no orders left) are deleted. Orders
+    saved while it runs can be counted twice or missed, so run it when
+    purchases are quiet.
+    """
+    database = await get_database()
+    collection = database.get_collection(collection_name)
+    rebuilt = 0
+    now = datetime.utcnow()
+    async for summary in database.order_history.aggregate(pipeline, allowDiskUse=True):
+        summary["updated_at"] = now
+        await collection.replace_one({"_id": summary["_id"]}, summary, upsert=True)
+        rebuilt += 1
+
+    deleted = 0
+    if only_id:
+        if not rebuilt:
+            deleted = (await collection.delete_one({"_id": only_id})).deleted_count
+    else:
+        # Everything rebuilt carries updated_at = now; older documents had no orders behind them
+        deleted = (await collection.delete_many({"updated_at": {"$lt": now}})).deleted_count
+    print(f"Rebuilt {rebuilt} {collection_name} documents, deleted {deleted} without orders")
+    return rebuilt
+
+async def rebuild_user_impact(user_id: Optional[str] = None) -> int:
+    """Recompute user_impact from order_history, for one user or all of them"""
+    return await _rebuild_summaries("user_impact", rebuild_pipeline(user_id), user_id)
+
+async def rebuild_project_retirements(project_id: Optional[str] = None) -> int:
+    """Recompute project_retirements from order_history, for one project or all of them"""
+    return await _rebuild_summaries("project_retirements", project_rebuild_pipeline(project_id), project_id)
+
+async def backfill_order_rollups(since: Optional[datetime] = None, batch_size: int = 1000) -> int:
+    """
+    Rebuild order_rollups from order_history, streaming orders in created_at
+    order in cursor batches. Buckets in the rebuilt range are deleted first so
+    buckets with no orders left do not survive; each day's buckets are then
+    written as soon as the stream moves past that day, so memory holds one
+    batch of orders and one day of buckets. Pass since to rebuild only the
+    days from then on. Returns how many orders were read.
+
+    Only days before today are rebuilt: orders being saved now $inc today's
+    buckets, and a replace from the stream would overwrite those increments.
+    """
+    database = await get_database()
+    rollups = database.order_rollups
+    # Always start on a day boundary so the first day is rebuilt whole
+    day = bucket_start(since, "day") if since else None
+    today = bucket_start(datetime.utcnow(), "day")
+    days = {"$gte": day, "$lt": today} if day else {"$lt": today}
+    query = {"created_at": days}
+    deleted = await rollups.delete_many({"bucket_start": days})
+
+    cursor = database.order_history.find(
+        query, {"created_at": 1, "project_id": 1, "project_registry": 1, "quantity": 1, "total_cost": 1}
+    ).sort("created_at", 1).batch_size(batch_size)
+
+    async def write(documents: list) -> int:
+        if documents:
+            await rollups.bulk_write(
+                [ReplaceOne({"_id": document["_id"]}, document, upsert=True) for document in documents],
+                ordered=False
+            )
+        return len(documents)
+
+    accumulator = RollupAccumulator()
+    written = 0
+    async for order in cursor:
+        written += await write(accumulator.add(order))
+    written += await write(accumulator.flush())
+
+    print(f"Backfilled {written} order rollup buckets from {accumulator.orders} orders "
+          f"(replaced {deleted.deleted_count})")
+    return accumulator.orders
+
+async def get_order_rollups(granularity: str, dimension: str, start: datetime, end: datetime,
+                            key: Optional[str] = None, limit: int = 500) -> list:
+    """Rollup buckets starting in [start, end), oldest first, at most limit of them"""
+    database = await get_database()
+    query = {
+        "granularity": granularity,
+        "dimension": dimension,
+        "bucket_start": {"$gte": start, "$lt": end}
+    }
+    if key:
+        query["key"] = key
+    return await database.order_rollups.find(query).sort(
+        [("bucket_start", 1), ("key", 1)]
+    ).limit(limit).to_list(length=limit)
+
+# Raw upstream payloads are only returned when asked for
+ORDER_SUMMARY_PROJECTION = {"carbonmark_response": 0}
+
+def encode_order_cursor(order: dict) -> str:
+    """Opaque page cursor for the (created_at, _id) position of an order"""
+    position = {"created_at": order["created_at"].isoformat(), "_id": str(order["_id"])}
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+def decode_order_cursor(cursor: str):
+    """(created_at, _id) from a page cursor; raises ValueError if it is malformed"""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = datetime.fromisoformat(position["created_at"])
+        order_id = position["_id"]
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    # Atlas assigns ObjectIds, the fallback database uuid strings
+    return created_at, ObjectId(order_id) if ObjectId.is_valid(order_id) else order_id
+
+async def get_user_orders(user_id: str, limit: int, cursor: Optional[str] = None,
+                          include_carbonmark_response: bool = False):
+    """
+    Cursor over one page of a user's orders, newest first.
+
+    Pages are keyed on (created_at, _id) rather than skipped over, so every page
+    costs the same however deep into the history it is. One extra order is
+    read to tell whether there is a next page.
+    """
+    query = {"user_id": user_id}
+    if cursor:
+        created_at, order_id = decode_order_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": order_id}}
+        ]
+    projection = None if include_carbonmark_response else ORDER_SUMMARY_PROJECTION
+
+    database = await get_database()
+    return database.order_history.find(query, projection).sort(
+        [("created_at", -1), ("_id", -1)]
+    ).limit(limit + 1)
+
+async def get_order_by_order_id(order_id: str):
+    """Get a single order history record by its Carbonmark order ID"""
+    try:
+        database = await get_database()
+        return await database.order_history.find_one({"order_id": order_id})
+
+    except Exception as e:
+        print(f"Error fetching order {order_id}: {e}")
+        return None
 
 async def get_user_by_id(user_id: str):
     """Get user details by user ID"""
@@ -97,13 +371,13 @@ async def get_user_by_id(user_id: str):
         database = await get_database()
         users_collection = database.users
         
-        # Find user by ID or email (since userId could be either)
-        user = await users_collection.find_one({
-            "$or": [
-                {"_id": user_id},
-                {"email": user_id}
-            ]
-        })
+        # userId may be an email or a user _id; look up exactly one of them so
+        # the query uses the email index or the _id index instead of an $or
+        if "@" in user_id:
+            user = await users_collection.find_one({"email": user_id})
+        else:
+            # Atlas assigns ObjectIds, the fallback database uuid strings
+            user = await users_collection.find_one({"_id": ObjectId(user_id) if ObjectId.is_valid(user_id) else user_id})
         if user is None:
             print(f"Could not find user: {user_id}")
             return None
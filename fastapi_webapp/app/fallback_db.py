@@ -6,6 +6,7 @@ import json
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 import uuid
+from pymongo import UpdateOne, ReplaceOne
 
 class FallbackDatabase:
     def __init__(self):
@@ -16,6 +17,111 @@ class FallbackDatabase:
             self.collections[name] = FallbackCollection(name)
         return self.collections[name]
 
+    def __getattr__(self, name: str):
+        # Attribute access (database.order_history) like Motor
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.get_collection(name)
+
+class FallbackCursor:
+    """Just enough of a Motor cursor for find().sort().limit().to_list() and async for"""
+
+    def __init__(self, documents: List[Dict[str, Any]]):
+        self.documents = documents
+        self.limit_count = 0
+
+    def sort(self, key, direction: int = 1):
+        # sort("field", -1) or sort([("field", -1), ("_id", -1)])
+        keys = key if isinstance(key, list) else [(key, direction)]
+        # Stable sorts, least significant key first
+        for field, field_direction in reversed(keys):
+            self.documents.sort(key=lambda doc: _sort_key(doc.get(field)), reverse=field_direction < 0)
+        return self
+
+    def batch_size(self, count: int):
+        # Everything is already in memory
+        return self
+
+    def limit(self, count: int):
+        self.limit_count = count
+        return self
+
+    async def to_list(self, length: Optional[int] = None):
+        documents = self.documents[:self.limit_count] if self.limit_count else self.documents
+        return documents[:length] if length else list(documents)
+
+    async def __aiter__(self):
+        for document in await self.to_list():
+            yield document
+
+def _apply_update(document: Dict[str, Any], update_dict: Dict[str, Any], inserting: bool):
+    """Apply $set/$setOnInsert/$inc/$min/$max (or a plain field dict) to a document in place"""
+    if not any(key.startswith("$") for key in update_dict):
+        document.update(update_dict)
+        return
+    for op, fields in update_dict.items():
+        for key, value in fields.items():
+            current = document.get(key)
+            if op == "$set":
+                document[key] = value
+            elif op == "$setOnInsert":
+                if inserting:
+                    document[key] = value
+            elif op == "$inc":
+                document[key] = (current or 0) + value
+            elif op == "$min":
+                if current is None or value < current:
+                    document[key] = value
+            elif op == "$max":
+                if current is None or value > current:
+                    document[key] = value
+            else:
+                raise ValueError(f"Unsupported update operator in fallback database: {op}")
+
+def _expression(document: Dict[str, Any], expression):
+    """Value of a "$field" reference (or a literal) for a document"""
+    if isinstance(expression, str) and expression.startswith("$"):
+        return document.get(expression[1:])
+    if isinstance(expression, dict):
+        return {key: _expression(document, value) for key, value in expression.items()}
+    return expression
+
+def _group(documents: List[Dict[str, Any]], spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    groups: Dict[str, Dict[str, Any]] = {}
+    for document in documents:
+        group_id = _expression(document, spec["_id"])
+        group_key = json.dumps(group_id, sort_keys=True, default=str)
+        group = groups.setdefault(group_key, {"_id": group_id})
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            (op, expression), = accumulator.items()
+            value = _expression(document, expression)
+            current = group.get(field)
+            if op == "$sum":
+                group[field] = (current or 0) + (value if isinstance(value, (int, float)) else 0)
+            elif op == "$min":
+                if value is not None and (current is None or value < current):
+                    group[field] = value
+            elif op == "$max":
+                if value is not None and (current is None or value > current):
+                    group[field] = value
+            else:
+                raise ValueError(f"Unsupported accumulator in fallback database: {op}")
+    return list(groups.values())
+
+def _sort_key(value):
+    # None sorts first, as in MongoDB
+    return (value is not None, value)
+
+def _project(document: Dict[str, Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Copy of a document with a MongoDB-style projection ({field: 0} or {field: 1}) applied"""
+    if not projection:
+        return document.copy()
+    if any(projection.values()):
+        return {key: value for key, value in document.items() if projection.get(key, key == "_id")}
+    return {key: value for key, value in document.items() if key not in projection}
+
 class FallbackCollection:
     def __init__(self, name: str):
         self.name = name
@@ -35,33 +141,106 @@ class FallbackCollection:
 
         return InsertResult(document["_id"])
 
+    async def insert_many(self, documents: List[Dict[str, Any]], ordered: bool = True):
+        inserted_ids = []
+        for document in documents:
+            result = await self.insert_one(document)
+            inserted_ids.append(result.inserted_id)
+
+        class InsertManyResult:
+            def __init__(self, inserted_ids):
+                self.inserted_ids = inserted_ids
+
+        return InsertManyResult(inserted_ids)
+
+    def find(self, filter_dict: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None):
+        filter_dict = filter_dict or {}
+        return FallbackCursor([
+            _project(doc, projection) for doc in self.documents if self._matches_filter(doc, filter_dict)
+        ])
+
     async def find_one(self, filter_dict: Dict[str, Any]):
         for doc in self.documents:
             if self._matches_filter(doc, filter_dict):
                 return doc.copy()
         return None
 
-    async def update_one(self, filter_dict: Dict[str, Any], update_dict: Dict[str, Any]):
+    async def update_one(self, filter_dict: Dict[str, Any], update_dict: Dict[str, Any], upsert: bool = False):
+        class UpdateResult:
+            def __init__(self, matched_count, upserted_id=None):
+                self.matched_count = matched_count
+                self.upserted_id = upserted_id
+
         for i, doc in enumerate(self.documents):
             if self._matches_filter(doc, filter_dict):
-                # Handle $set operations
-                if "$set" in update_dict:
-                    doc.update(update_dict["$set"])
-                else:
-                    doc.update(update_dict)
+                _apply_update(doc, update_dict, inserting=False)
+                return UpdateResult(1)
 
-                class UpdateResult:
-                    def __init__(self, matched_count):
-                        self.matched_count = matched_count
+        if upsert:
+            # New document from the equality fields of the filter, then the update
+            doc = {key: value for key, value in filter_dict.items()
+                   if not key.startswith("$") and not isinstance(value, dict)}
+            _apply_update(doc, update_dict, inserting=True)
+            result = await self.insert_one(doc)
+            return UpdateResult(0, result.inserted_id)
 
-                return UpdateResult(1)
+        return UpdateResult(0)
 
+    async def replace_one(self, filter_dict: Dict[str, Any], replacement: Dict[str, Any], upsert: bool = False):
         class UpdateResult:
-            def __init__(self, matched_count):
+            def __init__(self, matched_count, upserted_id=None):
                 self.matched_count = matched_count
+                self.upserted_id = upserted_id
+
+        for i, doc in enumerate(self.documents):
+            if self._matches_filter(doc, filter_dict):
+                self.documents[i] = {**replacement, "_id": doc["_id"]}
+                return UpdateResult(1)
+
+        if upsert:
+            doc = dict(replacement)
+            if "_id" in filter_dict and "_id" not in doc:
+                doc["_id"] = filter_dict["_id"]
+            result = await self.insert_one(doc)
+            return UpdateResult(0, result.inserted_id)
 
         return UpdateResult(0)
 
+    async def bulk_write(self, requests: List[Any], ordered: bool = True):
+        """UpdateOne and ReplaceOne requests, applied one by one"""
+        class BulkWriteResult:
+            def __init__(self, matched_count, upserted_count):
+                self.matched_count = matched_count
+                self.upserted_count = upserted_count
+
+        matched = upserted = 0
+        for request in requests:
+            if isinstance(request, UpdateOne):
+                result = await self.update_one(request._filter, request._doc, upsert=request._upsert)
+            elif isinstance(request, ReplaceOne):
+                result = await self.replace_one(request._filter, request._doc, upsert=request._upsert)
+            else:
+                raise ValueError(f"Unsupported bulk write request in fallback database: {type(request).__name__}")
+            matched += result.matched_count
+            upserted += result.upserted_id is not None
+        return BulkWriteResult(matched, upserted)
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], **kwargs):
+        """$match, $group ($sum, $min, $max) and $sort stages"""
+        documents = [doc.copy() for doc in self.documents]
+        for stage in pipeline:
+            (op, arg), = stage.items()
+            if op == "$match":
+                documents = [doc for doc in documents if self._matches_filter(doc, arg)]
+            elif op == "$group":
+                documents = _group(documents, arg)
+            elif op == "$sort":
+                cursor = FallbackCursor(documents).sort(list(arg.items()))
+                documents = cursor.documents
+            else:
+                raise ValueError(f"Unsupported aggregation stage in fallback database: {op}")
+        return FallbackCursor(documents)
+
     async def delete_one(self, filter_dict: Dict[str, Any]):
         for i, doc in enumerate(self.documents):
             if self._matches_filter(doc, filter_dict):
@@ -79,12 +258,51 @@ class FallbackCollection:
 
         return DeleteResult(0)
 
+    async def delete_many(self, filter_dict: Dict[str, Any]):
+        class DeleteResult:
+            def __init__(self, deleted_count):
+                self.deleted_count = deleted_count
+
+        kept = [doc for doc in self.documents if not self._matches_filter(doc, filter_dict)]
+        deleted = len(self.documents) - len(kept)
+        self.documents = kept
+        return DeleteResult(deleted)
+
     def _matches_filter(self, document: Dict[str, Any], filter_dict: Dict[str, Any]) -> bool:
         for key, value in filter_dict.items():
-            if key not in document or document[key] != value:
+            if key == "$or":
+                if not any(self._matches_filter(document, clause) for clause in value):
+                    return False
+            elif isinstance(value, dict) and value and all(op.startswith("$") for op in value):
+                if not all(self._matches_operator(document.get(key), op, arg) for op, arg in value.items()):
+                    return False
+            elif key not in document or document[key] != value:
                 return False
         return True
 
+    @staticmethod
+    def _matches_operator(field, op: str, arg) -> bool:
+        """Comparison operators used by the app ($in, $lt, $ne, ...)"""
+        if op == "$in":
+            return field in arg
+        if op == "$nin":
+            return field not in arg
+        if op == "$ne":
+            return field != arg
+        if op == "$exists":
+            return (field is not None) == bool(arg)
+        if field is None:
+            return False
+        if op == "$lt":
+            return field < arg
+        if op == "$lte":
+            return field <= arg
+        if op == "$gt":
+            return field > arg
+        if op == "$gte":
+            return field >= arg
+        raise ValueError(f"Unsupported operator in fallback database: {op}")
+
 # Global fallback database instance
 fallback_db = FallbackDatabase()
 
@@ -0,0 +1,111 @@
+"""
+Running totals of orders placed, tonnes retired and dollars spent, per user
+(user_impact) and per project (project_retirements).
+
+Both collections hold one document per user or project (_id = user_id or
+project_id). They are updated with $inc whenever orders are written to
+order_history, so reading them is a primary-key lookup however long the
+history is. The same numbers can be recomputed from order_history with the
+rebuild pipelines to repair drift, e.g. after a counter update failed.
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+
+def _summary_updates(orders: Iterable[dict], key: str, now: datetime) -> Dict[str, dict]:
+    """One $inc/$min/$max upsert update per distinct value of key; orders without it are skipped"""
+    totals: Dict[str, dict] = {}
+    for order in orders:
+        group = order.get(key)
+        if not group:
+            continue
+        created_at = order.get("created_at") or now
+        total = totals.setdefault(group, {
+            "order_count": 0, "tonnes_retired": 0.0, "total_spent": 0.0,
+            "first_order_at": created_at, "last_order_at": created_at
+        })
+        total["order_count"] += 1
+        total["tonnes_retired"] += float(order.get("quantity") or 0)
+        total["total_spent"] += float(order.get("total_cost") or 0)
+        total["first_order_at"] = min(total["first_order_at"], created_at)
+        total["last_order_at"] = max(total["last_order_at"], created_at)
+
+    return {
+        group: {
+            "$inc": {
+                "order_count": total["order_count"],
+                "tonnes_retired": total["tonnes_retired"],
+                "total_spent": total["total_spent"]
+            },
+            "$min": {"first_order_at": total["first_order_at"]},
+            "$max": {"last_order_at": total["last_order_at"]},
+            "$set": {"updated_at": now}
+        }
+        for group, total in totals.items()
+    }
+
+
+def impact_updates(orders: Iterable[dict], now: Optional[datetime] = None) -> Dict[str, dict]:
+    """One upsert update per user for a batch of saved orders"""
+    return _summary_updates(orders, "user_id", now or datetime.utcnow())
+
+
+def project_retirement_updates(orders: Iterable[dict], now: Optional[datetime] = None) -> Dict[str, dict]:
+    """One upsert update per project for a batch of saved orders"""
+    return _summary_updates(orders, "project_id", now or datetime.utcnow())
+
+
+def _rebuild_pipeline(key: str, value: Optional[str]) -> List[dict]:
+    match = {key: value} if value else {key: {"$ne": None}}
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": f"${key}",
+            "order_count": {"$sum": 1},
+            "tonnes_retired": {"$sum": "$quantity"},
+            "total_spent": {"$sum": "$total_cost"},
+            "first_order_at": {"$min": "$created_at"},
+            "last_order_at": {"$max": "$created_at"}
+        }}
+    ]
+
+
+def rebuild_pipeline(user_id: Optional[str] = None) -> List[dict]:
+    """Aggregation over order_history producing user_impact documents (one per user)"""
+    return _rebuild_pipeline("user_id", user_id)
+
+
+def project_rebuild_pipeline(project_id: Optional[str] = None) -> List[dict]:
+    """Aggregation over order_history producing project_retirements documents (one per project)"""
+    return _rebuild_pipeline("project_id", project_id)
+
+
+def impact_view(user_id: str, summary: Optional[dict]) -> dict:
+    """API view of a user_impact document; users without orders get zeros"""
+    def iso(value):
+        return value.isoformat() if hasattr(value, "isoformat") else value
+
+    summary = summary or {}
+    return {
+        "userId": user_id,
+        "orderCount": summary.get("order_count", 0),
+        "tonnesRetired": round(summary.get("tonnes_retired", 0.0), 6),
+        "totalSpent": round(summary.get("total_spent", 0.0), 2),
+        "firstOrderAt": iso(summary.get("first_order_at")),
+        "lastOrderAt": iso(summary.get("last_order_at")),
+        "updatedAt": iso(summary.get("updated_at"))
+    }
+
+
+def project_retirement_view(project_id: str, counters: Optional[dict]) -> dict:
+    """API view of a project_retirements document; projects never retired through us get zeros"""
+    counters = counters or {}
+    last_retired_at = counters.get("last_order_at")
+    return {
+        "projectId": project_id,
+        "retirementCount": counters.get("order_count", 0),
+        "tonnesRetired": round(counters.get("tonnes_retired", 0.0), 6),
+        "totalSpent": round(counters.get("total_spent", 0.0), 2),
+        "lastRetiredAt": last_retired_at.isoformat() if hasattr(last_retired_at, "isoformat") else last_retired_at
+    }
@@ -57,6 +57,8 @@ class AssetSource(BaseModel):
     assetPriceSourceId: Optional[str] = None
     listingId: Optional[str] = None
     pool: Optional[str] = None
+    # Smallest amount the listing will sell in one order, if it has a minimum lot
+    minQuantity: Optional[float] = None
 
 class SupplierSelection(BaseModel):
     selectedSources: list[AssetSource]
@@ -65,6 +67,34 @@ class SupplierSelection(BaseModel):
     canFulfillQuantity: bool
     costExceedsExpected: bool
 
+class BatchQuoteItem(BaseModel):
+    projectId: str
+    quantity: float
+    totalCost: float
+    projectName: Optional[str] = None
+
+class BatchQuoteRequest(BaseModel):
+    items: list[BatchQuoteItem]
+    # Optional lower cap on concurrent price fetches for this batch
+    maxConcurrency: Optional[int] = None
+
+class BulkRetirementItem(BaseModel):
+    projectId: str
+    quantity: float
+    certificateFirstName: str
+    certificateLastName: str
+    retirementMessage: str
+    totalCost: Optional[float] = None  # Most the buyer will pay; unset accepts the market price
+    projectName: Optional[str] = None
+    projectUrl: Optional[str] = None
+    projectRegistry: Optional[str] = None
+
+class BulkRetirementRequest(BaseModel):
+    items: list[BulkRetirementItem]
+    userId: Optional[str] = None
+    # Optional lower cap on concurrent orders for this request
+    maxConcurrency: Optional[int] = None
+
 class PurchaseRequest(BaseModel):
     # Retirement data
     quantity: float
@@ -135,13 +165,19 @@ class QuoteStorage(BaseModel):
     """Stored quote data for validation before order execution"""
     quoteId: str
     carbonmarkQuoteId: Optional[str] = None  # Store Carbonmark's quote UUID
+    carbonmarkQuoteStatus: Optional[str] = None  # pending/ready/failed while pre-warmed from /get_quote
+    retirementFingerprint: Optional[str] = None  # Retirement details the Carbonmark quote was created with
     projectId: str
     quantity: float
     selectedSources: list[AssetSource]
     totalCost: float
     createdAt: datetime
     expiresAt: datetime
-    status: str = "active"
+    status: str = "active"  # active -> reserved (order in flight) -> used, or unknown if the order may exist upstream
+    idempotencyKey: Optional[str] = None  # Key of the purchase holding or consuming this quote
+    reservedAt: Optional[datetime] = None  # Stale reservations can be reclaimed if no order was sent
+    orderSentAt: Optional[datetime] = None  # Set just before the order goes to Carbonmark
+    purchaseResponse: Optional[Dict[str, Any]] = None  # Replayed for repeated idempotency keys
 
 class PurchaseResponse(BaseModel):
     success: bool
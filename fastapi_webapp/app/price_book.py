@@ -0,0 +1,119 @@
+"""
+Compact in-memory price book for one project.
+
+Listings are held as parallel columns: NumPy arrays for the numbers the
+selection engine works on, and plain lists for the identifiers it only copies
+through. AssetSource models are created only for listings that end up in a
+quote, instead of one per listing per request.
+"""
+
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .models import AssetSource
+
+# One decoded listing, in column order:
+# (sourceId, purchasePrice, supply, poolName, assetPriceSourceId, listingId, pool, minQuantity)
+PriceRow = Tuple[str, float, float, Optional[str], Optional[str], Optional[str], Optional[str], Optional[float]]
+
+
+class PriceBook:
+    """Listings of one project as parallel columns; minQuantity is NaN where a listing has none"""
+
+    __slots__ = (
+        "source_ids", "pool_names", "asset_price_source_ids", "listing_ids", "pools",
+        "prices", "supplies", "min_quantities", "_positions"
+    )
+
+    def __init__(self, source_ids: Sequence[str], pool_names: Sequence[Optional[str]],
+                 asset_price_source_ids: Sequence[Optional[str]], listing_ids: Sequence[Optional[str]],
+                 pools: Sequence[Optional[str]], prices: np.ndarray, supplies: np.ndarray,
+                 min_quantities: np.ndarray):
+        self.source_ids = source_ids
+        self.pool_names = pool_names
+        self.asset_price_source_ids = asset_price_source_ids
+        self.listing_ids = listing_ids
+        self.pools = pools
+        self.prices = prices
+        self.supplies = supplies
+        self.min_quantities = min_quantities
+        # (sourceId, listingId, assetPriceSourceId, price) -> listing indices, built on first use
+        self._positions: Optional[Dict[tuple, List[int]]] = None
+
+    @classmethod
+    def from_rows(cls, rows: List[PriceRow]) -> "PriceBook":
+        """Build the columns from decoded listings, validating the numeric columns in bulk"""
+        if not rows:
+            return cls.empty()
+        source_ids, prices, supplies, pool_names, asset_ids, listing_ids, pools, mins = zip(*rows)
+
+        if not all(isinstance(source_id, str) for source_id in source_ids):
+            raise ValueError("Price listing without a source ID")
+        prices = np.array(prices, dtype=np.float64)
+        supplies = np.array(supplies, dtype=np.float64)
+        if np.isnan(prices).any() or np.isnan(supplies).any():
+            raise ValueError("Price listing without a price or supply")
+        # None becomes NaN, meaning "no minimum lot"
+        min_quantities = np.array(mins, dtype=np.float64)
+
+        return cls(source_ids, pool_names, asset_ids, listing_ids, pools, prices, supplies, min_quantities)
+
+    @classmethod
+    def from_sources(cls, sources: List[AssetSource]) -> "PriceBook":
+        return cls.from_rows([
+            (source.sourceId, source.purchasePrice, source.supply, source.poolName,
+             source.assetPriceSourceId, source.listingId, source.pool, source.minQuantity)
+            for source in sources
+        ])
+
+    @classmethod
+    def empty(cls) -> "PriceBook":
+        no_numbers = np.empty(0, dtype=np.float64)
+        return cls((), (), (), (), (), no_numbers, no_numbers, no_numbers)
+
+    def __len__(self) -> int:
+        return len(self.source_ids)
+
+    def min_quantity(self, index: int) -> Optional[float]:
+        value = float(self.min_quantities[index])
+        return None if math.isnan(value) else value
+
+    def materialize(self, index: int, supply: Optional[float] = None) -> AssetSource:
+        """AssetSource for one listing, optionally with the amount taken instead of its full supply"""
+        return AssetSource(
+            sourceId=self.source_ids[index],
+            purchasePrice=float(self.prices[index]),
+            supply=float(self.supplies[index]) if supply is None else supply,
+            poolName=self.pool_names[index],
+            assetPriceSourceId=self.asset_price_source_ids[index],
+            listingId=self.listing_ids[index],
+            pool=self.pools[index],
+            minQuantity=self.min_quantity(index)
+        )
+
+    def to_sources(self) -> List[AssetSource]:
+        return [self.materialize(index) for index in range(len(self))]
+
+    def positions(self, source: AssetSource) -> List[int]:
+        """Indices of the listings a selected source could have come from: same IDs and price"""
+        if self._positions is None:
+            positions: Dict[tuple, List[int]] = {}
+            for index, key in enumerate(zip(self.source_ids, self.listing_ids, self.asset_price_source_ids)):
+                positions.setdefault((*key, float(self.prices[index])), []).append(index)
+            self._positions = positions
+        return self._positions.get((source.sourceId, source.listingId, source.assetPriceSourceId, source.purchasePrice), [])
+
+    def with_supplies(self, supplies: np.ndarray) -> "PriceBook":
+        """Same listings with different supplies; identifier columns are shared, not copied"""
+        book = PriceBook(
+            self.source_ids, self.pool_names, self.asset_price_source_ids, self.listing_ids,
+            self.pools, self.prices, supplies, self.min_quantities
+        )
+        book._positions = self._positions
+        return book
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the numeric columns"""
+        return self.prices.nbytes + self.supplies.nbytes + self.min_quantities.nbytes
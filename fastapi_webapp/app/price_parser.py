@@ -0,0 +1,115 @@
+"""
+Parser for Carbonmark /prices responses.
+
+The endpoint has returned listings in a few shapes: a bare list, a dict with
+"sources" or "data", a single listing, and listings nested under "sources" in
+each item. Listings themselves use either the Carbonmark fields (sourceId,
+purchasePrice, supply) or the legacy ones (id, price, supply). The shape is
+detected once per response and the listing schema once per list; every
+listing is then decoded in one pass into a row tuple, and the rows become the
+columns of a PriceBook, whose numeric columns are validated in bulk.
+"""
+
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from .price_book import PriceBook, PriceRow
+
+
+def _is_carbonmark(item) -> bool:
+    return isinstance(item, dict) and "sourceId" in item and "purchasePrice" in item and "supply" in item
+
+
+def _is_legacy(item) -> bool:
+    return isinstance(item, dict) and "id" in item and "price" in item and "supply" in item
+
+
+def decode_carbonmark(item: dict) -> PriceRow:
+    """Carbonmark listing: sourceId, purchasePrice, supply"""
+    carbon_pool = item.get("carbonPool")
+    if isinstance(carbon_pool, dict) and "poolName" in carbon_pool:
+        pool_name = carbon_pool["poolName"]
+    else:
+        pool_name = item.get("poolName", "")
+    return (
+        item["sourceId"],
+        item["purchasePrice"],
+        item["supply"],
+        pool_name,
+        item.get("id") or item.get("assetPriceSourceId"),
+        item.get("listingId"),
+        item.get("pool") or pool_name,
+        item.get("minFillAmount") or None
+    )
+
+
+def decode_legacy(item: dict) -> PriceRow:
+    """Legacy listing: id, price, supply"""
+    return (
+        item["id"],
+        item["price"],
+        item["supply"],
+        item.get("poolName", item.get("pool", "")),
+        item["id"],
+        item.get("listingId"),
+        item.get("pool") or item.get("poolName", ""),
+        item.get("minFillAmount") or None
+    )
+
+
+def _decoder_for(item) -> Optional[Callable[[dict], PriceRow]]:
+    if _is_carbonmark(item):
+        return decode_carbonmark
+    if _is_legacy(item):
+        return decode_legacy
+    return None
+
+
+def decode_listings(items: Iterable, rows: List[PriceRow]):
+    """
+    Decode a list of listings, choosing the schema from the first listing.
+    Listings that do not fit it (mixed lists) are dispatched on their own.
+    """
+    decoder = None
+    for item in items:
+        if decoder is not None:
+            try:
+                rows.append(decoder(item))
+                continue
+            except (KeyError, TypeError):
+                pass
+        item_decoder = _decoder_for(item)
+        if item_decoder is not None:
+            decoder = item_decoder
+            rows.append(item_decoder(item))
+        elif isinstance(item, dict) and "sources" in item:
+            decode_listings(item.get("sources") or [], rows)
+
+
+def decode_response(prices_data) -> Tuple[str, List[PriceRow]]:
+    """Detect the response shape and decode its listings; returns (shape, rows)"""
+    rows: List[PriceRow] = []
+    if isinstance(prices_data, list):
+        decode_listings(prices_data, rows)
+        return "list", rows
+
+    if isinstance(prices_data, dict):
+        if "sources" in prices_data:
+            decode_listings(prices_data.get("sources") or [], rows)
+            return "sources", rows
+        decoder = _decoder_for(prices_data)
+        if decoder is not None:
+            rows.append(decoder(prices_data))
+            return "single", rows
+        if isinstance(prices_data.get("data"), list):
+            decode_listings(prices_data["data"], rows)
+            return "data", rows
+
+    return "unknown", rows
+
+
+def parse_price_response(prices_data) -> PriceBook:
+    """Parse a /prices response into a PriceBook"""
+    shape, rows = decode_response(prices_data)
+    price_book = PriceBook.from_rows(rows)
+    print(f"Parsed {len(price_book)} price listings ({shape} response)")
+    return price_book
@@ -0,0 +1,100 @@
+"""
+Phase timing for /purchase, optionally streamed to the client as server-sent events.
+
+A purchase moves through named phases (validate, reserve, carbonmark_quote,
+order, history). begin() closes the current phase and opens the next, so the
+purchase code only marks where each phase starts.
+EventStream carries the SSE events of /purchase/stream and /bulk_retire.
+"""
+
+import json
+import time
+import asyncio
+from typing import AsyncIterator, Dict, Optional
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class PurchaseProgress:
+    """Times the phases of one purchase and logs a per-phase summary"""
+
+    def __init__(self, quote_id: str):
+        self.quote_id = quote_id
+        self.started = time.monotonic()
+        self.phase: Optional[str] = None
+        self.phase_started = 0.0
+        self.timings: Dict[str, float] = {}
+
+    def elapsed_ms(self) -> float:
+        return round((time.monotonic() - self.started) * 1000, 1)
+
+    async def begin(self, phase: str):
+        await self._end_phase("completed")
+        self.phase = phase
+        self.phase_started = time.monotonic()
+        await self.emit("phase", {"phase": phase, "status": "started"})
+
+    async def _end_phase(self, status: str, detail: Optional[str] = None):
+        if self.phase is None:
+            return
+        duration = round((time.monotonic() - self.phase_started) * 1000, 1)
+        self.timings[self.phase] = duration
+        data = {"phase": self.phase, "status": status, "durationMs": duration}
+        if detail is not None:
+            data["detail"] = detail
+        self.phase = None
+        await self.emit("phase", data)
+
+    async def finish(self, status: str = "completed", detail: Optional[str] = None):
+        """Close the last phase and log the timings"""
+        await self._end_phase(status, detail)
+        phases = ", ".join(f"{phase}={duration:.0f}ms" for phase, duration in self.timings.items())
+        print(f"Purchase {self.quote_id} {status} in {self.elapsed_ms():.0f}ms ({phases})")
+
+    async def emit(self, event: str, data: dict):
+        """Hook for streaming; the plain /purchase only logs"""
+        pass
+
+
+class EventStream:
+    """Queue of SSE events written by a background task and read by the response"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    def elapsed_ms(self) -> float:
+        return round((time.monotonic() - self.started) * 1000, 1)
+
+    async def emit(self, event: str, data: dict):
+        await self.queue.put((event, {**data, "elapsedMs": self.elapsed_ms()}))
+
+    def close(self):
+        self.queue.put_nowait(None)
+
+    async def events(self) -> AsyncIterator[str]:
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                yield format_sse("done", {"elapsedMs": self.elapsed_ms()})
+                return
+            yield format_sse(*item)
+
+
+class StreamingPurchaseProgress(PurchaseProgress):
+    """Queues every progress event for an SSE response"""
+
+    def __init__(self, quote_id: str):
+        super().__init__(quote_id)
+        self.stream = EventStream()
+
+    async def emit(self, event: str, data: dict):
+        await self.stream.emit(event, data)
+
+    def close(self):
+        self.stream.close()
+
+    def events(self) -> AsyncIterator[str]:
+        return self.stream.events()
@@ -0,0 +1,145 @@
+"""
+Payload format negotiation for the Carbonmark /quotes endpoint.
+
+The endpoint has accepted several request shapes over time. Instead of trying
+every shape on every quote, the registry remembers the format that last
+succeeded, sends that first, and only probes the others after it is rejected.
+"""
+
+from typing import Callable, Dict, List, Optional
+
+from .models import AssetSource
+
+# Statuses that mean "this payload shape was rejected" rather than an outage or auth problem
+FORMAT_REJECTION_STATUSES = {400, 404, 405, 415, 422}
+
+
+def quote_request_v1(source: AssetSource, retirement_details: dict) -> dict:
+    """Format 1: Direct fields with correct field names"""
+    return {
+        "asset_price_source_id": source.assetPriceSourceId or source.sourceId,
+        "listing_id": source.listingId or source.sourceId,
+        "pool": source.pool or source.poolName or "default",
+        "quantity_tonnes": str(source.supply),  # Use quantity_tonnes instead of quantity
+        "retirementDetails": retirement_details
+    }
+
+
+def quote_request_v2(source: AssetSource, retirement_details: dict) -> dict:
+    """Format 2: Items array with correct field names"""
+    return {
+        "items": [{
+            "asset_price_source_id": source.assetPriceSourceId or source.sourceId,
+            "listing_id": source.listingId or source.sourceId,
+            "pool": source.pool or source.poolName or "default",
+            "quantity_tonnes": str(source.supply)
+        }],
+        "retirementDetails": retirement_details
+    }
+
+
+def quote_request_v3(source: AssetSource, retirement_details: dict) -> dict:
+    """Format 3: CamelCase field names with correct quantity field"""
+    return {
+        "assetPriceSourceId": source.assetPriceSourceId or source.sourceId,
+        "listingId": source.listingId or source.sourceId,
+        "pool": source.pool or source.poolName or "default",
+        "quantityTonnes": str(source.supply),  # Use quantityTonnes in camelCase
+        "retirementDetails": retirement_details
+    }
+
+
+def quote_request_v4(source: AssetSource, retirement_details: dict) -> dict:
+    """Format 4: Just the essential fields as per error message"""
+    return {
+        "asset_price_source_id": source.assetPriceSourceId or source.sourceId,
+        "listing_id": source.listingId or source.sourceId,
+        "quantity_tonnes": str(source.supply)
+    }
+
+
+class FormatStats:
+    __slots__ = ("attempts", "successes", "rejections", "errors", "total_latency", "last_status")
+
+    def __init__(self):
+        self.attempts = 0
+        self.successes = 0
+        self.rejections = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.last_status: Optional[int] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "attempts": self.attempts,
+            "successes": self.successes,
+            "rejections": self.rejections,
+            "errors": self.errors,
+            "avgLatency": round(self.total_latency / self.attempts, 4) if self.attempts else None,
+            "lastStatus": self.last_status
+        }
+
+
+class QuoteFormatRegistry:
+    """Ordered quote payload builders plus the format the endpoint last accepted"""
+
+    def __init__(self):
+        self.builders: Dict[str, Callable[[AssetSource, dict], dict]] = {}
+        self.stats: Dict[str, FormatStats] = {}
+        self.preferred: Optional[str] = None
+        self.reprobes = 0
+
+    def register(self, name: str, builder: Callable[[AssetSource, dict], dict]):
+        self.builders[name] = builder
+        self.stats[name] = FormatStats()
+
+    def probe_order(self) -> List[str]:
+        """Learned format first, then the rest in registration order"""
+        names = list(self.builders)
+        if self.preferred in self.builders:
+            names.remove(self.preferred)
+            names.insert(0, self.preferred)
+        return names
+
+    def build(self, name: str, source: AssetSource, retirement_details: dict) -> dict:
+        return self.builders[name](source, retirement_details)
+
+    def record(self, name: str, status: Optional[int], latency: float):
+        """Record one attempt; status None means a network error"""
+        stats = self.stats[name]
+        stats.attempts += 1
+        stats.total_latency += latency
+        stats.last_status = status
+
+        if status is not None and 200 <= status < 300:
+            stats.successes += 1
+            if self.preferred != name:
+                print(f"Quote format '{name}' accepted; using it first from now on")
+            self.preferred = name
+        elif status in FORMAT_REJECTION_STATUSES:
+            stats.rejections += 1
+            if self.preferred == name:
+                # The learned format stopped working - fall back to probing
+                self.reprobes += 1
+                self.preferred = None
+        else:
+            stats.errors += 1
+
+    @staticmethod
+    def is_rejection(status: int) -> bool:
+        return status in FORMAT_REJECTION_STATUSES
+
+    def to_dict(self) -> dict:
+        return {
+            "preferred": self.preferred,
+            "reprobes": self.reprobes,
+            "formats": {name: stats.to_dict() for name, stats in self.stats.items()}
+        }
+
+
+# Global registry, in the order formats are probed when nothing has been learned yet
+quote_formats = QuoteFormatRegistry()
+quote_formats.register("v1", quote_request_v1)
+quote_formats.register("v2", quote_request_v2)
+quote_formats.register("v3", quote_request_v3)
+quote_formats.register("v4", quote_request_v4)
@@ -0,0 +1,138 @@
+"""
+Background creation of the Carbonmark quote behind a stored quote.
+
+/get_quote already knows the selected listings and the retirement details, so
+the upstream /quotes call is started there and its UUID attached to the stored
+quote. /purchase then only waits if that call is still running, instead of
+always paying for the round trip after the user confirms.
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from .models import AssetSource, QuoteStorage
+from .quote_store import quote_storage
+
+# Load environment variables
+load_dotenv()
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+# Retirement fields sent with the upstream quote. The consumption period is
+# left out: it is always "today" and the order sends its own consumption metadata.
+QUOTED_RETIREMENT_FIELDS = ("retiringEntityName", "retirementMessage", "consumptionCountryCode")
+
+# generate(selected_sources, retirement_details) -> Carbonmark quote UUID or None
+QuoteGenerator = Callable[[List[AssetSource], dict], Awaitable[Optional[str]]]
+
+
+def retirement_fingerprint(retirement_details: dict) -> str:
+    """Stable hash of the retirement fields an upstream quote was created with"""
+    quoted = {field: retirement_details.get(field) for field in QUOTED_RETIREMENT_FIELDS}
+    return hashlib.sha256(json.dumps(quoted, sort_keys=True).encode()).hexdigest()
+
+
+class QuotePrewarmer:
+    """Runs upstream quote creation in the background and lets /purchase wait on it"""
+
+    def __init__(self, generate: QuoteGenerator):
+        self.generate = generate
+        self.enabled = os.getenv("QUOTE_PREWARM", "1") != "0"
+        # Longest /purchase waits for a pending upstream quote before creating its own
+        self.wait_timeout = float(os.getenv("QUOTE_PREWARM_WAIT", "35"))
+        self.poll_interval = 0.25
+        self.semaphore = asyncio.Semaphore(int(os.getenv("QUOTE_PREWARM_CONCURRENCY", "4")))
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.started = 0
+        self.ready = 0
+        self.failed = 0
+        self.waits = 0
+        self.wait_timeouts = 0
+
+    def start(self, quote: QuoteStorage, retirement_details: dict):
+        """Kick off upstream quote creation for a stored quote (status already pending)"""
+        task = asyncio.create_task(self._warm(quote.quoteId, quote.selectedSources, retirement_details))
+        self.tasks[quote.quoteId] = task
+        task.add_done_callback(lambda _: self.tasks.pop(quote.quoteId, None))
+        self.started += 1
+
+    async def _warm(self, quote_id: str, sources: List[AssetSource], retirement_details: dict):
+        try:
+            async with self.semaphore:
+                carbonmark_quote_id = await self.generate(sources, retirement_details)
+        except asyncio.CancelledError:
+            # A quote left pending would make every later purchase of it wait out the timeout again
+            self.failed += 1
+            await quote_storage.update(quote_id, {"carbonmarkQuoteStatus": FAILED})
+            raise
+        except Exception as e:
+            print(f"Pre-warm for quote {quote_id} failed: {e}")
+            carbonmark_quote_id = None
+        if carbonmark_quote_id:
+            self.ready += 1
+            await quote_storage.update(quote_id, {
+                "carbonmarkQuoteId": carbonmark_quote_id,
+                "carbonmarkQuoteStatus": READY
+            })
+            print(f"Pre-warmed Carbonmark quote {carbonmark_quote_id} for quote {quote_id}")
+        else:
+            self.failed += 1
+            await quote_storage.update(quote_id, {"carbonmarkQuoteStatus": FAILED})
+
+    async def wait(self, quote: QuoteStorage) -> QuoteStorage:
+        """Wait for a pending upstream quote; returns the quote as stored afterwards"""
+        if quote.carbonmarkQuoteStatus != PENDING:
+            return quote
+        self.waits += 1
+
+        task = self.tasks.get(quote.quoteId)
+        try:
+            if task is not None:
+                await asyncio.wait_for(asyncio.shield(task), timeout=self.wait_timeout)
+            else:
+                # Started by another worker - watch the shared store instead
+                loop = asyncio.get_running_loop()
+                deadline = loop.time() + self.wait_timeout
+                while loop.time() < deadline:
+                    current = await quote_storage.get(quote.quoteId)
+                    if current is None or current.carbonmarkQuoteStatus != PENDING:
+                        break
+                    await asyncio.sleep(self.poll_interval)
+        except asyncio.TimeoutError:
+            self.wait_timeouts += 1
+            print(f"Timed out waiting for pre-warmed Carbonmark quote for {quote.quoteId}")
+        except Exception as e:
+            print(f"Pre-warm for quote {quote.quoteId} failed: {e}")
+
+        return await quote_storage.get(quote.quoteId) or quote
+
+    async def cancel(self, quote_id: str):
+        """Stop a pre-warm whose result would no longer be used; returns once the quote is marked failed"""
+        task = self.tasks.get(quote_id)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def stop(self):
+        """Cancel pre-warms still running (called from the app shutdown hook)"""
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "inFlight": len(self.tasks),
+            "started": self.started,
+            "ready": self.ready,
+            "failed": self.failed,
+            "purchaseWaits": self.waits,
+            "purchaseWaitTimeouts": self.wait_timeouts
+        }
@@ -0,0 +1,293 @@
+"""
+Quote storage shared by /get_quote and /purchase.
+
+The in-memory backend keeps quotes in a dict for O(1) lookup and their expiry
+times in a min-heap, so a background task can drop expired quotes without
+scanning every entry. The Mongo backend stores quotes in the shared database
+so any worker or host can complete a purchase quoted by another; a TTL index
+on expiresAt (see INDEXES in app/database.py) removes expired quotes there.
+"""
+
+import os
+import heapq
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from .database import db
+from .models import QuoteStorage
+
+# Load environment variables
+load_dotenv()
+
+
+class QuoteStore:
+    """Dict-like quote storage with a hard size bound and an expiry min-heap"""
+
+    def __init__(self, max_size: int, sweep_interval: float):
+        self.max_size = max_size
+        self.sweep_interval = sweep_interval
+        self.entries: Dict[str, QuoteStorage] = {}
+        # (expiresAt, quoteId); stale heap items are skipped lazily when popped
+        self.expiry_heap: List[Tuple[datetime, str]] = []
+        self.expired_swept = 0
+        self.evicted = 0
+        self.sweeps = 0
+        self.sweep_task: Optional[asyncio.Task] = None
+
+    # --- dict interface used by MemoryQuoteBackend ---
+
+    def __contains__(self, quote_id: str) -> bool:
+        return quote_id in self.entries
+
+    def __getitem__(self, quote_id: str) -> QuoteStorage:
+        return self.entries[quote_id]
+
+    def __setitem__(self, quote_id: str, quote: QuoteStorage):
+        if quote_id not in self.entries and len(self.entries) >= self.max_size:
+            self.sweep()
+            while len(self.entries) >= self.max_size:
+                self._evict_one()
+        self.entries[quote_id] = quote
+        heapq.heappush(self.expiry_heap, (quote.expiresAt, quote_id))
+
+    def __delitem__(self, quote_id: str):
+        del self.entries[quote_id]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, quote_id: str) -> Optional[QuoteStorage]:
+        return self.entries.get(quote_id)
+
+    # --- expiry ---
+
+    def _pop_heap(self) -> Optional[str]:
+        """Pop the soonest-expiring live quote ID, discarding stale heap items"""
+        while self.expiry_heap:
+            expires_at, quote_id = heapq.heappop(self.expiry_heap)
+            quote = self.entries.get(quote_id)
+            if quote is not None and quote.expiresAt == expires_at:
+                return quote_id
+        return None
+
+    def _evict_one(self):
+        # Every quote has the same lifetime, so soonest-expiring is also oldest
+        quote_id = self._pop_heap()
+        if quote_id is None:
+            return
+        del self.entries[quote_id]
+        self.evicted += 1
+
+    def sweep(self, now: Optional[datetime] = None) -> int:
+        """Remove every expired quote; returns how many were dropped"""
+        now = now or datetime.utcnow()
+        removed = 0
+        while self.expiry_heap and self.expiry_heap[0][0] <= now:
+            expires_at, quote_id = heapq.heappop(self.expiry_heap)
+            quote = self.entries.get(quote_id)
+            if quote is not None and quote.expiresAt == expires_at:
+                del self.entries[quote_id]
+                removed += 1
+
+        # Drop heap items left behind by deleted or replaced quotes once they dominate
+        if len(self.expiry_heap) > 2 * len(self.entries) + 64:
+            self.expiry_heap = [
+                (quote.expiresAt, quote_id) for quote_id, quote in self.entries.items()
+            ]
+            heapq.heapify(self.expiry_heap)
+
+        self.sweeps += 1
+        self.expired_swept += removed
+        return removed
+
+    async def start(self):
+        """Start the background expiry sweeper (called from the app startup hook)"""
+        if self.sweep_task is None:
+            self.sweep_task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self.sweep_task is not None:
+            self.sweep_task.cancel()
+            try:
+                await self.sweep_task
+            except asyncio.CancelledError:
+                pass
+            self.sweep_task = None
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                removed = self.sweep()
+                if removed:
+                    print(f"Quote sweeper removed {removed} expired quotes ({len(self.entries)} remaining)")
+            except Exception as e:
+                print(f"Quote sweep failed: {e}")
+
+    # --- stats ---
+
+    def approximate_memory_bytes(self, sample_size: int = 50) -> int:
+        """Estimate memory from the serialized size of a sample of quotes"""
+        if not self.entries:
+            return 0
+        sample = list(self.entries.values())[:sample_size]
+        average = sum(len(quote.model_dump_json()) for quote in sample) / len(sample)
+        return int(average * len(self.entries))
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.entries),
+            "maxSize": self.max_size,
+            "heapSize": len(self.expiry_heap),
+            "approxMemoryBytes": self.approximate_memory_bytes(),
+            "expiredSwept": self.expired_swept,
+            "evicted": self.evicted,
+            "sweeps": self.sweeps
+        }
+
+
+class MemoryQuoteBackend:
+    """Process-local backend; only correct with a single worker"""
+
+    name = "memory"
+
+    def __init__(self, store: QuoteStore):
+        self.store = store
+
+    async def start(self):
+        await self.store.start()
+
+    async def stop(self):
+        await self.store.stop()
+
+    async def put(self, quote: QuoteStorage):
+        self.store[quote.quoteId] = quote
+
+    async def get(self, quote_id: str) -> Optional[QuoteStorage]:
+        quote = self.store.get(quote_id)
+        # Hand out copies so callers persist changes through update(), as with Mongo
+        return quote.model_copy() if quote is not None else None
+
+    async def delete(self, quote_id: str):
+        if quote_id in self.store:
+            del self.store[quote_id]
+
+    async def update(self, quote_id: str, fields: dict) -> bool:
+        quote = self.store.get(quote_id)
+        if quote is None:
+            return False
+        self.store.entries[quote_id] = quote.model_copy(update=fields)
+        return True
+
+    async def compare_and_set_status(self, quote_id: str, expected: str, new: str, fields: Optional[dict] = None,
+                                     expected_fields: Optional[dict] = None) -> bool:
+        # No await between the check and the write, so this is atomic on the event loop
+        quote = self.store.get(quote_id)
+        if quote is None or quote.status != expected:
+            return False
+        if any(getattr(quote, field) != value for field, value in (expected_fields or {}).items()):
+            return False
+        self.store.entries[quote_id] = quote.model_copy(update={"status": new, **(fields or {})})
+        return True
+
+    async def stats(self) -> dict:
+        return {"backend": self.name, **self.store.stats()}
+
+
+class MongoQuoteBackend:
+    """Shared backend in the quotes collection of the app database"""
+
+    name = "mongo"
+
+    def __init__(self, database):
+        self.collection = database.quotes
+
+    async def start(self):
+        # The expiresAt TTL index is created with the other indexes in app/database.py
+        pass
+
+    async def stop(self):
+        pass
+
+    async def put(self, quote: QuoteStorage):
+        document = quote.model_dump()
+        document["_id"] = quote.quoteId
+        await self.collection.replace_one({"_id": quote.quoteId}, document, upsert=True)
+
+    async def get(self, quote_id: str) -> Optional[QuoteStorage]:
+        document = await self.collection.find_one({"_id": quote_id})
+        if document is None:
+            return None
+        document.pop("_id", None)
+        return QuoteStorage(**document)
+
+    async def delete(self, quote_id: str):
+        await self.collection.delete_one({"_id": quote_id})
+
+    async def update(self, quote_id: str, fields: dict) -> bool:
+        result = await self.collection.update_one({"_id": quote_id}, {"$set": fields})
+        return result.matched_count == 1
+
+    async def compare_and_set_status(self, quote_id: str, expected: str, new: str, fields: Optional[dict] = None,
+                                     expected_fields: Optional[dict] = None) -> bool:
+        result = await self.collection.update_one(
+            {"_id": quote_id, "status": expected, **(expected_fields or {})},
+            {"$set": {"status": new, **(fields or {})}}
+        )
+        return result.matched_count == 1
+
+    async def stats(self) -> dict:
+        return {"backend": self.name, "size": await self.collection.estimated_document_count()}
+
+
+class QuoteRepository:
+    """Front for whichever backend QUOTE_BACKEND selects at startup"""
+
+    def __init__(self):
+        self.backend_name = os.getenv("QUOTE_BACKEND", "memory").lower()
+        self.backend = MemoryQuoteBackend(QuoteStore(
+            max_size=int(os.getenv("QUOTE_STORE_MAX_SIZE", "10000")),
+            sweep_interval=float(os.getenv("QUOTE_SWEEP_INTERVAL", "60"))
+        ))
+
+    async def start(self):
+        """Pick the backend once the database is connected (called from the app startup hook)"""
+        if self.backend_name == "mongo":
+            if db.is_fallback:
+                print("WARNING: QUOTE_BACKEND=mongo but MongoDB is unavailable - quotes stay in process memory")
+            else:
+                self.backend = MongoQuoteBackend(db.database)
+        print(f"Quote storage backend: {self.backend.name}")
+        await self.backend.start()
+
+    async def stop(self):
+        await self.backend.stop()
+
+    async def put(self, quote: QuoteStorage):
+        await self.backend.put(quote)
+
+    async def get(self, quote_id: str) -> Optional[QuoteStorage]:
+        return await self.backend.get(quote_id)
+
+    async def delete(self, quote_id: str):
+        await self.backend.delete(quote_id)
+
+    async def update(self, quote_id: str, fields: dict) -> bool:
+        return await self.backend.update(quote_id, fields)
+
+    async def compare_and_set_status(self, quote_id: str, expected: str, new: str, fields: Optional[dict] = None,
+                                     expected_fields: Optional[dict] = None) -> bool:
+        """
+        Atomically move a quote from status expected to new, optionally setting
+        other fields; expected_fields must also still hold for the move to happen
+        """
+        return await self.backend.compare_and_set_status(quote_id, expected, new, fields, expected_fields)
+
+    async def stats(self) -> dict:
+        return await self.backend.stats()
+
+
+# Global quote storage
+quote_storage = QuoteRepository()
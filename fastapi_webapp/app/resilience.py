@@ -0,0 +1,156 @@
+"""
+Circuit breaker and retry budget used by the Carbonmark client
+"""
+
+import time
+import random
+import asyncio
+from typing import Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Per-endpoint breaker. After failure_threshold consecutive failures the
+    circuit opens and calls fail fast for reset_timeout seconds; then a single
+    trial call is let through (half-open) and its outcome closes or re-opens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_started_at: Optional[float] = None
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow_request(self) -> bool:
+        now = time.monotonic()
+        if self.state == OPEN:
+            if now - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self.trial_started_at = None
+
+        if self.state == HALF_OPEN:
+            # One trial at a time; a trial that never reported back expires after reset_timeout
+            if self.trial_started_at is not None and now - self.trial_started_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.trial_started_at = now
+
+        return True
+
+    def is_open(self) -> bool:
+        """True while calls would be rejected without reaching upstream"""
+        return self.state == OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def record_success(self):
+        if self.state != CLOSED:
+            print(f"Circuit '{self.name}' closed")
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.trial_started_at = None
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.times_opened += 1
+                print(f"Circuit '{self.name}' opened after {self.consecutive_failures} failures")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self.trial_started_at = None
+
+    def to_dict(self) -> dict:
+        return {
+            "state": OPEN if self.is_open() else (HALF_OPEN if self.state == OPEN else self.state),
+            "consecutiveFailures": self.consecutive_failures,
+            "timesOpened": self.times_opened,
+            "rejected": self.rejected
+        }
+
+
+class RetryBudget:
+    """
+    Caps retries to a fraction of request volume so retries cannot multiply
+    load on an upstream that is already struggling. Every request deposits
+    `ratio` tokens, a retry withdraws one, and min_per_second tokens trickle in
+    so low-traffic periods can still retry.
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, max_tokens: float):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.updated_at = time.monotonic()
+        self.retries = 0
+        self.exhausted = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.max_tokens, self.tokens + (now - self.updated_at) * self.min_per_second)
+        self.updated_at = now
+
+    def record_request(self):
+        self._refill()
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.retries += 1
+            return True
+        self.exhausted += 1
+        return False
+
+    def to_dict(self) -> dict:
+        return {
+            "tokens": round(self.tokens, 2),
+            "retries": self.retries,
+            "exhausted": self.exhausted
+        }
+
+
+class RateLimiter:
+    """Token bucket pacing calls to `rate` per second, with bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.waits = 0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            self.waits += 1
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def to_dict(self) -> dict:
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "tokens": round(self.tokens, 2),
+            "waits": self.waits
+        }
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
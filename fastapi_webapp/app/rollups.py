@@ -0,0 +1,137 @@
+"""
+Hourly and daily rollups of orders, tonnes retired and dollars spent.
+
+Every order adds to one bucket per granularity (hour, day) and dimension: all
+orders, its project and its registry. A bucket is one order_rollups document
+keyed by "granularity|dimension|key|bucket start", updated with $inc as orders
+are saved, so a dashboard reads one document per bucket instead of scanning
+order_history.
+
+RollupAccumulator rebuilds buckets from order_history streamed in created_at
+order: once the stream moves past a day, that day's buckets are complete and
+can be written, so memory is bounded by the buckets of a single day.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+GRANULARITIES = ("hour", "day")
+DIMENSIONS = ("all", "project", "registry")
+
+# Bucket key used for the "all" dimension
+ALL = "all"
+
+
+def bucket_start(created_at: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return created_at.replace(minute=0, second=0, microsecond=0)
+    return created_at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def bucket_length(granularity: str) -> timedelta:
+    return timedelta(hours=1) if granularity == "hour" else timedelta(days=1)
+
+
+def rollup_id(granularity: str, dimension: str, key: str, start: datetime) -> str:
+    return f"{granularity}|{dimension}|{key}|{start.isoformat()}"
+
+
+def _order_buckets(order: dict, now: datetime) -> List[Tuple[str, dict]]:
+    """(_id, identifying fields) of every bucket an order belongs to"""
+    created_at = order.get("created_at") or now
+    keys = {
+        "all": ALL,
+        "project": order.get("project_id"),
+        "registry": order.get("project_registry")
+    }
+    buckets = []
+    for granularity in GRANULARITIES:
+        start = bucket_start(created_at, granularity)
+        for dimension in DIMENSIONS:
+            key = keys[dimension]
+            if not key:
+                continue
+            buckets.append((rollup_id(granularity, dimension, key, start), {
+                "granularity": granularity,
+                "dimension": dimension,
+                "key": key,
+                "bucket_start": start
+            }))
+    return buckets
+
+
+def _add(totals: Dict[str, dict], orders: Iterable[dict], now: datetime):
+    for order in orders:
+        quantity = float(order.get("quantity") or 0)
+        total_cost = float(order.get("total_cost") or 0)
+        for bucket_id, fields in _order_buckets(order, now):
+            total = totals.setdefault(bucket_id, {
+                **fields, "order_count": 0, "tonnes_retired": 0.0, "total_spent": 0.0
+            })
+            total["order_count"] += 1
+            total["tonnes_retired"] += quantity
+            total["total_spent"] += total_cost
+
+
+def rollup_updates(orders: Iterable[dict], now: Optional[datetime] = None) -> Dict[str, dict]:
+    """One $inc upsert update per bucket touched by a batch of saved orders"""
+    now = now or datetime.utcnow()
+    totals: Dict[str, dict] = {}
+    _add(totals, orders, now)
+    return {
+        bucket_id: {
+            "$inc": {
+                "order_count": total["order_count"],
+                "tonnes_retired": total["tonnes_retired"],
+                "total_spent": total["total_spent"]
+            },
+            "$setOnInsert": {field: total[field] for field in ("granularity", "dimension", "key", "bucket_start")},
+            "$set": {"updated_at": now}
+        }
+        for bucket_id, total in totals.items()
+    }
+
+
+class RollupAccumulator:
+    """Buckets of orders read in created_at order, released a day at a time"""
+
+    def __init__(self):
+        self.day: Optional[datetime] = None
+        self.totals: Dict[str, dict] = {}
+        self.orders = 0
+
+    def add(self, order: dict) -> List[dict]:
+        """Add an order; returns the finished buckets of the previous day when the day changes"""
+        created_at = order.get("created_at")
+        if created_at is None:
+            return []
+        finished = []
+        day = bucket_start(created_at, "day")
+        if self.day is not None and day != self.day:
+            finished = self.flush()
+        self.day = day
+        _add(self.totals, [order], created_at)
+        self.orders += 1
+        return finished
+
+    def flush(self) -> List[dict]:
+        """Complete rollup documents held so far"""
+        now = datetime.utcnow()
+        documents = [{"_id": bucket_id, **total, "updated_at": now} for bucket_id, total in self.totals.items()]
+        self.totals = {}
+        return documents
+
+
+def rollup_view(document: dict) -> dict:
+    """API view of an order_rollups document"""
+    start = document["bucket_start"]
+    return {
+        "granularity": document["granularity"],
+        "dimension": document["dimension"],
+        "key": document["key"],
+        "bucketStart": start.isoformat(),
+        "bucketEnd": (start + bucket_length(document["granularity"])).isoformat(),
+        "orderCount": document.get("order_count", 0),
+        "tonnesRetired": round(document.get("tonnes_retired", 0.0), 6),
+        "totalSpent": round(document.get("total_spent", 0.0), 2)
+    }
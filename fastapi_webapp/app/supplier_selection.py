@@ -0,0 +1,290 @@
+"""
+Supplier selection engine.
+
+Both selection strategies run locally against one full price book for a
+project, so a quote needs a single Carbonmark /prices call. They work on the
+PriceBook columns and only create AssetSource models for selected listings.
+"""
+
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .models import SupplierSelection
+from .price_book import PriceBook
+
+# Tolerance for float comparisons on tonnage
+EPSILON = 1e-9
+
+# Optional cap on how many listings one quote may combine (unset = no cap)
+MAX_SUPPLIERS_PER_QUOTE = int(os.getenv("MAX_SUPPLIERS_PER_QUOTE", "0")) or None
+
+# Upper bound on the listing combinations tried when minimum lots or the cap apply
+SUPPLIER_SEARCH_NODE_LIMIT = int(os.getenv("SUPPLIER_SEARCH_NODE_LIMIT", "5000"))
+
+
+def solve_min_cost(
+    prices: np.ndarray,
+    supplies: np.ndarray,
+    quantity: float,
+    min_quantities: Optional[np.ndarray] = None,
+    max_suppliers: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Minimum-cost fill of quantity from listings given as parallel arrays.
+
+    Listings are ordered cheapest first (largest first among equal prices, so
+    ties resolve to the fewest sources). Without minimum lots or a supplier
+    cap, taking them in that order is optimal and runs as a cumulative sum and
+    searchsorted. Minimum lots and max_suppliers make the choice of listings
+    combinatorial, so it is searched (see _search_fill), starting from the
+    greedy fill.
+
+    Returns (indices, amounts) into the input arrays. If no fill covers the
+    quantity, the cheapest greedy partial fill is returned and the amounts sum
+    to less than quantity.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    supplies = np.asarray(supplies, dtype=np.float64)
+    if min_quantities is None:
+        min_quantities = np.zeros_like(supplies)
+    else:
+        min_quantities = np.nan_to_num(np.asarray(min_quantities, dtype=np.float64), nan=0.0)
+
+    # Listings that cannot even meet their own minimum lot are unusable
+    candidates = np.flatnonzero((supplies > EPSILON) & (supplies >= min_quantities))
+    order = candidates[np.lexsort((-supplies[candidates], prices[candidates]))]
+    sorted_prices = prices[order]
+    sorted_supplies = supplies[order]
+    sorted_mins = np.where(min_quantities[order] > EPSILON, min_quantities[order], 0.0)
+
+    positions, amounts = _greedy_fill(sorted_supplies, sorted_mins, quantity)
+    filled = sum(amounts) >= quantity - EPSILON
+    capped = bool(max_suppliers) and len(positions) > max_suppliers
+
+    if sorted_mins.any() or capped:
+        incumbent = None
+        if filled and not capped:
+            incumbent = (float(np.dot(sorted_prices[positions], amounts)), positions, amounts)
+        best = _search_fill(sorted_prices, sorted_supplies, sorted_mins, quantity, max_suppliers, incumbent)
+        if best is not None:
+            _, positions, amounts = best
+        elif capped:
+            # No combination covers the quantity - keep the cheapest allowed partial fill
+            positions, amounts = positions[:max_suppliers], amounts[:max_suppliers]
+
+    return order[np.asarray(positions, dtype=np.intp)], np.asarray(amounts, dtype=np.float64)
+
+
+def _greedy_fill(sorted_supplies: np.ndarray, sorted_mins: np.ndarray, quantity: float) -> Tuple[List[int], List[float]]:
+    """
+    Take listings cheapest first; the final partial take skips listings whose
+    minimum lot exceeds what is still needed. Exact without minimum lots.
+    """
+    cumulative = np.cumsum(sorted_supplies)
+    count = len(sorted_supplies)
+    positions: List[int] = []
+    amounts: List[float] = []
+    remaining = quantity
+    pos = 0
+    while remaining > EPSILON and pos < count:
+        base = cumulative[pos - 1] if pos > 0 else 0.0
+        # First listing at which supply from pos onwards covers what is still needed
+        k = int(np.searchsorted(cumulative, base + remaining - EPSILON, side="left"))
+        end = min(k, count)
+        if end > pos:
+            positions.extend(range(pos, end))
+            amounts.extend(sorted_supplies[pos:end].tolist())
+            remaining -= cumulative[end - 1] - base
+        if k >= count:
+            break
+
+        # Partial take: cheapest remaining listing whose minimum lot fits
+        fits = np.flatnonzero(sorted_mins[k:] <= remaining + EPSILON)
+        if len(fits) == 0:
+            break
+        j = k + int(fits[0])
+        amount = min(remaining, sorted_supplies[j])
+        positions.append(j)
+        amounts.append(amount)
+        remaining -= amount
+        pos = j + 1
+    return positions, amounts
+
+
+def _fill_cost(sorted_prices: np.ndarray, sorted_supplies: np.ndarray, lower: np.ndarray,
+               use: np.ndarray, quantity: float) -> Optional[Tuple[float, np.ndarray]]:
+    """
+    Cheapest fill from the listings in use, each taking at least its lower
+    bound: lower bounds first, then the rest cheapest first. Returns
+    (cost, amounts) or None if those listings cannot fill quantity exactly.
+    """
+    low = np.where(use, lower, 0.0)
+    rest = quantity - low.sum()
+    if rest < -EPSILON:
+        return None
+    capacity = np.where(use, sorted_supplies - low, 0.0)
+    cumulative = np.cumsum(capacity)
+    if len(cumulative) == 0 or cumulative[-1] < rest - EPSILON:
+        return None
+    extra = np.zeros_like(capacity)
+    if rest > EPSILON:
+        k = int(np.searchsorted(cumulative, rest - EPSILON, side="left"))
+        extra[:k] = capacity[:k]
+        extra[k] = rest - (cumulative[k - 1] if k > 0 else 0.0)
+    amounts = low + extra
+    return float(np.dot(amounts, sorted_prices)), amounts
+
+
+def _search_fill(
+    sorted_prices: np.ndarray,
+    sorted_supplies: np.ndarray,
+    sorted_mins: np.ndarray,
+    quantity: float,
+    max_suppliers: Optional[int],
+    incumbent: Optional[Tuple[float, List[int], List[float]]]
+) -> Optional[Tuple[float, List[int], List[float]]]:
+    """
+    Depth-first branch and bound over which listings a fill may use.
+
+    Without a supplier cap only listings with a minimum lot need a decision;
+    the others are always available at no commitment. With a cap every listing
+    is decided. Each node scores the fill that uses exactly the listings chosen
+    so far, and is pruned when a relaxation (undecided listings allowed
+    without their minimum lots, no cap) cannot beat the best fill found. The
+    search is exact unless it runs into SUPPLIER_SEARCH_NODE_LIMIT, in which
+    case the best fill found so far is returned. Returns (cost, positions,
+    amounts) or None if no fill was found.
+    """
+    count = len(sorted_prices)
+    if max_suppliers:
+        decisions = np.arange(count)
+        always = np.zeros(count, dtype=bool)
+    else:
+        # Listings with a minimum larger than the whole order can never be used
+        decisions = np.flatnonzero((sorted_mins > 0) & (sorted_mins <= quantity + EPSILON))
+        always = sorted_mins == 0
+
+    best = incumbent
+    nodes = 0
+    # (depth into decisions, positions chosen so far); include is explored before exclude
+    stack: List[Tuple[int, Tuple[int, ...]]] = [(0, ())]
+    while stack and nodes < SUPPLIER_SEARCH_NODE_LIMIT:
+        depth, chosen = stack.pop()
+        nodes += 1
+        use = always.copy()
+        use[list(chosen)] = True
+
+        result = _fill_cost(sorted_prices, sorted_supplies, sorted_mins, use, quantity)
+        if result is not None and (best is None or result[0] < best[0] - EPSILON):
+            positions = np.flatnonzero(result[1] > EPSILON)
+            best = (result[0], positions.tolist(), result[1][positions].tolist())
+
+        if depth == len(decisions) or (max_suppliers and len(chosen) >= max_suppliers):
+            continue
+        undecided = decisions[depth:]
+        if max_suppliers:
+            # The remaining slots must be able to hold what the chosen listings cannot
+            slots = max_suppliers - len(chosen)
+            largest = np.sort(sorted_supplies[undecided])[-slots:].sum()
+            if sorted_supplies[list(chosen)].sum() + largest < quantity - EPSILON:
+                continue
+        relaxed = use.copy()
+        relaxed[undecided] = True
+        bound = _fill_cost(sorted_prices, sorted_supplies, np.where(use, sorted_mins, 0.0), relaxed, quantity)
+        if bound is None or (best is not None and bound[0] >= best[0] - EPSILON):
+            continue
+
+        position = int(decisions[depth])
+        stack.append((depth + 1, chosen))
+        stack.append((depth + 1, chosen + (position,)))
+
+    if nodes >= SUPPLIER_SEARCH_NODE_LIMIT:
+        print(f"Supplier search stopped after {nodes} nodes; using the best fill found")
+    return best
+
+
+def select_single_supplier(book: PriceBook, quantity: float, expected_cost: float) -> Optional[SupplierSelection]:
+    """
+    Phase 1: cheapest single supplier that holds the whole quantity within the
+    expected cost (what /prices?minSupply=quantity used to pre-filter upstream).
+    """
+    if len(book) == 0:
+        return None
+    costs = book.prices * quantity
+    # NaN minimum lots compare False, i.e. no minimum
+    eligible = (book.supplies >= quantity) & ~(book.min_quantities > quantity) & (costs <= expected_cost)
+    if not eligible.any():
+        return None
+
+    # argmin keeps the first listing on ties, like the old stable sort
+    best_index = int(np.argmin(np.where(eligible, costs, np.inf)))
+    best_cost = float(costs[best_index])
+    print(f"Phase 1 SUCCESS: {book.source_ids[best_index]} @ ${book.prices[best_index]:.2f}/ton, total ${best_cost:.2f}")
+
+    return SupplierSelection(
+        selectedSources=[book.materialize(best_index, supply=quantity)],  # Use the exact quantity we need
+        totalCost=best_cost,
+        totalSupply=quantity,
+        canFulfillQuantity=True,
+        costExceedsExpected=False
+    )
+
+
+def select_multi_supplier(
+    book: PriceBook,
+    quantity: float,
+    expected_cost: float,
+    max_suppliers: Optional[int] = MAX_SUPPLIERS_PER_QUOTE
+) -> SupplierSelection:
+    """Phase 2: combine listings at minimum total cost"""
+    indices, amounts = solve_min_cost(book.prices, book.supplies, quantity, book.min_quantities, max_suppliers)
+
+    selected_sources = [
+        book.materialize(index, supply=amount)
+        for index, amount in zip(indices.tolist(), amounts.tolist())
+    ]
+
+    total_supply = float(amounts.sum())
+    total_cost = float(np.dot(amounts, book.prices[indices]))
+    can_fulfill_quantity = total_supply >= quantity - EPSILON
+    cost_exceeds_expected = total_cost > expected_cost
+
+    print(f"Phase 2: {len(selected_sources)} suppliers, {total_supply} tons, total ${total_cost:.2f} "
+          f"(expected ${expected_cost:.2f}, fulfilled={can_fulfill_quantity})")
+
+    return SupplierSelection(
+        selectedSources=selected_sources,
+        totalCost=total_cost,
+        totalSupply=total_supply,
+        canFulfillQuantity=can_fulfill_quantity,
+        costExceedsExpected=cost_exceeds_expected
+    )
+
+
+def remaining_supply(book: PriceBook, selection: SupplierSelection) -> PriceBook:
+    """Price book left once a selection is taken, so several orders can share one book"""
+    supplies = book.supplies.copy()
+    for source in selection.selectedSources:
+        # Identical listings are interchangeable; take from the first that still has supply
+        amount = source.supply
+        for index in book.positions(source):
+            taken = min(supplies[index], amount)
+            supplies[index] -= taken
+            amount -= taken
+            if amount <= EPSILON:
+                break
+    return book.with_supplies(supplies)
+
+
+def select_suppliers(book: PriceBook, quantity: float, expected_cost: float) -> SupplierSelection:
+    """Try a single supplier first, then fall back to combining suppliers"""
+    selection = select_single_supplier(book, quantity, expected_cost)
+    if selection is not None:
+        return selection
+
+    if len(book) == 0:
+        raise Exception("Issue returning listing - No asset sources found for this project")
+
+    return select_multi_supplier(book, quantity, expected_cost)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Benchmark the single-pass price parser against the original per-item parser
+"""
+import sys
+import os
+import io
+import random
+import timeit
+import tracemalloc
+import contextlib
+
+# Add the current directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.models import AssetSource
+from app.price_parser import parse_price_response, decode_response
+
+
+def legacy_parse_sources(prices_data):
+    """parse_sources_from_response as it was in main.py before the single-pass parser"""
+    sources = []
+    
+    if isinstance(prices_data, list):
+        for item in prices_data:
+            print(f"Processing item: {item}")
+            print(f"Item keys: {list(item.keys()) if isinstance(item, dict) else 'Not a dict'}")
+            
+            # Check for direct Carbonmark API format (sourceId, purchasePrice, supply)
+            if 'sourceId' in item and 'purchasePrice' in item and 'supply' in item:
+                pool_name = ""
+                # Extract pool name from carbonPool if available
+                if 'carbonPool' in item and 'poolName' in item['carbonPool']:
+                    pool_name = item['carbonPool']['poolName']
+                elif 'poolName' in item:
+                    pool_name = item['poolName']
+                
+                sources.append(AssetSource(
+                    sourceId=item.get('sourceId', ''),
+                    purchasePrice=float(item.get('purchasePrice', 0)),
+                    supply=float(item.get('supply', 0)),
+                    poolName=pool_name,
+                    assetPriceSourceId=item.get('id') or item.get('assetPriceSourceId'),  # This might be the 'id' field
+                    listingId=item.get('listingId'),
+                    pool=item.get('pool') or pool_name,
+                    minQuantity=float(item['minFillAmount']) if item.get('minFillAmount') else None
+                ))
+                print(f"  Added source: {item.get('sourceId')} - ${item.get('purchasePrice')}/ton, {item.get('supply')} tons")
+                print(f"    Additional fields: assetPriceSourceId={item.get('id')}, listingId={item.get('listingId')}, pool={item.get('pool') or pool_name}")
+            
+            # Legacy format: Direct source format with 'id', 'price', 'supply'
+            elif 'id' in item and 'price' in item and 'supply' in item:
+                sources.append(AssetSource(
+                    sourceId=item.get('id', ''),
+                    purchasePrice=float(item.get('price', 0)),
+                    supply=float(item.get('supply', 0)),
+                    poolName=item.get('poolName', item.get('pool', '')),
+                    assetPriceSourceId=item.get('id'),  # Use the id as assetPriceSourceId
+                    listingId=item.get('listingId'),
+                    pool=item.get('pool') or item.get('poolName', '')
+                ))
+                print(f"  Added legacy source: {item.get('id')} - ${item.get('price')}/ton, {item.get('supply')} tons")
+                print(f"    Additional fields: assetPriceSourceId={item.get('id')}, listingId={item.get('listingId')}, pool={item.get('pool') or item.get('poolName', '')}")
+            
+            # Nested sources format
+            elif 'sources' in item:
+                for source in item.get('sources', []):
+                    if 'sourceId' in source and 'purchasePrice' in source and 'supply' in source:
+                        sources.append(AssetSource(
+                            sourceId=source.get('sourceId', ''),
+                            purchasePrice=float(source.get('purchasePrice', 0)),
+                            supply=float(source.get('supply', 0)),
+                            poolName=source.get('poolName', ''),
+                            assetPriceSourceId=source.get('id') or source.get('assetPriceSourceId'),
+                            listingId=source.get('listingId'),
+                            pool=source.get('pool') or source.get('poolName', '')
+                        ))
+                    elif 'id' in source and 'price' in source and 'supply' in source:
+                        sources.append(AssetSource(
+                            sourceId=source.get('id', ''),
+                            purchasePrice=float(source.get('price', 0)),
+                            supply=float(source.get('supply', 0)),
+                            poolName=source.get('poolName', source.get('pool', '')),
+                            assetPriceSourceId=source.get('id'),
+                            listingId=source.get('listingId'),
+                            pool=source.get('pool') or source.get('poolName', '')
+                        ))
+    
+    elif isinstance(prices_data, dict):
+        # Sources array in dict
+        if 'sources' in prices_data:
+            for source in prices_data.get('sources', []):
+                if 'sourceId' in source and 'purchasePrice' in source and 'supply' in source:
+                    sources.append(AssetSource(
+                        sourceId=source.get('sourceId', ''),
+                        purchasePrice=float(source.get('purchasePrice', 0)),
+                        supply=float(source.get('supply', 0)),
+                        poolName=source.get('poolName', '')
+                    ))
+                elif 'id' in source and 'price' in source and 'supply' in source:
+                    sources.append(AssetSource(
+                        sourceId=source.get('id', ''),
+                        purchasePrice=float(source.get('price', 0)),
+                        supply=float(source.get('supply', 0)),
+                        poolName=source.get('poolName', source.get('pool', ''))
+                    ))
+        
+        # Dict is itself a source (Carbonmark format)
+        elif 'sourceId' in prices_data and 'purchasePrice' in prices_data and 'supply' in prices_data:
+            pool_name = ""
+            if 'carbonPool' in prices_data and 'poolName' in prices_data['carbonPool']:
+                pool_name = prices_data['carbonPool']['poolName']
+            elif 'poolName' in prices_data:
+                pool_name = prices_data['poolName']
+                
+            sources.append(AssetSource(
+                sourceId=prices_data.get('sourceId', ''),
+                purchasePrice=float(prices_data.get('purchasePrice', 0)),
+                supply=float(prices_data.get('supply', 0)),
+                poolName=pool_name,
+                assetPriceSourceId=prices_data.get('id') or prices_data.get('assetPriceSourceId'),
+                listingId=prices_data.get('listingId'),
+                pool=prices_data.get('pool') or pool_name,
+                minQuantity=float(prices_data['minFillAmount']) if prices_data.get('minFillAmount') else None
+            ))
+        
+        # Legacy dict format
+        elif 'id' in prices_data and 'price' in prices_data and 'supply' in prices_data:
+            sources.append(AssetSource(
+                sourceId=prices_data.get('id', ''),
+                purchasePrice=float(prices_data.get('price', 0)),
+                supply=float(prices_data.get('supply', 0)),
+                poolName=prices_data.get('poolName', prices_data.get('pool', '')),
+                assetPriceSourceId=prices_data.get('id'),
+                listingId=prices_data.get('listingId'),
+                pool=prices_data.get('pool') or prices_data.get('poolName', '')
+            ))
+        
+        # Data section
+        elif 'data' in prices_data:
+            data_section = prices_data['data']
+            if isinstance(data_section, list):
+                for item in data_section:
+                    if 'sourceId' in item and 'purchasePrice' in item and 'supply' in item:
+                        sources.append(AssetSource(
+                            sourceId=item.get('sourceId', ''),
+                            purchasePrice=float(item.get('purchasePrice', 0)),
+                            supply=float(item.get('supply', 0)),
+                            poolName=item.get('poolName', '')
+                        ))
+                    elif 'id' in item and 'price' in item and 'supply' in item:
+                        sources.append(AssetSource(
+                            sourceId=item.get('id', ''),
+                            purchasePrice=float(item.get('price', 0)),
+                            supply=float(item.get('supply', 0)),
+                            poolName=item.get('poolName', item.get('pool', ''))
+                        ))
+    
+    return sources
+
+
+def synthetic_prices_response(listings: int, seed: int = 42):
+    """A /prices response shaped like Carbonmark's: a list of listings with pool details"""
+    rng = random.Random(seed)
+    return [
+        {
+            "id": f"aps-{index}",
+            "sourceId": f"0x{index:040x}",
+            "listingId": f"listing-{index}",
+            "purchasePrice": round(rng.uniform(2.0, 40.0), 2),
+            "supply": float(rng.randint(1, 50)),
+            "minFillAmount": rng.choice([0, 0, 1]),
+            "carbonPool": {"poolName": rng.choice(["", "NCT", "BCT"])},
+            "type": "listing"
+        }
+        for index in range(listings)
+    ]
+
+
+def best_time(fn, repeats=5):
+    # Both parsers print; keep it out of the table
+    with contextlib.redirect_stdout(io.StringIO()):
+        return min(timeit.repeat(fn, number=1, repeat=repeats))
+
+
+def retained_bytes(build):
+    """Bytes still allocated by the object build() returns, while it is alive"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return after - before
+
+
+def run_benchmark():
+    print("=== Price Parser Benchmark ===")
+    print("legacy = per-item parser building AssetSource models, parser = parse_price_response into a PriceBook,")
+    print("decode = the single pass alone\n")
+    print(f"{'listings':>9} {'legacy ms':>10} {'parser ms':>10} {'decode ms':>10} {'speedup':>8}")
+
+    for listings in (100, 1000, 10000):
+        payload = synthetic_prices_response(listings)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            legacy = legacy_parse_sources(payload)
+            parsed = parse_price_response(payload)
+        assert legacy == parsed.to_sources(), "Parsers disagree"
+
+        legacy_time = best_time(lambda: legacy_parse_sources(payload))
+        parser_time = best_time(lambda: parse_price_response(payload))
+        decode_time = best_time(lambda: decode_response(payload))
+
+        print(f"{listings:>9} {legacy_time * 1000:>10.2f} {parser_time * 1000:>10.2f} "
+              f"{decode_time * 1000:>10.2f} {legacy_time / parser_time:>7.1f}x")
+
+    payload = synthetic_prices_response(10000)
+    # Discard output rather than buffering it, so only the parsed listings are counted
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        legacy_bytes = retained_bytes(lambda: legacy_parse_sources(payload))
+        book_bytes = retained_bytes(lambda: parse_price_response(payload))
+    print(f"\nMemory held per 10k-listing price book: AssetSource list {legacy_bytes / 1024:.0f} KiB, "
+          f"PriceBook {book_bytes / 1024:.0f} KiB")
+
+    print("\nLegacy timings exclude the terminal: its output goes to an in-memory buffer,")
+    print("so the speedup under a real log sink is larger.")
+
+
+if __name__ == "__main__":
+    run_benchmark()
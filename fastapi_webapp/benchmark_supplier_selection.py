@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark the NumPy supplier solver against the original greedy selection loop
+"""
+import sys
+import os
+import io
+import random
+import timeit
+import contextlib
+
+import numpy as np
+
+# Add the current directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.models import AssetSource, SupplierSelection
+from app.price_book import PriceBook
+from app.supplier_selection import select_multi_supplier, solve_min_cost
+
+
+def legacy_greedy_selection(all_sources, quantity, expected_cost):
+    """The phase 2 loop as it was in main.py before the solver"""
+    all_sources = sorted(all_sources, key=lambda x: x.purchasePrice)
+
+    selected_sources = []
+    total_supply = 0.0
+    total_cost = 0.0
+
+    for source in all_sources:
+        if total_supply >= quantity:
+            break
+
+        needed_quantity = min(source.supply, quantity - total_supply)
+
+        if needed_quantity > 0:
+            selected_sources.append(AssetSource(
+                sourceId=source.sourceId,
+                purchasePrice=source.purchasePrice,
+                supply=needed_quantity,
+                poolName=source.poolName,
+                assetPriceSourceId=source.assetPriceSourceId,
+                listingId=source.listingId,
+                pool=source.pool
+            ))
+            total_supply += needed_quantity
+            total_cost += needed_quantity * source.purchasePrice
+
+    return SupplierSelection(
+        selectedSources=selected_sources,
+        totalCost=total_cost,
+        totalSupply=total_supply,
+        canFulfillQuantity=total_supply >= quantity,
+        costExceedsExpected=total_cost > expected_cost
+    )
+
+
+def synthetic_price_book(listings: int, seed: int = 42):
+    rng = random.Random(seed)
+    return [
+        AssetSource(
+            sourceId=f"0x{index:040x}",
+            purchasePrice=round(rng.uniform(2.0, 40.0), 2),
+            supply=float(rng.randint(1, 50)),
+            poolName="",
+            listingId=f"listing-{index}"
+        )
+        for index in range(listings)
+    ]
+
+
+def best_time(fn, repeats=5):
+    # select_multi_supplier prints a summary line; keep it out of the table
+    with contextlib.redirect_stdout(io.StringIO()):
+        return min(timeit.repeat(fn, number=1, repeat=repeats))
+
+
+def run_benchmark():
+    print("=== Supplier Selection Benchmark ===")
+    print("legacy = old greedy loop, solver = select_multi_supplier, core = solve_min_cost on prebuilt arrays\n")
+    print(f"{'listings':>9} {'fill':>5} {'legacy ms':>10} {'solver ms':>10} {'core ms':>8} {'core speedup':>13}")
+
+    for listings in (100, 1000, 5000, 20000):
+        sources = synthetic_price_book(listings)
+        book = PriceBook.from_sources(sources)
+        prices = np.array([source.purchasePrice for source in sources])
+        supplies = np.array([source.supply for source in sources])
+        available = float(supplies.sum())
+
+        for fill in (0.05, 0.5):
+            quantity = float(int(available * fill))
+            expected_cost = quantity * 20.0
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                legacy = legacy_greedy_selection(sources, quantity, expected_cost)
+                solver = select_multi_supplier(book, quantity, expected_cost, max_suppliers=None)
+            assert abs(legacy.totalCost - solver.totalCost) < 1e-6 * max(1.0, legacy.totalCost), "Solver cost differs"
+            assert abs(legacy.totalSupply - solver.totalSupply) < 1e-6, "Solver supply differs"
+
+            legacy_time = best_time(lambda: legacy_greedy_selection(sources, quantity, expected_cost))
+            solver_time = best_time(lambda: select_multi_supplier(book, quantity, expected_cost, max_suppliers=None))
+            core_time = best_time(lambda: solve_min_cost(prices, supplies, quantity))
+
+            print(f"{listings:>9} {fill:>5.0%} {legacy_time * 1000:>10.2f} {solver_time * 1000:>10.2f} "
+                  f"{core_time * 1000:>8.3f} {legacy_time / core_time:>12.1f}x")
+
+    print("\nEnd-to-end time is dominated by building the selected AssetSource models;")
+    print("the core column is the cost of the selection itself.")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -3,33 +3,105 @@ from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import Query
-from fastapi.responses import JSONResponse
+from fastapi import Query, Header, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 import requests
 
 import uvicorn
 import os
+import uuid
+import time
+import json
+import asyncio
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 
 # Import our modules
-from app.database import connect_to_mongo, close_mongo_connection, save_order_to_history, get_user_orders, get_user_by_id
+from app.database import (
+    connect_to_mongo, close_mongo_connection, save_order_to_history, save_orders_to_history,
+    get_user_orders, get_user_by_id, get_order_by_order_id, encode_order_cursor, index_usage_report,
+    get_user_impact, get_project_retirements, get_order_rollups
+)
 from app.models import (
     UserSignup, UserLogin, UserResponse, PurchaseRequest, PurchaseConfirmationRequest,
-    PurchaseResponse, AssetSource, SupplierSelection, CarbonmarkOrderResponse, QuoteStorage
+    PurchaseResponse, AssetSource, SupplierSelection, CarbonmarkOrderResponse, QuoteStorage,
+    BatchQuoteRequest, BulkRetirementRequest
 )
 from app.auth_service import create_user, authenticate_user
 from app.visualize_projects import get_funding_tree_json
+from app.carbonmark_client import (
+    carbonmark_client, CarbonmarkRequestError, CarbonmarkHTTPError, CircuitOpenError,
+    CARBONMARK_API_URL, CARBONMARK_V17_API_URL
+)
+from app.cache import ExpiringCache, RefreshingTTLCache, RevalidatingLRUCache
+from app.catalog import project_catalog
+from app.supplier_selection import select_suppliers, remaining_supply
+from app.price_parser import parse_price_response
+from app.resilience import RateLimiter
+from app.quote_formats import quote_formats
+from app.quote_store import quote_storage
+from app.blockchain_jobs import BlockchainJobQueue, initial_job_fields, job_status, SUCCEEDED as JOB_SUCCEEDED, FAILED as JOB_FAILED
+from app.purchase_progress import PurchaseProgress, StreamingPurchaseProgress, EventStream
+from app.impact import impact_view, project_retirement_view
+from app.rollups import GRANULARITIES, DIMENSIONS, bucket_start, rollup_view
+from app.quote_prewarm import QuotePrewarmer, retirement_fingerprint, PENDING as PREWARM_PENDING, READY as PREWARM_READY
 
 # Load environment variables
 load_dotenv()
 
-# In-memory quote storage (in production, use database)
-quote_storage = {}
-
 
 BLOCKCHAIN_API_URL = os.getenv("BLOCKCHAIN_API_URL")
 ETH2DOLLAR = float(os.getenv("ETH2DOLLAR"))
+# How long /purchase/stream?followBlockchain=true keeps reporting the blockchain job
+PURCHASE_STREAM_BLOCKCHAIN_WAIT = float(os.getenv("PURCHASE_STREAM_BLOCKCHAIN_WAIT", "300"))
+# Each blockchain API call waits for its transaction receipt
+BLOCKCHAIN_TIMEOUT = float(os.getenv("BLOCKCHAIN_TIMEOUT", "120"))
+
+# Countries/categories almost never change, so cache them for an hour by default
+reference_cache = RefreshingTTLCache(ttl=float(os.getenv("REFERENCE_CACHE_TTL", "3600")))
+
+# Project pages are requested back to back by project.jsx and purchase.js
+project_cache = RevalidatingLRUCache(
+    max_entries=int(os.getenv("PROJECT_CACHE_SIZE", "500")),
+    fresh_ttl=float(os.getenv("PROJECT_CACHE_TTL", "60")),
+    stale_ttl=float(os.getenv("PROJECT_CACHE_STALE_TTL", "600")),
+    negative_ttl=float(os.getenv("PROJECT_CACHE_NEGATIVE_TTL", "300"))
+)
+
+# Repeat quotes within one checkout reuse the same price book for a few seconds
+price_book_cache = ExpiringCache(ttl=float(os.getenv("PRICE_BOOK_CACHE_TTL", "5")))
+
+# Last-known-good upstream search responses, served while Carbonmark is failing
+search_fallback_cache = ExpiringCache(
+    ttl=float(os.getenv("SEARCH_FALLBACK_TTL", "86400")),
+    max_entries=int(os.getenv("SEARCH_FALLBACK_SIZE", "200"))
+)
+
+# Batch quoting limits
+MAX_BATCH_QUOTE_ITEMS = int(os.getenv("MAX_BATCH_QUOTE_ITEMS", "500"))
+BATCH_QUOTE_CONCURRENCY = int(os.getenv("BATCH_QUOTE_CONCURRENCY", "8"))
+
+# Bulk retirement limits; the order rate is shared by every bulk request in this process
+MAX_BULK_RETIREMENT_ITEMS = int(os.getenv("MAX_BULK_RETIREMENT_ITEMS", "500"))
+BULK_RETIREMENT_CONCURRENCY = int(os.getenv("BULK_RETIREMENT_CONCURRENCY", "4"))
+bulk_order_limiter = RateLimiter(
+    rate=float(os.getenv("BULK_RETIREMENT_ORDERS_PER_SECOND", "2")),
+    burst=float(os.getenv("BULK_RETIREMENT_BURST", "4"))
+)
+
+# A reservation older than this belongs to a purchase that died (e.g. worker crash)
+PURCHASE_RESERVATION_TIMEOUT = float(os.getenv("PURCHASE_RESERVATION_TIMEOUT", "300"))
+
+# Order history page sizes
+ORDER_HISTORY_PAGE_SIZE = int(os.getenv("ORDER_HISTORY_PAGE_SIZE", "50"))
+ORDER_HISTORY_MAX_PAGE_SIZE = int(os.getenv("ORDER_HISTORY_MAX_PAGE_SIZE", "200"))
+
+# Enough for a full search results page
+MAX_PROJECT_RETIREMENT_IDS = int(os.getenv("MAX_PROJECT_RETIREMENT_IDS", "500"))
+
+# Most rollup buckets one /rollups call returns
+MAX_ROLLUP_BUCKETS = int(os.getenv("MAX_ROLLUP_BUCKETS", "500"))
 
 app = FastAPI(title="CarbonChain API", version="1.0.0")
 
@@ -46,9 +118,18 @@ app.add_middleware(
 @app.on_event("startup")
 async def startup_db_client():
     await connect_to_mongo()
+    await carbonmark_client.start()
+    await project_catalog.start()
+    await quote_storage.start()
+    await blockchain_jobs.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await blockchain_jobs.stop()
+    await quote_prewarmer.stop()
+    await quote_storage.stop()
+    await project_catalog.stop()
+    await carbonmark_client.close()
     await close_mongo_connection()
 
 # Mount static directory (if needed for assets)
@@ -95,381 +176,150 @@ async def login(credentials: UserLogin):
     return user
 
 # --- COUNTRIES ENDPOINT ---
+async def fetch_countries():
+    response = await carbonmark_client.get(f"{CARBONMARK_V17_API_URL}/countries")
+    response.raise_for_status()
+    data = response.json()
+    # Unpack the JSON to return a list of country names
+    return [country["id"] for country in data]
+
 @app.get("/search_countries")
 async def search_countries():
     try:
-        response = requests.get("https://v17.api.carbonmark.com/countries")
-        response.raise_for_status()
-        data = response.json()
-        # Unpack the JSON to return a list of country names
-        countries = [country["id"] for country in data]
+        countries = await reference_cache.get("countries", fetch_countries)
         return JSONResponse(content={"countries": countries})
-    except requests.RequestException as e:
+    except CarbonmarkRequestError as e:
         return JSONResponse(content={"error": "Failed to fetch countries"}, status_code=500)
     
 # --- METHODOLOGIES ENDPOINT ---
+async def fetch_categories():
+    response = await carbonmark_client.get(f"{CARBONMARK_V17_API_URL}/categories")
+    response.raise_for_status()
+    data = response.json()
+    # Unpack the JSON to return a list of category names
+    return [category["id"] for category in data]
+
 @app.get("/search_categories")
 async def search_categories():
     try:
-        response = requests.get("https://v17.api.carbonmark.com/categories")
-        response.raise_for_status()
-        data = response.json()
-        # Unpack the JSON to return a list of category names
-        categories = [category["id"] for category in data]
+        categories = await reference_cache.get("categories", fetch_categories)
         return JSONResponse(content={"categories": categories})
-    except requests.RequestException as e:
+    except CarbonmarkRequestError as e:
         return JSONResponse(content={"error": "Failed to fetch categories"}, status_code=500)
 
 # --- SEARCH ENDPOINT ---
 @app.get("/search")
 async def search_projects(
-	country: str = Query(None),
-	methodology: str = Query(None),
-	name: str = Query(None)
+    country: str = Query(None),
+    methodology: str = Query(None),
+    name: str = Query(None),
+    registry: str = Query(None),
+    page: int = Query(1, ge=1),
+    limit: int = Query(100, ge=1, le=500)
     ):
-	parameters = {"limit": 100, "minSupply": 1}
-	if country: parameters['country'] = country
-	if methodology: parameters['category'] = methodology
-	if name: parameters['name'] = name
-	# Stub: return dummy data
-	result = requests.get("https://v17.api.carbonmark.com/carbonProjects", params=parameters)
+    # Answer from the local catalog once the first sync has finished
+    if project_catalog.ready:
+        results = project_catalog.search(
+            country=country,
+            category=methodology,
+            registry=registry,
+            name=name,
+            page=page,
+            limit=limit
+        )
+        return JSONResponse(content=results)
+
+    parameters = {"limit": limit, "minSupply": 1}
+    if country: parameters['country'] = country
+    if methodology: parameters['category'] = methodology
+    if name: parameters['name'] = name
+    fallback_key = repr(sorted(parameters.items()))
+
+    try:
+        result = await carbonmark_client.get(f"{CARBONMARK_V17_API_URL}/carbonProjects", params=parameters)
+        result.raise_for_status()
+        data = result.json()
+        search_fallback_cache.set(fallback_key, data)
+        return JSONResponse(content=data)
+    except CarbonmarkRequestError as e:
+        # Degraded mode: serve the last good answer for the same filters
+        cached = search_fallback_cache.get(fallback_key)
+        if cached is not None:
+            print(f"Search upstream failed ({e}), serving last-known-good results")
+            return JSONResponse(content=cached.value, headers={"X-Degraded": "true"})
+        return JSONResponse(content={"error": "Failed to search projects"}, status_code=503)
 
-	return JSONResponse(content=result.json())
+@app.get("/search/catalog_status")
+async def catalog_status():
+    """Sync state of the local project catalog behind /search"""
+    return project_catalog.stats()
 
 # --- SUPPLIER SELECTION HELPER FUNCTION ---
+async def fetch_price_book(project_id: str):
+    """Fetch every Carbonmark price listing for a project, reusing a recent copy if cached"""
+    cached = price_book_cache.get(project_id)
+    if cached is not None:
+        print(f"Using cached price book for {project_id} ({price_book_cache.age(project_id):.1f}s old)")
+        return cached.value
+
+    # Get API key from environment
+    carbonmark_api_key = os.getenv("CARBONMARK_API_KEY")
+    if not carbonmark_api_key:
+        raise Exception("Carbonmark API key not configured")
+
+    headers = {
+        "Authorization": f"Bearer {carbonmark_api_key}",
+        "Content-Type": "application/json"
+    }
+
+    response = await carbonmark_client.get(
+        f"{CARBONMARK_API_URL}/prices",
+        params={"project": project_id},
+        headers=headers
+    )
+
+    print(f"Prices API Response Status: {response.status_code}")
+
+    if not response.ok:
+        error_detail = f"Prices API error: {response.status_code}"
+        try:
+            error_data = response.json()
+            error_detail += f" - {error_data.get('message', 'Unknown error')}"
+            print(f"API Error Response: {error_data}")
+        except:
+            error_detail += f" - {response.text}"
+            print(f"API Error Text: {response.text}")
+        raise Exception(error_detail)
+
+    sources = parse_price_response(response.json())
+    price_book_cache.set(project_id, sources)
+    return sources
+
 async def get_asset_prices_and_select_suppliers(project_id: str, quantity: float, expected_cost: float):
     """
-    Two-phase supplier selection approach:
-    1. First try to find a single supplier with minSupply=quantity that meets cost requirements
+    Two-phase supplier selection approach, evaluated against a single price book fetch:
+    1. First try to find a single supplier holding the whole quantity that meets cost requirements
     2. If unsuccessful, fall back to multi-supplier optimization
     """
     try:
-        # Get API key from environment
-        carbonmark_api_key = os.getenv("CARBONMARK_API_KEY")
-        if not carbonmark_api_key:
-            raise Exception("Carbonmark API key not configured")
-        
-        headers = {
-            "Authorization": f"Bearer {carbonmark_api_key}",
-            "Content-Type": "application/json"
-        }
-        
         print(f"Starting two-phase supplier selection for project: {project_id}")
         print(f"Requested quantity: {quantity}, Expected cost: ${expected_cost:.2f}")
-        
-        # PHASE 1: Try to find a single supplier that can fulfill the entire order
-        print("\n=== PHASE 1: Single supplier search ===")
-        print(f"Looking for suppliers with at least {quantity} tons in stock...")
-        
-        phase1_response = requests.get(
-            f"https://api.carbonmark.com/prices?project={project_id}&minSupply={quantity}",
-            headers=headers
-        )
-        
-        print(f"Phase 1 API Response Status: {phase1_response.status_code}")
-        
-        if phase1_response.ok:
-            phase1_data = phase1_response.json()
-            print(f"Phase 1 raw response: {phase1_data}")
-            print(f"Phase 1 response structure: {type(phase1_data)}")
-            if isinstance(phase1_data, list) and len(phase1_data) > 0:
-                print(f"First item structure: {phase1_data[0]}")
-                print(f"First item keys: {list(phase1_data[0].keys()) if isinstance(phase1_data[0], dict) else 'Not a dict'}")
-            elif isinstance(phase1_data, dict):
-                print(f"Dict keys: {list(phase1_data.keys())}")
-            
-            # Parse Phase 1 sources
-            phase1_sources = parse_sources_from_response(phase1_data)
-            print(f"Phase 1 found {len(phase1_sources)} suppliers with sufficient stock")
-            
-            # Filter by cost constraint and find the best single supplier
-            viable_single_suppliers = []
-            for source in phase1_sources:
-                total_cost_for_quantity = source.purchasePrice * quantity
-                if total_cost_for_quantity <= expected_cost:
-                    viable_single_suppliers.append((source, total_cost_for_quantity))
-                    print(f"  Viable supplier: {source.sourceId} - ${source.purchasePrice}/ton, total cost: ${total_cost_for_quantity:.2f}")
-            
-            if viable_single_suppliers:
-                # Sort by total cost and pick the cheapest
-                viable_single_suppliers.sort(key=lambda x: x[1])
-                best_supplier, best_cost = viable_single_suppliers[0]
-                
-                print(f"✓ Phase 1 SUCCESS: Found optimal single supplier")
-                print(f"  Supplier: {best_supplier.sourceId}")
-                print(f"  Price per ton: ${best_supplier.purchasePrice:.2f}")
-                print(f"  Total cost: ${best_cost:.2f}")
-                
-                # Create the selection with just this one supplier
-                selected_source = AssetSource(
-                    sourceId=best_supplier.sourceId,
-                    purchasePrice=best_supplier.purchasePrice,
-                    supply=quantity,  # Use the exact quantity we need
-                    poolName=best_supplier.poolName,
-                    assetPriceSourceId=best_supplier.assetPriceSourceId,
-                    listingId=best_supplier.listingId,
-                    pool=best_supplier.pool
-                )
-                
-                return SupplierSelection(
-                    selectedSources=[selected_source],
-                    totalCost=best_cost,
-                    totalSupply=quantity,
-                    canFulfillQuantity=True,
-                    costExceedsExpected=False
-                )
-            else:
-                print("✗ Phase 1 FAILED: No single supplier meets cost constraint")
-                # If no viable suppliers found in Phase 1, check if we even found any sources
-                if len(phase1_sources) == 0:
-                    print("✗ Phase 1 FAILED: No sources found in API response")
-        else:
-            print(f"✗ Phase 1 FAILED: API error {phase1_response.status_code}")
-        
-        # PHASE 2: Multi-supplier fallback
-        print(f"\n=== PHASE 2: Multi-supplier optimization ===")
-        print("Searching for multiple suppliers to combine orders...")
-        
-        phase2_response = requests.get(
-            f"https://api.carbonmark.com/prices?project={project_id}",
-            headers=headers
-        )
-        
-        print(f"Phase 2 API Response Status: {phase2_response.status_code}")
-        
-        if not phase2_response.ok:
-            error_detail = f"Both phases failed. Phase 2 API error: {phase2_response.status_code}"
-            try:
-                error_data = phase2_response.json()
-                error_detail += f" - {error_data.get('message', 'Unknown error')}"
-                print(f"API Error Response: {error_data}")
-            except:
-                error_detail += f" - {phase2_response.text}"
-                print(f"API Error Text: {phase2_response.text}")
-            raise Exception(error_detail)
-        
-        phase2_data = phase2_response.json()
-        print(f"Phase 2 raw response: {phase2_data}")
-        print(f"Phase 2 response structure: {type(phase2_data)}")
-        if isinstance(phase2_data, list) and len(phase2_data) > 0:
-            print(f"First item structure: {phase2_data[0]}")
-            print(f"First item keys: {list(phase2_data[0].keys()) if isinstance(phase2_data[0], dict) else 'Not a dict'}")
-        elif isinstance(phase2_data, dict):
-            print(f"Dict keys: {list(phase2_data.keys())}")
-        
-        # Parse Phase 2 sources
-        all_sources = parse_sources_from_response(phase2_data)
-        print(f"Phase 2 found {len(all_sources)} total suppliers")
-        
-        if not all_sources:
-            raise Exception("Issue returning listing - No asset sources found for this project")
-        
-        # Multi-supplier optimization: sort by price and combine optimally
-        all_sources.sort(key=lambda x: x.purchasePrice)
-        
-        selected_sources = []
-        total_supply = 0.0
-        total_cost = 0.0
-        
-        for source in all_sources:
-            if total_supply >= quantity:
-                break
-            
-            # Calculate how much we need from this source
-            needed_quantity = min(source.supply, quantity - total_supply)
-            
-            if needed_quantity > 0:
-                selected_source = AssetSource(
-                    sourceId=source.sourceId,
-                    purchasePrice=source.purchasePrice,
-                    supply=needed_quantity,
-                    poolName=source.poolName,
-                    assetPriceSourceId=source.assetPriceSourceId,
-                    listingId=source.listingId,
-                    pool=source.pool
-                )
-                selected_sources.append(selected_source)
-                
-                total_supply += needed_quantity
-                total_cost += needed_quantity * source.purchasePrice
-                
-                print(f"  Added supplier: {source.sourceId} - {needed_quantity} tons @ ${source.purchasePrice}/ton")
-        
-        # Final results
-        can_fulfill_quantity = total_supply >= quantity
-        cost_exceeds_expected = total_cost > expected_cost
-        
-        print(f"\n=== FINAL RESULTS ===")
-        print(f"Phase used: Multi-supplier (Phase 2)")
-        print(f"Suppliers selected: {len(selected_sources)}")
-        print(f"Total supply: {total_supply} tons")
-        print(f"Total cost: ${total_cost:.2f}")
-        print(f"Expected cost: ${expected_cost:.2f}")
-        print(f"Can fulfill quantity: {can_fulfill_quantity}")
-        print(f"Cost exceeds expected: {cost_exceeds_expected}")
-        
-        if cost_exceeds_expected and can_fulfill_quantity:
-            print("Note: Cost exceeds expected but quantity fulfilled as requested")
-        
-        return SupplierSelection(
-            selectedSources=selected_sources,
-            totalCost=total_cost,
-            totalSupply=total_supply,
-            canFulfillQuantity=can_fulfill_quantity,
-            costExceedsExpected=cost_exceeds_expected
-        )
-        
+
+        all_sources = await fetch_price_book(project_id)
+        print(f"Price book has {len(all_sources)} listings")
+
+        return select_suppliers(all_sources, quantity, expected_cost)
+
     except Exception as e:
         print(f"Error in supplier selection: {str(e)}")
         raise
 
-
-def parse_sources_from_response(prices_data):
-    """
-    Helper function to parse asset sources from Carbonmark API response.
-    Handles multiple response formats.
-    """
-    sources = []
-    
-    if isinstance(prices_data, list):
-        for item in prices_data:
-            print(f"Processing item: {item}")
-            print(f"Item keys: {list(item.keys()) if isinstance(item, dict) else 'Not a dict'}")
-            
-            # Check for direct Carbonmark API format (sourceId, purchasePrice, supply)
-            if 'sourceId' in item and 'purchasePrice' in item and 'supply' in item:
-                pool_name = ""
-                # Extract pool name from carbonPool if available
-                if 'carbonPool' in item and 'poolName' in item['carbonPool']:
-                    pool_name = item['carbonPool']['poolName']
-                elif 'poolName' in item:
-                    pool_name = item['poolName']
-                
-                sources.append(AssetSource(
-                    sourceId=item.get('sourceId', ''),
-                    purchasePrice=float(item.get('purchasePrice', 0)),
-                    supply=float(item.get('supply', 0)),
-                    poolName=pool_name,
-                    assetPriceSourceId=item.get('id') or item.get('assetPriceSourceId'),  # This might be the 'id' field
-                    listingId=item.get('listingId'),
-                    pool=item.get('pool') or pool_name
-                ))
-                print(f"  Added source: {item.get('sourceId')} - ${item.get('purchasePrice')}/ton, {item.get('supply')} tons")
-                print(f"    Additional fields: assetPriceSourceId={item.get('id')}, listingId={item.get('listingId')}, pool={item.get('pool') or pool_name}")
-            
-            # Legacy format: Direct source format with 'id', 'price', 'supply'
-            elif 'id' in item and 'price' in item and 'supply' in item:
-                sources.append(AssetSource(
-                    sourceId=item.get('id', ''),
-                    purchasePrice=float(item.get('price', 0)),
-                    supply=float(item.get('supply', 0)),
-                    poolName=item.get('poolName', item.get('pool', '')),
-                    assetPriceSourceId=item.get('id'),  # Use the id as assetPriceSourceId
-                    listingId=item.get('listingId'),
-                    pool=item.get('pool') or item.get('poolName', '')
-                ))
-                print(f"  Added legacy source: {item.get('id')} - ${item.get('price')}/ton, {item.get('supply')} tons")
-                print(f"    Additional fields: assetPriceSourceId={item.get('id')}, listingId={item.get('listingId')}, pool={item.get('pool') or item.get('poolName', '')}")
-            
-            # Nested sources format
-            elif 'sources' in item:
-                for source in item.get('sources', []):
-                    if 'sourceId' in source and 'purchasePrice' in source and 'supply' in source:
-                        sources.append(AssetSource(
-                            sourceId=source.get('sourceId', ''),
-                            purchasePrice=float(source.get('purchasePrice', 0)),
-                            supply=float(source.get('supply', 0)),
-                            poolName=source.get('poolName', ''),
-                            assetPriceSourceId=source.get('id') or source.get('assetPriceSourceId'),
-                            listingId=source.get('listingId'),
-                            pool=source.get('pool') or source.get('poolName', '')
-                        ))
-                    elif 'id' in source and 'price' in source and 'supply' in source:
-                        sources.append(AssetSource(
-                            sourceId=source.get('id', ''),
-                            purchasePrice=float(source.get('price', 0)),
-                            supply=float(source.get('supply', 0)),
-                            poolName=source.get('poolName', source.get('pool', '')),
-                            assetPriceSourceId=source.get('id'),
-                            listingId=source.get('listingId'),
-                            pool=source.get('pool') or source.get('poolName', '')
-                        ))
-    
-    elif isinstance(prices_data, dict):
-        # Sources array in dict
-        if 'sources' in prices_data:
-            for source in prices_data.get('sources', []):
-                if 'sourceId' in source and 'purchasePrice' in source and 'supply' in source:
-                    sources.append(AssetSource(
-                        sourceId=source.get('sourceId', ''),
-                        purchasePrice=float(source.get('purchasePrice', 0)),
-                        supply=float(source.get('supply', 0)),
-                        poolName=source.get('poolName', '')
-                    ))
-                elif 'id' in source and 'price' in source and 'supply' in source:
-                    sources.append(AssetSource(
-                        sourceId=source.get('id', ''),
-                        purchasePrice=float(source.get('price', 0)),
-                        supply=float(source.get('supply', 0)),
-                        poolName=source.get('poolName', source.get('pool', ''))
-                    ))
-        
-        # Dict is itself a source (Carbonmark format)
-        elif 'sourceId' in prices_data and 'purchasePrice' in prices_data and 'supply' in prices_data:
-            pool_name = ""
-            if 'carbonPool' in prices_data and 'poolName' in prices_data['carbonPool']:
-                pool_name = prices_data['carbonPool']['poolName']
-            elif 'poolName' in prices_data:
-                pool_name = prices_data['poolName']
-                
-            sources.append(AssetSource(
-                sourceId=prices_data.get('sourceId', ''),
-                purchasePrice=float(prices_data.get('purchasePrice', 0)),
-                supply=float(prices_data.get('supply', 0)),
-                poolName=pool_name,
-                assetPriceSourceId=prices_data.get('id') or prices_data.get('assetPriceSourceId'),
-                listingId=prices_data.get('listingId'),
-                pool=prices_data.get('pool') or pool_name
-            ))
-        
-        # Legacy dict format
-        elif 'id' in prices_data and 'price' in prices_data and 'supply' in prices_data:
-            sources.append(AssetSource(
-                sourceId=prices_data.get('id', ''),
-                purchasePrice=float(prices_data.get('price', 0)),
-                supply=float(prices_data.get('supply', 0)),
-                poolName=prices_data.get('poolName', prices_data.get('pool', '')),
-                assetPriceSourceId=prices_data.get('id'),
-                listingId=prices_data.get('listingId'),
-                pool=prices_data.get('pool') or prices_data.get('poolName', '')
-            ))
-        
-        # Data section
-        elif 'data' in prices_data:
-            data_section = prices_data['data']
-            if isinstance(data_section, list):
-                for item in data_section:
-                    if 'sourceId' in item and 'purchasePrice' in item and 'supply' in item:
-                        sources.append(AssetSource(
-                            sourceId=item.get('sourceId', ''),
-                            purchasePrice=float(item.get('purchasePrice', 0)),
-                            supply=float(item.get('supply', 0)),
-                            poolName=item.get('poolName', '')
-                        ))
-                    elif 'id' in item and 'price' in item and 'supply' in item:
-                        sources.append(AssetSource(
-                            sourceId=item.get('id', ''),
-                            purchasePrice=float(item.get('price', 0)),
-                            supply=float(item.get('supply', 0)),
-                            poolName=item.get('poolName', item.get('pool', ''))
-                        ))
-    
-    return sources
-
 # --- CARBONMARK QUOTE GENERATION HELPER ---
 async def generate_carbonmark_quote(selected_sources: list[AssetSource], retirement_details: dict):
     """
-    Generate a quote with Carbonmark API using selected sources
+    Generate a quote with Carbonmark API using selected sources.
+    The payload format the endpoint last accepted is tried first; the other
+    formats are only probed when it gets rejected.
     """
     try:
         carbonmark_api_key = os.getenv("CARBONMARK_API_KEY")
@@ -481,105 +331,34 @@ async def generate_carbonmark_quote(selected_sources: list[AssetSource], retirem
             "Content-Type": "application/json"
         }
         
-        # Prepare quote request for Carbonmark - try different structures
         source = selected_sources[0]  # Use the first source
         
-        # Try format 1: Direct fields with correct field names
-        quote_request_v1 = {
-            "asset_price_source_id": source.assetPriceSourceId or source.sourceId,
-            "listing_id": source.listingId or source.sourceId,
-            "pool": source.pool or source.poolName or "default",
-            "quantity_tonnes": str(source.supply),  # Use quantity_tonnes instead of quantity
-            "retirementDetails": retirement_details
-        }
-        
-        # Try format 2: Items array with correct field names
-        quote_request_v2 = {
-            "items": [{
-                "asset_price_source_id": source.assetPriceSourceId or source.sourceId,
-                "listing_id": source.listingId or source.sourceId,
-                "pool": source.pool or source.poolName or "default", 
-                "quantity_tonnes": str(source.supply)  # Use quantity_tonnes instead of quantity
-            }],
-            "retirementDetails": retirement_details
-        }
-        
-        # Try format 3: CamelCase field names with correct quantity field
-        quote_request_v3 = {
-            "assetPriceSourceId": source.assetPriceSourceId or source.sourceId,
-            "listingId": source.listingId or source.sourceId,
-            "pool": source.pool or source.poolName or "default",
-            "quantityTonnes": str(source.supply),  # Use quantityTonnes in camelCase
-            "retirementDetails": retirement_details
-        }
-        
-        # Try format 4: Just the essential fields as per error message
-        quote_request_v4 = {
-            "asset_price_source_id": source.assetPriceSourceId or source.sourceId,
-            "listing_id": source.listingId or source.sourceId,
-            "quantity_tonnes": str(source.supply)
-        }
-        
-        # Start with format 1
-        quote_request = quote_request_v1
-        
         print(f"Generating Carbonmark quote for single item")
-        print(f"Quote request payload (format 1): {quote_request}")
-        
-        # Try format 1 first
-        quote_response = requests.post(
-            "https://api.carbonmark.com/quotes",
-            headers=headers,
-            json=quote_request,
-            timeout=30
-        )
-        
-        print(f"Carbonmark quote API response status (format 1): {quote_response.status_code}")
         
-        # If format 1 fails, try format 2
-        if not quote_response.ok:
-            print("Format 1 failed, trying format 2 (items array)...")
-            quote_request = quote_request_v2
-            print(f"Quote request payload (format 2): {quote_request}")
-            
-            quote_response = requests.post(
-                "https://api.carbonmark.com/quotes", 
-                headers=headers,
-                json=quote_request,
-                timeout=30
-            )
-            
-            print(f"Carbonmark quote API response status (format 2): {quote_response.status_code}")
-        
-        # If format 2 fails, try format 3
-        if not quote_response.ok:
-            print("Format 2 failed, trying format 3 (camelCase fields)...")
-            quote_request = quote_request_v3
-            print(f"Quote request payload (format 3): {quote_request}")
-            
-            quote_response = requests.post(
-                "https://api.carbonmark.com/quotes",
-                headers=headers, 
-                json=quote_request,
-                timeout=30
-            )
-            
-            print(f"Carbonmark quote API response status (format 3): {quote_response.status_code}")
-        
-        # If format 3 fails, try format 4 (minimal fields only)
-        if not quote_response.ok:
-            print("Format 3 failed, trying format 4 (minimal fields only)...")
-            quote_request = quote_request_v4
-            print(f"Quote request payload (format 4): {quote_request}")
-            
-            quote_response = requests.post(
-                "https://api.carbonmark.com/quotes",
-                headers=headers, 
-                json=quote_request,
-                timeout=30
-            )
-            
-            print(f"Carbonmark quote API response status (format 4): {quote_response.status_code}")
+        quote_response = None
+        for format_name in quote_formats.probe_order():
+            quote_request = quote_formats.build(format_name, source, retirement_details)
+            print(f"Quote request payload (format {format_name}): {quote_request}")
+
+            started = time.monotonic()
+            try:
+                quote_response = await carbonmark_client.post(
+                    f"{CARBONMARK_API_URL}/quotes",
+                    headers=headers,
+                    json=quote_request,
+                    timeout=30
+                )
+            except CarbonmarkRequestError:
+                quote_formats.record(format_name, None, time.monotonic() - started)
+                raise
+            quote_formats.record(format_name, quote_response.status_code, time.monotonic() - started)
+
+            print(f"Carbonmark quote API response status (format {format_name}): {quote_response.status_code}")
+
+            # Only a rejected payload is worth retrying in another shape
+            if quote_response.ok or not quote_formats.is_rejection(quote_response.status_code):
+                break
+            print(f"Format {format_name} rejected, trying next format...")
         
         if not quote_response.ok:
             error_detail = f"Carbonmark quote API error: {quote_response.status_code}"
@@ -610,6 +389,84 @@ async def generate_carbonmark_quote(selected_sources: list[AssetSource], retirem
         # but order execution may fail
         return None
 
+# Creates the Carbonmark quote in the background while the user reviews ours
+quote_prewarmer = QuotePrewarmer(generate_carbonmark_quote)
+
+# --- QUOTE HELPERS ---
+def build_retirement_details(first_name: str, last_name: str, retirement_message: str) -> dict:
+    """Retirement details sent with the Carbonmark quote request"""
+    current_date = datetime.utcnow().strftime("%Y-%m-%d")
+    return {
+        "retiringEntityName": f"{first_name.strip()} {last_name.strip()}",
+        "retirementMessage": retirement_message.strip(),
+        "consumptionCountryCode": "US",
+        "consumptionPeriodStart": current_date,
+        "consumptionPeriodEnd": current_date
+    }
+
+async def store_quote(project_id: str, quantity: float, supplier_selection: SupplierSelection,
+                      retirement_details: Optional[dict] = None) -> str:
+    """
+    Store a quote for later validation during order execution and return its ID.
+    With retirement details, the Carbonmark quote is also started in the background.
+    """
+    # Generate a quote ID for tracking
+    quote_id = str(uuid.uuid4())
+
+    expires_at = datetime.utcnow() + timedelta(hours=1)  # Quote valid for 1 hour
+
+    prewarm = (
+        retirement_details is not None
+        and quote_prewarmer.enabled
+        and retirement_details["retiringEntityName"].strip() != ""
+        and retirement_details["retirementMessage"] != ""
+        and not carbonmark_client.circuit_open(f"{CARBONMARK_API_URL}/quotes")
+    )
+
+    quote = QuoteStorage(
+        quoteId=quote_id,
+        carbonmarkQuoteId=None,  # Pre-warmed below, or generated during purchase execution
+        carbonmarkQuoteStatus=PREWARM_PENDING if prewarm else None,
+        retirementFingerprint=retirement_fingerprint(retirement_details) if prewarm else None,
+        projectId=project_id,
+        quantity=quantity,
+        selectedSources=supplier_selection.selectedSources,
+        totalCost=supplier_selection.totalCost,
+        createdAt=datetime.utcnow(),
+        expiresAt=expires_at,
+        status="active"
+    )
+    await quote_storage.put(quote)
+    if prewarm:
+        quote_prewarmer.start(quote, retirement_details)
+    return quote_id
+
+def build_quote_data(quote_id: str, project_id: str, project_name: str, quantity: float, expected_cost: float,
+                     supplier_selection: SupplierSelection, price_book_age: float) -> dict:
+    """Quote summary returned to the client"""
+    return {
+        "quoteId": quote_id,
+        "projectId": project_id,
+        "projectName": project_name,
+        "quantity": quantity,
+        "expectedCost": expected_cost,
+        "actualCost": supplier_selection.totalCost,
+        "costExceedsExpected": supplier_selection.costExceedsExpected,
+        "validUntil": datetime.utcnow().isoformat() + "Z",  # Quote valid for implementation
+        "selectedSources": [
+            {
+                "sourceId": source.sourceId,
+                "poolName": source.poolName,
+                "quantity": source.supply,
+                "pricePerTon": source.purchasePrice,
+                "totalCost": source.supply * source.purchasePrice
+            }
+            for source in supplier_selection.selectedSources
+        ],
+        "priceBookAge": price_book_age,
+        "status": "quote_ready"
+    }
+
 # --- GET QUOTE ENDPOINT ---
 @app.post("/get_quote")
 async def get_quote(purchase_request: PurchaseRequest):
@@ -647,48 +504,28 @@ async def get_quote(purchase_request: PurchaseRequest):
                 detail=f"Insufficient supply available. Requested: {purchase_request.quantity}, Available: {supplier_selection.totalSupply}"
             )
         
-        # Generate a quote ID for tracking
-        import uuid
-        quote_id = str(uuid.uuid4())
-        
-        # Store the quote for later validation during order execution
-        from datetime import timedelta
-        expires_at = datetime.utcnow() + timedelta(hours=1)  # Quote valid for 1 hour
-        
-        quote_storage[quote_id] = QuoteStorage(
-            quoteId=quote_id,
-            carbonmarkQuoteId=None,  # Will be generated during purchase execution
-            projectId=purchase_request.projectId,
-            quantity=purchase_request.quantity,
-            selectedSources=supplier_selection.selectedSources,
-            totalCost=supplier_selection.totalCost,
-            createdAt=datetime.utcnow(),
-            expiresAt=expires_at,
-            status="active"
+        # Seconds since the prices behind this quote were fetched from Carbonmark
+        price_book_age = round(price_book_cache.age(purchase_request.projectId) or 0.0, 3)
+
+        retirement_details = build_retirement_details(
+            purchase_request.certificateFirstName,
+            purchase_request.certificateLastName,
+            purchase_request.retirementMessage
+        )
+        quote_id = await store_quote(
+            purchase_request.projectId, purchase_request.quantity, supplier_selection, retirement_details
         )
         
         # Prepare quote data
-        quote_data = {
-            "quoteId": quote_id,
-            "projectId": purchase_request.projectId,
-            "projectName": purchase_request.projectData.name,
-            "quantity": purchase_request.quantity,
-            "expectedCost": purchase_request.totalCost,
-            "actualCost": supplier_selection.totalCost,
-            "costExceedsExpected": supplier_selection.costExceedsExpected,
-            "validUntil": datetime.utcnow().isoformat() + "Z",  # Quote valid for implementation
-            "selectedSources": [
-                {
-                    "sourceId": source.sourceId,
-                    "poolName": source.poolName,
-                    "quantity": source.supply,
-                    "pricePerTon": source.purchasePrice,
-                    "totalCost": source.supply * source.purchasePrice
-                }
-                for source in supplier_selection.selectedSources
-            ],
-            "status": "quote_ready"
-        }
+        quote_data = build_quote_data(
+            quote_id,
+            purchase_request.projectId,
+            purchase_request.projectData.name,
+            purchase_request.quantity,
+            purchase_request.totalCost,
+            supplier_selection,
+            price_book_age
+        )
         
         # Determine appropriate message
         if supplier_selection.costExceedsExpected:
@@ -703,6 +540,7 @@ async def get_quote(purchase_request: PurchaseRequest):
             "quoteId": quote_id,
             "timestamp": datetime.utcnow(),
             "quote": quote_data,
+            "priceBookAge": price_book_age,
             "supplierSelection": supplier_selection
         }
         
@@ -715,14 +553,393 @@ async def get_quote(purchase_request: PurchaseRequest):
             detail=f"An error occurred while generating the quote: {str(e)}"
         )
 
+# --- BATCH QUOTE ENDPOINT ---
+@app.post("/get_quotes")
+async def get_quotes(batch_request: BatchQuoteRequest):
+    """
+    Quote many project/quantity pairs in one call.
+    Each distinct project's price book is fetched once, concurrently under a cap,
+    and every successful quote is stored for a later /purchase.
+    """
+    if not batch_request.items:
+        raise HTTPException(status_code=400, detail="At least one item is required")
+    if len(batch_request.items) > MAX_BATCH_QUOTE_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUOTE_ITEMS} items can be quoted at once")
+
+    concurrency = batch_request.maxConcurrency or BATCH_QUOTE_CONCURRENCY
+    semaphore = asyncio.Semaphore(max(1, min(concurrency, BATCH_QUOTE_CONCURRENCY)))
+
+    async def load_price_book(project_id: str):
+        async with semaphore:
+            return await fetch_price_book(project_id)
+
+    # Repeated project IDs share one price book fetch
+    project_ids = list(dict.fromkeys(item.projectId for item in batch_request.items))
+    price_books = dict(zip(
+        project_ids,
+        await asyncio.gather(*(load_price_book(project_id) for project_id in project_ids), return_exceptions=True)
+    ))
+    print(f"Batch quote: {len(batch_request.items)} items across {len(project_ids)} projects")
+
+    results = []
+    for index, item in enumerate(batch_request.items):
+        result = {"index": index, "projectId": item.projectId, "quantity": item.quantity}
+        price_book = price_books[item.projectId]
+        try:
+            if item.quantity <= 0:
+                raise ValueError("Quantity must be greater than 0")
+            if isinstance(price_book, BaseException):
+                raise ValueError(f"Failed to fetch asset prices: {price_book}")
+
+            supplier_selection = select_suppliers(price_book, item.quantity, item.totalCost)
+            if not supplier_selection.canFulfillQuantity:
+                raise ValueError(
+                    f"Insufficient supply available. Requested: {item.quantity}, Available: {supplier_selection.totalSupply}"
+                )
+
+            price_book_age = round(price_book_cache.age(item.projectId) or 0.0, 3)
+            quote_id = await store_quote(item.projectId, item.quantity, supplier_selection)
+            result.update({
+                "success": True,
+                "quoteId": quote_id,
+                "quote": build_quote_data(
+                    quote_id, item.projectId, item.projectName, item.quantity,
+                    item.totalCost, supplier_selection, price_book_age
+                )
+            })
+        except Exception as e:
+            result.update({"success": False, "error": str(e)})
+        results.append(result)
+
+    success_count = sum(1 for result in results if result["success"])
+    return {
+        "success": success_count == len(results),
+        "message": f"{success_count} of {len(results)} quotes generated",
+        "timestamp": datetime.utcnow(),
+        "quoteCount": success_count,
+        "failureCount": len(results) - success_count,
+        "results": results
+    }
+
 # --- PURCHASE ENDPOINT ---
+class OrderOutcomeUnknown(HTTPException):
+    """The order request was sent but Carbonmark did not say whether it was created"""
+
+    def __init__(self, detail: str):
+        super().__init__(
+            status_code=502,
+            detail=f"{detail}. The order may still have been placed, so this quote cannot be purchased again; "
+                   f"contact support with the quote ID before retrying."
+        )
+
+
+def reservation_time() -> datetime:
+    # Millisecond precision, as MongoDB stores it, so it can be matched in compare-and-set filters
+    now = datetime.utcnow()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def reservation_is_stale(quote: QuoteStorage) -> bool:
+    """A reservation whose purchase has outlived any possible run, e.g. after a worker crash"""
+    return quote.reservedAt is None or \
+        datetime.utcnow() - quote.reservedAt > timedelta(seconds=PURCHASE_RESERVATION_TIMEOUT)
+
+
+async def release_quote_reservation(quote_id: str, idempotency_key: str, reserved_at: datetime):
+    """Hand a reserved quote back so the purchase can be retried (only if no order was sent)"""
+    released = await quote_storage.compare_and_set_status(
+        quote_id, "reserved", "active", {"idempotencyKey": None, "reservedAt": None},
+        expected_fields={"reservedAt": reserved_at, "orderSentAt": None}
+    )
+    if released:
+        print(f"Released reservation on quote {quote_id} (key {idempotency_key})")
+
+
+async def mark_quote_outcome_unknown(quote_id: str, reserved_at: Optional[datetime]):
+    """Lock a quote whose order may exist upstream, so no retry can place it twice"""
+    if await quote_storage.compare_and_set_status(
+        quote_id, "reserved", "unknown", expected_fields={"reservedAt": reserved_at}
+    ):
+        print(f"WARNING: Order outcome for quote {quote_id} is unknown - quote locked for manual reconciliation")
+
+
+def outcome_unknown_error(quote_id: str) -> HTTPException:
+    return HTTPException(
+        status_code=409,
+        detail=f"An earlier purchase of quote {quote_id} may have placed the order with Carbonmark. "
+               f"Contact support before retrying."
+    )
+
+
 @app.post("/purchase", response_model=PurchaseResponse)
-async def execute_purchase(confirmation_request: PurchaseConfirmationRequest):
+async def execute_purchase(
+    confirmation_request: PurchaseConfirmationRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
     """
     Execute carbon credit purchase based on a confirmed quote.
     This calls the Carbonmark API to place the actual order.
+
+    The quote is reserved before the order is sent and marked used with the
+    response once it completes, so a repeated request with the same
+    Idempotency-Key (the quote ID when no header is sent) replays the stored
+    response instead of placing a second order.
     """
+    progress = PurchaseProgress(confirmation_request.quoteId)
     try:
+        purchase_response = await run_purchase(confirmation_request, response, idempotency_key, progress)
+    except HTTPException as e:
+        await progress.finish("failed", str(e.detail))
+        raise
+    await progress.finish()
+    return purchase_response
+
+# Streamed purchases keep running if the client disconnects; hold references until they finish
+streaming_purchases = set()
+
+@app.post("/purchase/stream")
+async def execute_purchase_stream(
+    confirmation_request: PurchaseConfirmationRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    followBlockchain: bool = Query(False, description="Keep streaming until the blockchain job finishes")
+):
+    """
+    Same as /purchase, reported as server-sent events: a "phase" event when each
+    phase starts and completes (with its duration), then "result" with the
+    PurchaseResponse or "error" with the status code and detail, and "done".
+    """
+    progress = StreamingPurchaseProgress(confirmation_request.quoteId)
+
+    async def run():
+        try:
+            response = Response()
+            try:
+                purchase_response = await run_purchase(confirmation_request, response, idempotency_key, progress)
+            except HTTPException as e:
+                await progress.finish("failed", str(e.detail))
+                await progress.emit("error", {"statusCode": e.status_code, "detail": e.detail})
+                return
+            await progress.finish()
+            await progress.emit("result", {
+                "replayed": response.headers.get("Idempotent-Replayed") == "true",
+                "purchase": purchase_response.model_dump(mode="json")
+            })
+            if followBlockchain and purchase_response.data.get("blockchainStatus"):
+                await follow_blockchain_job(purchase_response.orderId, progress)
+        except Exception as e:
+            print(f"Streaming purchase error: {e}")
+            await progress.emit("error", {"statusCode": 500, "detail": str(e)})
+        finally:
+            progress.close()
+
+    task = asyncio.create_task(run())
+    streaming_purchases.add(task)
+    task.add_done_callback(streaming_purchases.discard)
+
+    return StreamingResponse(
+        progress.events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def follow_blockchain_job(order_id: str, progress: StreamingPurchaseProgress):
+    """Emit a "blockchain" event whenever the order's job status changes, until it finishes"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + PURCHASE_STREAM_BLOCKCHAIN_WAIT
+    last_status = None
+    while loop.time() < deadline:
+        order = await get_order_by_order_id(order_id)
+        if order is not None:
+            status = job_status(order)
+            if status["status"] != last_status:
+                last_status = status["status"]
+                await progress.emit("blockchain", status)
+            if last_status in (JOB_SUCCEEDED, JOB_FAILED):
+                return
+        await asyncio.sleep(1)
+
+async def place_carbonmark_order(carbonmark_quote_id: str, full_name: str, retirement_message: str,
+                                 quantity: float, total_cost: float, carbonmark_api_key: str):
+    """
+    Retire credits against a Carbonmark quote UUID.
+    Returns the raw order response and its parsed CarbonmarkOrderResponse;
+    upstream failures are raised as HTTPException (502/503).
+    """
+    # Order request matching API documentation format
+    order_request_data = {
+        "quote_uuid": carbonmark_quote_id,
+        "beneficiary_name": full_name[:255],  # Truncate to max 255 chars
+        "retirement_message": retirement_message.strip()[:500],  # Truncate to max 500 chars
+        "consumption_metadata": {
+            "country_of_consumption_code": "string", #placeholders, we dont care abt this
+            "consumption_period_start": 0,
+            "consumption_period_end": 0
+        }
+    }
+    # Note: beneficiary_address is optional, so we're omitting it
+    
+    print(f"Order request created: {order_request_data}")
+    print(f"Field validation:")
+    print(f"  - quote_uuid: {len(carbonmark_quote_id)} chars")
+    print(f"  - beneficiary_name: '{full_name[:255]}' ({len(full_name)} chars)")
+    print(f"  - retirement_message: '{retirement_message.strip()[:50]}...' ({len(retirement_message.strip())} chars)")
+    print(f"  - country_code: US")
+    print(f"  - consumption_period: {int(datetime.utcnow().timestamp())}")
+    
+    print(f"Sending order to Carbonmark API using quote UUID: {carbonmark_quote_id}")
+    print(f"Order request data: {order_request_data}")
+    
+    # Execute order with Carbonmark API
+    headers = {
+        "Authorization": f"Bearer {carbonmark_api_key}",
+        "Content-Type": "application/json"
+    }
+    
+    # Send the order request
+    try:
+        carbonmark_response = await carbonmark_client.post(
+            f"{CARBONMARK_V17_API_URL}/orders",  # Using v17 endpoint as per documentation
+            headers=headers,
+            json=order_request_data,
+            timeout=30
+        )
+        
+        print(f"Carbonmark orders API response status: {carbonmark_response.status_code}")
+        print(f"Carbonmark orders API response headers: {dict(carbonmark_response.headers)}")
+    
+    except CircuitOpenError as circuit_error:
+        raise HTTPException(status_code=503, detail=str(circuit_error))
+    except CarbonmarkRequestError as req_error:
+        # The request may have reached Carbonmark before the connection failed
+        print(f"Request error when calling Carbonmark orders API: {req_error}")
+        raise OrderOutcomeUnknown(f"Network error when calling Carbonmark API: {str(req_error)}")
+    
+    if not carbonmark_response.ok:
+        error_detail = f"Carbonmark API error: {carbonmark_response.status_code}"
+        error_response_text = ""
+        
+        try:
+            error_data = carbonmark_response.json()
+            error_detail += f" - {error_data.get('message', error_data.get('detail', 'Unknown error'))}"
+            print(f"Carbonmark API Error Response: {error_data}")
+            
+            # Log specific validation errors if available
+            if 'errors' in error_data:
+                print(f"Validation errors: {error_data['errors']}")
+            if 'details' in error_data:
+                print(f"Error details: {error_data['details']}")
+                
+            error_response_text = str(error_data)
+        except Exception as json_error:
+            error_response_text = carbonmark_response.text
+            error_detail += f" - {error_response_text}"
+            print(f"Carbonmark API Error Text: {error_response_text}")
+            print(f"JSON parsing error: {json_error}")
+        
+        print(f"Request that failed:")
+        print(f"  URL: https://v17.api.carbonmark.com/orders")
+        print(f"  Headers: {headers}")
+        print(f"  Body: {order_request_data}")
+        
+        # Timeouts and server errors say nothing about whether the order was created
+        if carbonmark_response.status_code >= 500 or carbonmark_response.status_code == 408:
+            raise OrderOutcomeUnknown(f"Carbonmark did not confirm the order: {error_detail}")
+        raise HTTPException(
+            status_code=502,
+            detail=f"Failed to execute order with Carbonmark: {error_detail}"
+        )
+    
+    # Parse Carbonmark response
+    carbonmark_data = carbonmark_response.json()
+    print(f"Carbonmark order executed successfully: {carbonmark_data}")
+    
+    # Create response object - mapping the actual order response format
+    try:
+        # Extract fields from the actual order response structure
+        order_id = carbonmark_data.get('quote', {}).get('uuid') or carbonmark_data.get('id', 'unknown')
+        order_status = carbonmark_data.get('status', 'SUBMITTED')
+        created_at = carbonmark_data.get('created_at', str(datetime.utcnow()))
+        updated_at = carbonmark_data.get('updated_at', str(datetime.utcnow()))
+        
+        # Extract quote data
+        quote_data = carbonmark_data.get('quote', {})
+        total_quantity = str(quote_data.get('quantity_tonnes', quantity))
+        total_price = str(quote_data.get('cost_usdc', total_cost))
+        
+        carbonmark_order = CarbonmarkOrderResponse(
+            orderId=order_id,
+            orderStatus=order_status,
+            items=[],  # Items are embedded in quote data
+            createdAt=created_at,
+            updatedAt=updated_at,
+            totalCarbonQuantity=total_quantity,
+            totalPrice=total_price,
+            retirementDetails=carbonmark_data.get('consumption_metadata')
+        )
+        print(f"Successfully parsed Carbonmark response into model")
+        
+    except Exception as parse_error:
+        print(f"Error parsing Carbonmark response: {parse_error}")
+        print(f"Response data structure: {carbonmark_data}")
+        
+        # Create a basic response with available data
+        carbonmark_order = CarbonmarkOrderResponse(
+            orderId=str(carbonmark_data.get('quote', {}).get('uuid', 'unknown')),
+            orderStatus=carbonmark_data.get('status', 'SUBMITTED'),
+            items=[],
+            createdAt=str(datetime.utcnow()),
+            updatedAt=str(datetime.utcnow()),
+            totalCarbonQuantity=str(quantity),
+            totalPrice=str(total_cost),
+            retirementDetails=None
+        )
+
+    return carbonmark_data, carbonmark_order
+
+
+def build_order_history(user_id: Optional[str], carbonmark_order: CarbonmarkOrderResponse, carbonmark_data: dict,
+                        quote_id: Optional[str], carbonmark_quote_id: str, project_id: str,
+                        project_name: Optional[str], project_url: Optional[str], project_registry: Optional[str],
+                        quantity: float, total_cost: float, sources: list[AssetSource],
+                        certificate_name: str, retirement_message: str) -> dict:
+    """order_history record for a completed order, carrying its pending blockchain job"""
+    return {
+        "user_id": user_id,
+        "order_id": carbonmark_order.orderId,
+        "quote_id": quote_id,
+        "carbonmark_quote_id": carbonmark_quote_id,
+        "project_id": project_id,
+        "project_name": project_name,
+        "quantity": quantity,
+        "total_cost": total_cost,
+        "certificate_name": certificate_name,
+        "retirement_message": retirement_message.strip(),
+        "order_status": carbonmark_order.orderStatus,
+        "created_at": datetime.utcnow(),
+        "carbonmark_response": carbonmark_data,  # Store the full Carbonmark response
+        "sources": [source.model_dump() for source in sources],  # Add sources for blockchain save
+        "project_url": project_url,
+        "project_registry": project_registry,
+        **initial_job_fields()
+    }
+
+async def run_purchase(
+    confirmation_request: PurchaseConfirmationRequest,
+    response: Response,
+    idempotency_key: Optional[str],
+    progress: PurchaseProgress
+) -> PurchaseResponse:
+    """Purchase flow shared by /purchase and /purchase/stream"""
+    # Without an explicit key, one purchase per quote is the natural idempotency scope
+    idempotency_key = idempotency_key or confirmation_request.quoteId
+    reserved = False
+    reserved_at = None
+    order_sent = False
+    order_placed = False
+    try:
+        await progress.begin("validate")
+
         # Log the purchase confirmation
         print(f"Received purchase confirmation for quote: {confirmation_request.quoteId}")
         print(f"Certificate: {confirmation_request.certificateFirstName} {confirmation_request.certificateLastName}")
@@ -744,21 +961,69 @@ async def execute_purchase(confirmation_request: PurchaseConfirmationRequest):
         if not confirmation_request.retirementMessage.strip():
             raise HTTPException(status_code=400, detail="Retirement message is required")
         
+        # Fail fast instead of tying up the worker while Carbonmark is down
+        if carbonmark_client.circuit_open(f"{CARBONMARK_V17_API_URL}/orders") or \
+                carbonmark_client.circuit_open(f"{CARBONMARK_API_URL}/quotes"):
+            raise HTTPException(
+                status_code=503,
+                detail="Carbonmark is temporarily unavailable. Please try again shortly."
+            )
+
         # Retrieve and validate the quote
-        if confirmation_request.quoteId not in quote_storage:
+        stored_quote = await quote_storage.get(confirmation_request.quoteId)
+        if stored_quote is None:
             raise HTTPException(status_code=404, detail="Quote not found or expired")
-        
-        stored_quote = quote_storage[confirmation_request.quoteId]
+
+        # Repeated request for a purchase that already completed
+        replay = replay_purchase(stored_quote, idempotency_key, response)
+        if replay is not None:
+            return replay
         
         # Check if quote has expired
         if datetime.utcnow() > stored_quote.expiresAt:
             # Clean up expired quote
-            del quote_storage[confirmation_request.quoteId]
+            await quote_storage.delete(confirmation_request.quoteId)
             raise HTTPException(status_code=400, detail="Quote has expired. Please generate a new quote.")
         
         # Check if quote is still active
-        if stored_quote.status != "active":
+        if stored_quote.status == "unknown":
+            raise outcome_unknown_error(stored_quote.quoteId)
+        if stored_quote.status == "reserved":
+            if not reservation_is_stale(stored_quote):
+                raise HTTPException(
+                    status_code=409,
+                    detail="A purchase for this quote is already in progress",
+                    headers={"Retry-After": "2"}
+                )
+            if stored_quote.orderSentAt is not None:
+                # The abandoned purchase got as far as sending the order
+                await mark_quote_outcome_unknown(stored_quote.quoteId, stored_quote.reservedAt)
+                raise outcome_unknown_error(stored_quote.quoteId)
+            print(f"Reclaiming stale reservation on quote {stored_quote.quoteId} from {stored_quote.reservedAt}")
+        elif stored_quote.status != "active":
             raise HTTPException(status_code=400, detail="Quote is no longer valid")
+
+        # Reserve the quote before anything reaches Carbonmark; only one request can win this.
+        # Matching reservedAt and orderSentAt lets exactly one request take over a stale reservation.
+        await progress.begin("reserve")
+        reserved_at = reservation_time()
+        reserved = await quote_storage.compare_and_set_status(
+            stored_quote.quoteId, stored_quote.status, "reserved",
+            {"idempotencyKey": idempotency_key, "reservedAt": reserved_at},
+            expected_fields={"reservedAt": stored_quote.reservedAt, "orderSentAt": None}
+        )
+        if not reserved:
+            # Lost the race - the winner may already have finished
+            current = await quote_storage.get(stored_quote.quoteId)
+            replay = replay_purchase(current, idempotency_key, response) if current else None
+            if replay is not None:
+                return replay
+            raise HTTPException(
+                status_code=409,
+                detail="A purchase for this quote is already in progress",
+                headers={"Retry-After": "2"}
+            )
+        stored_quote.status = "reserved"
         
         print(f"Quote validated: {stored_quote.quoteId} for project {stored_quote.projectId}")
         
@@ -768,16 +1033,24 @@ async def execute_purchase(confirmation_request: PurchaseConfirmationRequest):
             raise HTTPException(status_code=500, detail="Carbonmark API key not configured")
         
         # Prepare retirement details for Carbonmark quote
+        await progress.begin("carbonmark_quote")
         full_name = f"{confirmation_request.certificateFirstName.strip()} {confirmation_request.certificateLastName.strip()}"
-        current_date = datetime.utcnow().strftime("%Y-%m-%d")
-        
-        retirement_details = {
-            "retiringEntityName": full_name,
-            "retirementMessage": confirmation_request.retirementMessage.strip(),
-            "consumptionCountryCode": "US",
-            "consumptionPeriodStart": current_date,
-            "consumptionPeriodEnd": current_date
-        }
+        retirement_details = build_retirement_details(
+            confirmation_request.certificateFirstName,
+            confirmation_request.certificateLastName,
+            confirmation_request.retirementMessage
+        )
+        fingerprint = retirement_fingerprint(retirement_details)
+
+        # The Carbonmark quote was started at /get_quote - only wait if it is still in flight
+        if stored_quote.carbonmarkQuoteStatus == PREWARM_PENDING:
+            stored_quote = await quote_prewarmer.wait(stored_quote)
+            await quote_prewarmer.cancel(stored_quote.quoteId)
+
+        # An upstream quote made with other retirement details cannot be used for this order
+        if stored_quote.carbonmarkQuoteId and stored_quote.retirementFingerprint != fingerprint:
+            print(f"Retirement details changed since quote {stored_quote.quoteId}; regenerating Carbonmark quote")
+            stored_quote.carbonmarkQuoteId = None
         
         # Generate Carbonmark quote UUID if we don't have one
         if not stored_quote.carbonmarkQuoteId:
@@ -789,9 +1062,18 @@ async def execute_purchase(confirmation_request: PurchaseConfirmationRequest):
                     detail="Failed to generate Carbonmark quote. Order cannot be executed."
                 )
             stored_quote.carbonmarkQuoteId = carbonmark_quote_id
+            stored_quote.retirementFingerprint = fingerprint
+            await quote_storage.update(stored_quote.quoteId, {
+                "carbonmarkQuoteId": carbonmark_quote_id,
+                "carbonmarkQuoteStatus": PREWARM_READY,
+                "retirementFingerprint": fingerprint
+            })
             print(f"Generated Carbonmark quote ID: {carbonmark_quote_id}")
+        else:
+            print(f"Using pre-warmed Carbonmark quote ID: {stored_quote.carbonmarkQuoteId}")
         
         # Create proper order request as per Carbonmark API docs
+        await progress.begin("order")
         print(f"Creating order request with quote UUID: {stored_quote.carbonmarkQuoteId}")
         
         # Validate required fields before creating request
@@ -802,171 +1084,73 @@ async def execute_purchase(confirmation_request: PurchaseConfirmationRequest):
         if not confirmation_request.retirementMessage.strip() or len(confirmation_request.retirementMessage.strip()) < 1:
             raise HTTPException(status_code=400, detail="Retirement message is required")
 
-        # Order request matching API documentation format
-        order_request_data = {
-            "quote_uuid": stored_quote.carbonmarkQuoteId,
-            "beneficiary_name": full_name[:255],  # Truncate to max 255 chars
-            "retirement_message": confirmation_request.retirementMessage.strip()[:500],  # Truncate to max 500 chars
-            "consumption_metadata": {
-                "country_of_consumption_code": "string", #placeholders, we dont care abt this
-                "consumption_period_start": 0,
-                "consumption_period_end": 0
-            }
-        }
-        # Note: beneficiary_address is optional, so we're omitting it
-        
-        print(f"Order request created: {order_request_data}")
-        print(f"Field validation:")
-        print(f"  - quote_uuid: {len(stored_quote.carbonmarkQuoteId)} chars")
-        print(f"  - beneficiary_name: '{full_name[:255]}' ({len(full_name)} chars)")
-        print(f"  - retirement_message: '{confirmation_request.retirementMessage.strip()[:50]}...' ({len(confirmation_request.retirementMessage.strip())} chars)")
-        print(f"  - country_code: US")
-        print(f"  - consumption_period: {int(datetime.utcnow().timestamp())}")
-        
-        print(f"Sending order to Carbonmark API using quote UUID: {stored_quote.carbonmarkQuoteId}")
-        print(f"Order request data: {order_request_data}")
-        
-        # Execute order with Carbonmark API
-        headers = {
-            "Authorization": f"Bearer {carbonmark_api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        # Send the order request
-        try:
-            carbonmark_response = requests.post(
-                "https://v17.api.carbonmark.com/orders",  # Using v17 endpoint as per documentation
-                headers=headers,
-                json=order_request_data,
-                timeout=30
-            )
-            
-            print(f"Carbonmark orders API response status: {carbonmark_response.status_code}")
-            print(f"Carbonmark orders API response headers: {dict(carbonmark_response.headers)}")
-        
-        except requests.exceptions.RequestException as req_error:
-            print(f"Request error when calling Carbonmark orders API: {req_error}")
-            raise HTTPException(
-                status_code=502,
-                detail=f"Network error when calling Carbonmark API: {str(req_error)}"
-            )
-        
-        if not carbonmark_response.ok:
-            error_detail = f"Carbonmark API error: {carbonmark_response.status_code}"
-            error_response_text = ""
-            
-            try:
-                error_data = carbonmark_response.json()
-                error_detail += f" - {error_data.get('message', error_data.get('detail', 'Unknown error'))}"
-                print(f"Carbonmark API Error Response: {error_data}")
-                
-                # Log specific validation errors if available
-                if 'errors' in error_data:
-                    print(f"Validation errors: {error_data['errors']}")
-                if 'details' in error_data:
-                    print(f"Error details: {error_data['details']}")
-                    
-                error_response_text = str(error_data)
-            except Exception as json_error:
-                error_response_text = carbonmark_response.text
-                error_detail += f" - {error_response_text}"
-                print(f"Carbonmark API Error Text: {error_response_text}")
-                print(f"JSON parsing error: {json_error}")
-            
-            print(f"Request that failed:")
-            print(f"  URL: https://v17.api.carbonmark.com/orders")
-            print(f"  Headers: {headers}")
-            print(f"  Body: {order_request_data}")
-            
+        # Record that the order is going out while we still hold the reservation; from here
+        # on a failure leaves the quote locked as "unknown" instead of released
+        if not await quote_storage.compare_and_set_status(
+            stored_quote.quoteId, "reserved", "reserved", {"orderSentAt": datetime.utcnow()},
+            expected_fields={"reservedAt": reserved_at}
+        ):
+            reserved = False
             raise HTTPException(
-                status_code=502,
-                detail=f"Failed to execute order with Carbonmark: {error_detail}"
+                status_code=409,
+                detail="The reservation on this quote was taken over by another purchase",
+                headers={"Retry-After": "2"}
             )
-        
-        # Parse Carbonmark response
-        carbonmark_data = carbonmark_response.json()
-        print(f"Carbonmark order executed successfully: {carbonmark_data}")
-        
-        # Create response object - mapping the actual order response format
+        order_sent = True
         try:
-            # Extract fields from the actual order response structure
-            order_id = carbonmark_data.get('quote', {}).get('uuid') or carbonmark_data.get('id', 'unknown')
-            order_status = carbonmark_data.get('status', 'SUBMITTED')
-            created_at = carbonmark_data.get('created_at', str(datetime.utcnow()))
-            updated_at = carbonmark_data.get('updated_at', str(datetime.utcnow()))
-            
-            # Extract quote data
-            quote_data = carbonmark_data.get('quote', {})
-            total_quantity = str(quote_data.get('quantity_tonnes', stored_quote.quantity))
-            total_price = str(quote_data.get('cost_usdc', stored_quote.totalCost))
-            
-            carbonmark_order = CarbonmarkOrderResponse(
-                orderId=order_id,
-                orderStatus=order_status,
-                items=[],  # Items are embedded in quote data
-                createdAt=created_at,
-                updatedAt=updated_at,
-                totalCarbonQuantity=total_quantity,
-                totalPrice=total_price,
-                retirementDetails=carbonmark_data.get('consumption_metadata')
+            carbonmark_data, carbonmark_order = await place_carbonmark_order(
+                stored_quote.carbonmarkQuoteId,
+                full_name,
+                confirmation_request.retirementMessage,
+                stored_quote.quantity,
+                stored_quote.totalCost,
+                carbonmark_api_key
             )
-            print(f"Successfully parsed Carbonmark response into model")
-            
-        except Exception as parse_error:
-            print(f"Error parsing Carbonmark response: {parse_error}")
-            print(f"Response data structure: {carbonmark_data}")
-            
-            # Create a basic response with available data
-            carbonmark_order = CarbonmarkOrderResponse(
-                orderId=str(carbonmark_data.get('quote', {}).get('uuid', 'unknown')),
-                orderStatus=carbonmark_data.get('status', 'SUBMITTED'),
-                items=[],
-                createdAt=str(datetime.utcnow()),
-                updatedAt=str(datetime.utcnow()),
-                totalCarbonQuantity=str(stored_quote.quantity),
-                totalPrice=str(stored_quote.totalCost),
-                retirementDetails=None
-            )
-        
-        # Mark quote as used
-        stored_quote.status = "used"
+        except HTTPException as order_error:
+            # Rejected by Carbonmark or never sent (circuit open): safe to release
+            if not isinstance(order_error, OrderOutcomeUnknown):
+                order_sent = False
+                await quote_storage.update(stored_quote.quoteId, {"orderSentAt": None})
+            raise
+        
+        # From here on the order exists upstream, so the reservation must never be released
+        order_placed = True
+
+        # Listings for this project just changed upstream
+        price_book_cache.invalidate(stored_quote.projectId)
         
         # Save order to history database
+        await progress.begin("history")
         full_certificate_name = f"{confirmation_request.certificateFirstName.strip()} {confirmation_request.certificateLastName.strip()}"
         
+        blockchain_status = None
         try:
-            # Create order history record
-            order_history_data = {
-                "user_id": confirmation_request.userId,
-                "order_id": carbonmark_order.orderId,
-                "quote_id": confirmation_request.quoteId,
-                "carbonmark_quote_id": stored_quote.carbonmarkQuoteId,
-                "project_id": stored_quote.projectId,
-                "project_name": project_name,  # Use project name from request
-                "quantity": stored_quote.quantity,
-                "total_cost": stored_quote.totalCost,
-                "certificate_name": full_certificate_name,
-                "retirement_message": confirmation_request.retirementMessage.strip(),
-                "order_status": carbonmark_order.orderStatus,
-                "created_at": datetime.utcnow(),
-                "carbonmark_response": carbonmark_data,  # Store the full Carbonmark response
-                "sources": stored_quote.selectedSources  # Add sources for blockchain save
-            }
+            # Create order history record; it also carries the pending blockchain job
+            order_history_data = build_order_history(
+                user_id=confirmation_request.userId,
+                carbonmark_order=carbonmark_order,
+                carbonmark_data=carbonmark_data,
+                quote_id=confirmation_request.quoteId,
+                carbonmark_quote_id=stored_quote.carbonmarkQuoteId,
+                project_id=stored_quote.projectId,
+                project_name=project_name,  # Use project name from request
+                project_url=project_url,
+                project_registry=project_registry,
+                quantity=stored_quote.quantity,
+                total_cost=stored_quote.totalCost,
+                sources=stored_quote.selectedSources,
+                certificate_name=full_certificate_name,
+                retirement_message=confirmation_request.retirementMessage
+            )
             
             # Save to database
             history_id = await save_order_to_history(order_history_data)
             print(f"Order saved to history with ID: {history_id}")
 
-            # Save to blockchain with project data
-            blockchain_record = await save_order_to_blockchain(
-                order_history_data, 
-                project_id, 
-                project_name, 
-                project_url, 
-                project_registry,
-                confirmation_request.userId
-            )
-            print(f"Order saved to blockchain: {blockchain_record}")
+            # Recording on chain takes several transactions - the job worker does it after we respond
+            if history_id:
+                blockchain_status = order_history_data["blockchain_status"]
+                blockchain_jobs.notify()
             
         except Exception as save_error:
             # Don't fail the order if we can't save to history
@@ -975,7 +1159,7 @@ async def execute_purchase(confirmation_request: PurchaseConfirmationRequest):
         # Prepare successful response
         full_certificate_name = f"{confirmation_request.certificateFirstName.strip()} {confirmation_request.certificateLastName.strip()}"
         
-        return PurchaseResponse(
+        purchase_response = PurchaseResponse(
             success=True,
             message=f"Carbon credit purchase completed successfully! Order ID: {carbonmark_order.orderId}",
             orderId=carbonmark_order.orderId,
@@ -993,14 +1177,25 @@ async def execute_purchase(confirmation_request: PurchaseConfirmationRequest):
                 "createdAt": carbonmark_order.createdAt,
                 "sourceCount": len(stored_quote.selectedSources),
                 "sources": stored_quote.selectedSources,
+                "blockchainStatus": blockchain_status,
                 "executionTimestamp": datetime.utcnow().isoformat()
             },
             carbonmarkOrder=carbonmark_order
         )
+
+        # Commit: mark the quote used and keep the response for replays
+        if not await quote_storage.compare_and_set_status(
+            stored_quote.quoteId, "reserved", "used",
+            {"purchaseResponse": purchase_response.model_dump(mode="json")}
+        ):
+            print(f"Warning: quote {stored_quote.quoteId} was no longer reserved when marking it used")
+        stored_quote.status = "used"
+
+        return purchase_response
         
     except HTTPException:
         raise
-    except requests.RequestException as e:
+    except CarbonmarkRequestError as e:
         print(f"Network error during order execution: {str(e)}")
         raise HTTPException(
             status_code=502, 
@@ -1012,137 +1207,370 @@ async def execute_purchase(confirmation_request: PurchaseConfirmationRequest):
             status_code=500, 
             detail=f"An error occurred while executing the purchase: {str(e)}"
         )
+    finally:
+        if reserved and not order_placed:
+            if order_sent:
+                await mark_quote_outcome_unknown(confirmation_request.quoteId, reserved_at)
+            else:
+                await release_quote_reservation(confirmation_request.quoteId, idempotency_key, reserved_at)
+
 
-async def save_order_to_blockchain(order_data: dict, project_id: str, project_name: str, project_url: str, project_registry: str, user_id: str):
+def replay_purchase(stored_quote: QuoteStorage, idempotency_key: str, response: Response) -> Optional[PurchaseResponse]:
+    """Stored response for a completed purchase with this key, or None"""
+    if stored_quote.status != "used" or stored_quote.idempotencyKey != idempotency_key:
+        return None
+    if stored_quote.purchaseResponse is None:
+        return None
+    print(f"Replaying stored purchase response for quote {stored_quote.quoteId} (key {idempotency_key})")
+    response.headers["Idempotent-Replayed"] = "true"
+    return PurchaseResponse.model_validate(stored_quote.purchaseResponse)
+
+async def save_order_to_blockchain(order_data: dict, checkpoint) -> dict:
     """
-    Save order data to blockchain with proper user email lookup
+    Save order data to blockchain with proper user email lookup.
+
+    Runs as a blockchain job: raises on failure so the job is retried, and
+    checkpoints progress on the order so a retry does not propose or fund the
+    same project twice.
     """
-    try:
-        # Get user details from database to extract email
-        user = await get_user_by_id(user_id)
-        funder_email = user.get('email', 'unknown@email.com') if user else user_id
-        
-        print(f"Blockchain save - User lookup: {user_id} -> {funder_email}")
-        
-        # Get supplier names from selected sources for beneficiary_id
-        sources = order_data.get("sources", [])
-        if isinstance(sources, list) and len(sources) > 0:
-            # Use the first supplier's pool name or source ID
-            first_source = sources[0]
-            if hasattr(first_source, 'poolName') and first_source.poolName:
-                beneficiary_id = first_source.poolName
-            elif hasattr(first_source, 'sourceId'):
-                beneficiary_id = first_source.sourceId
-            else:
-                beneficiary_id = "UNKNOWN_SUPPLIER"
-        else:
-            beneficiary_id = "UNKNOWN_SUPPLIER"
-        if not project_registry:
-            project_registry = "UNKNOWN_REGISTRY"
+    user_id = order_data.get("user_id")
+    project_name = order_data.get("project_name")
+    project_url = order_data.get("project_url")
+    project_registry = order_data.get("project_registry")
 
-        if await get_user_by_id(f"{beneficiary_id}@{beneficiary_id}.com") is None:
-            try:
-                await create_user(UserSignup(
-                    email=f"{beneficiary_id}@{beneficiary_id}.com",
-                    password="supplier",
-                    first_name=beneficiary_id,
-                    last_name=""
-                ))
-            except ValueError as error:
-                pass
+    # Get user details from database to extract email
+    user = await get_user_by_id(user_id)
+    funder_email = user.get('email', 'unknown@email.com') if user else user_id
+    
+    print(f"Blockchain save - User lookup: {user_id} -> {funder_email}")
+    
+    # Get supplier names from selected sources for beneficiary_id
+    sources = order_data.get("sources", [])
+    if isinstance(sources, list) and len(sources) > 0:
+        # Use the first supplier's pool name or source ID
+        first_source = sources[0]
+        beneficiary_id = first_source.get("poolName") or first_source.get("sourceId") or "UNKNOWN_SUPPLIER"
+    else:
+        beneficiary_id = "UNKNOWN_SUPPLIER"
+    if not project_registry:
+        project_registry = "UNKNOWN_REGISTRY"
 
+    if await get_user_by_id(f"{beneficiary_id}@{beneficiary_id}.com") is None:
+        try:
+            await create_user(UserSignup(
+                email=f"{beneficiary_id}@{beneficiary_id}.com",
+                password="supplier",
+                first_name=beneficiary_id,
+                last_name=""
+            ))
+        except ValueError as error:
+            pass
 
-        if await get_user_by_id(f"{project_registry}@{project_registry}.com") is None:
-            try:
-                await create_user(UserSignup(
-                    email=f"{project_registry}@{project_registry}.com",
-                    password="registry",
-                    first_name=project_registry,
-                    last_name=""
-                ))
-            except ValueError as error:
-                pass
-
-        amount = float(order_data.get("quantity", 0))
-        amount /= ETH2DOLLAR
-        # Create blockchain record with proper data
-        order_record = {
-            "proposer_id": funder_email,  # User's email from database
-            "beneficiary_id": f"{beneficiary_id}@{beneficiary_id}.com",  # Supplier pool/source name
-            "verifier_id": f"{project_registry}@{project_registry}.com",
-            "initiative": project_name or "Unknown Project",
-            "metadata_uri": project_url or "https://dayof.pennapps.com/",
-            "goal": amount  # Convert to float
-        }
-        
 
-        print(f"Blockchain record created: {order_record}")
+    if await get_user_by_id(f"{project_registry}@{project_registry}.com") is None:
+        try:
+            await create_user(UserSignup(
+                email=f"{project_registry}@{project_registry}.com",
+                password="registry",
+                first_name=project_registry,
+                last_name=""
+            ))
+        except ValueError as error:
+            pass
+
+    amount = float(order_data.get("quantity", 0))
+    amount /= ETH2DOLLAR
+    # Create blockchain record with proper data
+    order_record = {
+        "proposer_id": funder_email,  # User's email from database
+        "beneficiary_id": f"{beneficiary_id}@{beneficiary_id}.com",  # Supplier pool/source name
+        "verifier_id": f"{project_registry}@{project_registry}.com",
+        "initiative": project_name or "Unknown Project",
+        "metadata_uri": project_url or "https://dayof.pennapps.com/",
+        "goal": amount  # Convert to float
+    }
+    
+
+    print(f"Blockchain record created: {order_record}")
 
-        response = requests.post(f"{BLOCKCHAIN_API_URL}/propose", json=order_record)
+    # The blockchain API blocks until each transaction is mined, so keep it off the event loop
+    project_address = order_data.get("blockchain_project_address")
+    if not project_address:
+        response = await asyncio.to_thread(
+            requests.post, f"{BLOCKCHAIN_API_URL}/propose", json=order_record, timeout=BLOCKCHAIN_TIMEOUT
+        )
         response.raise_for_status()
 
         # Get the newly created project address
-        projects_response = requests.get(f"{BLOCKCHAIN_API_URL}/projects")
+        projects_response = await asyncio.to_thread(
+            requests.get, f"{BLOCKCHAIN_API_URL}/projects", timeout=BLOCKCHAIN_TIMEOUT
+        )
+        projects_response.raise_for_status()
         projects = projects_response.json()["projects"]
         project_address = projects[-1]  # Get the latest project
+        await checkpoint({"blockchain_project_address": project_address})
+    print(project_address)
 
+    if not order_data.get("blockchain_funded"):
         funder_payload = {
             "user_id": funder_email,
             "project_address": project_address,
             "amount": str(amount)
         }
-        print(project_address)
-
-        response = requests.post(f"{BLOCKCHAIN_API_URL}/fund", json=funder_payload)
+        response = await asyncio.to_thread(
+            requests.post, f"{BLOCKCHAIN_API_URL}/fund", json=funder_payload, timeout=BLOCKCHAIN_TIMEOUT
+        )
         response.raise_for_status()
+        await checkpoint({"blockchain_funded": True})
 
-        verify_payload = {
-            "verifier_id": f"{project_registry}@{project_registry}.com",
-            "project_address": project_address,
-        }
+    verify_payload = {
+        "verifier_id": f"{project_registry}@{project_registry}.com",
+        "project_address": project_address,
+    }
 
-        response = requests.post(f"{BLOCKCHAIN_API_URL}/verify", json=verify_payload)
-        response.raise_for_status()
-        print("Funding successful")
+    response = await asyncio.to_thread(
+        requests.post, f"{BLOCKCHAIN_API_URL}/verify", json=verify_payload, timeout=BLOCKCHAIN_TIMEOUT
+    )
+    response.raise_for_status()
+    print("Funding successful")
 
-        return order_record
-        
+    return order_record
+
+# On-chain recording of completed orders, persisted on their order_history records
+blockchain_jobs = BlockchainJobQueue(save_order_to_blockchain)
+
+# --- BULK RETIREMENT ENDPOINT ---
+# Running bulk retirements, held so they finish even if the client disconnects
+bulk_retirements = set()
+
+@app.post("/bulk_retire")
+async def bulk_retire(bulk_request: BulkRetirementRequest):
+    """
+    Retire credits for many beneficiaries in one call, reported as server-sent events.
+    Items are grouped by project so each price book is fetched once and its listings
+    are allocated across that project's items. Each order still gets its own Carbonmark
+    quote: a quote carries the beneficiary, message and tonnes of one order and is
+    consumed by it. Orders then run concurrently, paced by a shared rate limit, with
+    an "item" event as each one finishes. Completed orders are written to
+    order_history in one batch before the "summary" event.
+    """
+    items = bulk_request.items
+    if not items:
+        raise HTTPException(status_code=400, detail="At least one item is required")
+    if len(items) > MAX_BULK_RETIREMENT_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_RETIREMENT_ITEMS} items can be retired at once")
+    if carbonmark_client.circuit_open(f"{CARBONMARK_V17_API_URL}/orders") or \
+            carbonmark_client.circuit_open(f"{CARBONMARK_API_URL}/quotes"):
+        raise HTTPException(status_code=503, detail="Carbonmark is temporarily unavailable. Please try again shortly.")
+    carbonmark_api_key = os.getenv("CARBONMARK_API_KEY")
+    if not carbonmark_api_key:
+        raise HTTPException(status_code=500, detail="Carbonmark API key not configured")
+
+    bulk_id = str(uuid.uuid4())
+    concurrency = max(1, min(bulk_request.maxConcurrency or BULK_RETIREMENT_CONCURRENCY, BULK_RETIREMENT_CONCURRENCY))
+    stream = EventStream()
+
+    task = asyncio.create_task(run_bulk_retirement(bulk_id, bulk_request, concurrency, carbonmark_api_key, stream))
+    bulk_retirements.add(task)
+    task.add_done_callback(bulk_retirements.discard)
+
+    return StreamingResponse(
+        stream.events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Bulk-Id": bulk_id}
+    )
+
+async def run_bulk_retirement(bulk_id: str, bulk_request: BulkRetirementRequest, concurrency: int,
+                              carbonmark_api_key: str, stream: EventStream):
+    items = bulk_request.items
+    history = []
+    succeeded = 0
+    total_quantity = 0.0
+    total_cost = 0.0
+    semaphore = asyncio.Semaphore(concurrency)
+    print(f"Bulk retirement {bulk_id}: {len(items)} items, concurrency {concurrency}")
+
+    async def emit_failure(index: int, detail: str):
+        item = items[index]
+        await stream.emit("item", {
+            "index": index, "projectId": item.projectId, "quantity": item.quantity,
+            "success": False, "error": detail
+        })
+
+    async def retire(index: int, selection: SupplierSelection):
+        nonlocal succeeded, total_quantity, total_cost
+        item = items[index]
+        async with semaphore:
+            await bulk_order_limiter.acquire()
+            started = time.monotonic()
+            try:
+                retirement_details = build_retirement_details(
+                    item.certificateFirstName, item.certificateLastName, item.retirementMessage
+                )
+                carbonmark_quote_id = await generate_carbonmark_quote(selection.selectedSources, retirement_details)
+                if not carbonmark_quote_id:
+                    raise HTTPException(status_code=500, detail="Failed to generate Carbonmark quote")
+                carbonmark_data, carbonmark_order = await place_carbonmark_order(
+                    carbonmark_quote_id,
+                    retirement_details["retiringEntityName"],
+                    item.retirementMessage,
+                    item.quantity,
+                    selection.totalCost,
+                    carbonmark_api_key
+                )
+            except HTTPException as e:
+                await emit_failure(index, str(e.detail))
+                return
+            except Exception as e:
+                await emit_failure(index, str(e))
+                return
+
+        record = build_order_history(
+            user_id=bulk_request.userId,
+            carbonmark_order=carbonmark_order,
+            carbonmark_data=carbonmark_data,
+            quote_id=None,
+            carbonmark_quote_id=carbonmark_quote_id,
+            project_id=item.projectId,
+            project_name=item.projectName,
+            project_url=item.projectUrl,
+            project_registry=item.projectRegistry,
+            quantity=item.quantity,
+            total_cost=selection.totalCost,
+            sources=selection.selectedSources,
+            certificate_name=retirement_details["retiringEntityName"],
+            retirement_message=item.retirementMessage
+        )
+        record["bulk_id"] = bulk_id
+        history.append(record)
+        succeeded += 1
+        total_quantity += item.quantity
+        total_cost += selection.totalCost
+        await stream.emit("item", {
+            "index": index, "projectId": item.projectId, "quantity": item.quantity,
+            "success": True, "orderId": carbonmark_order.orderId, "orderStatus": carbonmark_order.orderStatus,
+            "totalCost": selection.totalCost, "sourceCount": len(selection.selectedSources),
+            "durationMs": round((time.monotonic() - started) * 1000, 1)
+        })
+
+    try:
+        # Group by project; each price book is fetched once and shared by that project's items
+        by_project = {}
+        for index, item in enumerate(items):
+            by_project.setdefault(item.projectId, []).append(index)
+        price_books = dict(zip(by_project, await asyncio.gather(
+            *(fetch_price_book(project_id) for project_id in by_project), return_exceptions=True
+        )))
+
+        # Allocate listings item by item so items of one project never oversell a listing
+        orders = []
+        for project_id, indices in by_project.items():
+            price_book = price_books[project_id]
+            for index in indices:
+                item = items[index]
+                if isinstance(price_book, BaseException):
+                    await emit_failure(index, f"Failed to fetch asset prices: {price_book}")
+                    continue
+                if item.quantity <= 0:
+                    await emit_failure(index, "Quantity must be greater than 0")
+                    continue
+                # Same checks as /purchase: the full name goes on the certificate
+                if not item.certificateFirstName.strip() or not item.certificateLastName.strip():
+                    await emit_failure(index, "Certificate name is required")
+                    continue
+                if not item.retirementMessage.strip():
+                    await emit_failure(index, "Retirement message is required")
+                    continue
+                try:
+                    selection = select_suppliers(
+                        price_book, item.quantity, item.totalCost if item.totalCost is not None else float("inf")
+                    )
+                except Exception as e:
+                    await emit_failure(index, str(e))
+                    continue
+                if not selection.canFulfillQuantity:
+                    await emit_failure(index, f"Insufficient supply available. Requested: {item.quantity}, Available: {selection.totalSupply}")
+                    continue
+                if item.totalCost is not None and selection.costExceedsExpected:
+                    await emit_failure(index, f"Cost ${selection.totalCost:.2f} exceeds the limit of ${item.totalCost:.2f}")
+                    continue
+                price_book = remaining_supply(price_book, selection)
+                orders.append(retire(index, selection))
+
+        await asyncio.gather(*orders)
+
+        # One batch write for every completed order, then hand them to the blockchain worker
+        saved = await save_orders_to_history(history)
+        if saved:
+            blockchain_jobs.notify()
+        for project_id in by_project:
+            price_book_cache.invalidate(project_id)
+
+        print(f"Bulk retirement {bulk_id}: {succeeded}/{len(items)} retired in {stream.elapsed_ms():.0f}ms")
+        await stream.emit("summary", {
+            "bulkId": bulk_id,
+            "itemCount": len(items),
+            "succeeded": succeeded,
+            "failed": len(items) - succeeded,
+            "totalQuantity": total_quantity,
+            "totalCost": total_cost,
+            "historySaved": saved
+        })
     except Exception as e:
-        print(f"Error creating blockchain record: {e}")
-        # Return fallback record
-        return {
-            "proposer_id": user_id or "UNKNOWN_USER",
-            "beneficiary_id": "UNKNOWN_SUPPLIER", 
-            "verifier_id": project_registry or "Unknown Registry",
-            "initiative": project_name or "Unknown Project",
-            "metadata_uri": project_url or "https://dayof.pennapps.com/",
-            "goal": 0.0
-        }
+        print(f"Bulk retirement {bulk_id} error: {e}")
+        await stream.emit("error", {"bulkId": bulk_id, "detail": str(e)})
+    finally:
+        stream.close()
 
 # --- ORDER HISTORY ENDPOINT ---
+def order_json(order: dict) -> str:
+    """Serialize one order_history record (ObjectIds and datetimes become strings)"""
+    return json.dumps(order, default=lambda value: value.isoformat() if hasattr(value, "isoformat") else str(value))
+
+async def stream_order_page(user_id: str, first_order: Optional[dict], orders, page_size: int):
+    """
+    Write a page of orders as they come off the database cursor, so only one
+    order is held in memory at a time. The cursor yields one order more than
+    the page size when another page follows.
+    """
+    yield f'{{"success": true, "user_id": {json.dumps(user_id)}, "orders": ['
+    count = 0
+    last_order = None
+    next_cursor = None
+    order = first_order
+    try:
+        while order is not None:
+            if count == page_size:
+                next_cursor = encode_order_cursor(last_order)
+                break
+            yield ("," if count else "") + order_json(order)
+            last_order = order
+            count += 1
+            order = await anext(orders, None)
+    except Exception as e:
+        # Headers are already sent; a truncated body tells the client the page failed
+        print(f"Error streaming order history for {user_id}: {e}")
+        raise
+    yield f'], "order_count": {count}, "has_more": {json.dumps(next_cursor is not None)}, "next_cursor": {json.dumps(next_cursor)}}}'
+
 @app.get("/orders/{user_id}")
-async def get_order_history(user_id: str):
+async def get_order_history(
+    user_id: str,
+    limit: int = Query(None, ge=1, le=ORDER_HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    includeCarbonmarkResponse: bool = Query(False, description="Include the raw Carbonmark order payload")
+):
     """
-    Get order history for a specific user
+    Get order history for a specific user, newest first, one page at a time
     """
+    page_size = limit or ORDER_HISTORY_PAGE_SIZE
     try:
-        orders = await get_user_orders(user_id)
-        
-        # Convert ObjectId to string for JSON serialization
-        for order in orders:
-            if '_id' in order:
-                order['_id'] = str(order['_id'])
-            # Convert datetime objects to ISO format strings
-            if 'created_at' in order and hasattr(order['created_at'], 'isoformat'):
-                order['created_at'] = order['created_at'].isoformat()
-        
-        return JSONResponse(content={
-            "success": True,
-            "user_id": user_id,
-            "order_count": len(orders),
-            "orders": orders
-        })
-        
+        orders = (await get_user_orders(user_id, page_size, cursor, includeCarbonmarkResponse)).__aiter__()
+        # Read the first order before answering so database errors still get a 500
+        first_order = await anext(orders, None)
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error fetching order history: {e}")
         raise HTTPException(
@@ -1150,22 +1578,144 @@ async def get_order_history(user_id: str):
             detail=f"Failed to fetch order history: {str(e)}"
         )
 
+    return StreamingResponse(
+        stream_order_page(user_id, first_order, orders, page_size),
+        media_type="application/json"
+    )
+
+@app.get("/impact/{user_id}")
+async def get_impact_summary(user_id: str):
+    """
+    Orders, tonnes retired and dollars spent by a user, from the maintained summary
+    """
+    try:
+        summary = await get_user_impact(user_id)
+    except Exception as e:
+        print(f"Error fetching impact summary: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch impact summary: {str(e)}")
+    return JSONResponse(content=impact_view(user_id, summary))
+
+@app.get("/project_retirements")
+async def get_project_retirement_totals(
+    ids: str = Query(..., description="Comma-separated project IDs")
+):
+    """
+    Totals retired through CarbonChain for many projects, read with one query
+    """
+    project_ids = list(dict.fromkeys(project_id.strip() for project_id in ids.split(",") if project_id.strip()))
+    if not project_ids:
+        raise HTTPException(status_code=400, detail="No project IDs given")
+    if len(project_ids) > MAX_PROJECT_RETIREMENT_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_PROJECT_RETIREMENT_IDS} project IDs per request"
+        )
+
+    try:
+        counters = await get_project_retirements(project_ids)
+    except Exception as e:
+        print(f"Error fetching project retirements: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch project retirements: {str(e)}")
+
+    return JSONResponse(content={
+        "projects": {
+            project_id: project_retirement_view(project_id, counters.get(project_id))
+            for project_id in project_ids
+        }
+    })
+
+@app.get("/rollups")
+async def get_rollups(
+    granularity: str = Query("day", description="hour or day"),
+    dimension: str = Query("all", description="all, project or registry"),
+    key: Optional[str] = Query(None, description="Project ID or registry; every key of the dimension if omitted"),
+    start: Optional[datetime] = Query(None, description="UTC, rounded down to its bucket; defaults to 48 hours or 30 days before end"),
+    end: Optional[datetime] = Query(None, description="UTC; defaults to now")
+):
+    """
+    Orders, tonnes and spend per hour or day, from the pre-aggregated rollup buckets
+    """
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {list(GRANULARITIES)}")
+    if dimension not in DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"dimension must be one of {list(DIMENSIONS)}")
+
+    # Buckets are stored in naive UTC
+    def utc(value: datetime) -> datetime:
+        return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+    end = utc(end) if end else datetime.utcnow()
+    start = utc(start) if start else end - (timedelta(hours=48) if granularity == "hour" else timedelta(days=30))
+    # Widen to the bucket containing start, so the first bucket is not dropped for starting a little earlier
+    start = bucket_start(start, granularity)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    try:
+        documents = await get_order_rollups(
+            granularity, dimension, start, end, key=key if dimension != "all" else None,
+            limit=MAX_ROLLUP_BUCKETS + 1
+        )
+    except Exception as e:
+        print(f"Error fetching rollups: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch rollups: {str(e)}")
+
+    return JSONResponse(content={
+        "granularity": granularity,
+        "dimension": dimension,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "truncated": len(documents) > MAX_ROLLUP_BUCKETS,
+        "buckets": [rollup_view(document) for document in documents[:MAX_ROLLUP_BUCKETS]]
+    })
+
+@app.get("/orders/{order_id}/blockchain")
+async def get_order_blockchain_status(order_id: str):
+    """
+    Status of the on-chain recording job for an order
+    """
+    order = await get_order_by_order_id(order_id)
+    if order is None:
+        raise HTTPException(status_code=404, detail=f"Order '{order_id}' not found")
+    if "blockchain_status" not in order:
+        raise HTTPException(status_code=404, detail=f"Order '{order_id}' has no blockchain job")
+    return JSONResponse(content=job_status(order))
+
+@app.get("/blockchain_job_status")
+async def blockchain_job_status():
+    """Blockchain job worker counters"""
+    return blockchain_jobs.stats()
+
+@app.get("/db_index_status")
+async def db_index_status():
+    """Usage of the database indexes, and registry indexes that are missing or unused"""
+    return await index_usage_report()
+
 # --- PROJECT DETAILS ENDPOINT ---
 @app.get("/project/{project_id}")
 async def get_project_details(project_id: str):
     """
     Fetch detailed information for a specific carbon project by ID
     """
-    try:
+    async def fetch_project(conditional_headers):
         # Call the Carbonmark API for project details
-        response = requests.get(f"https://v17.api.carbonmark.com/carbonProjects/{project_id}")
-        response.raise_for_status()
-        
+        return await carbonmark_client.get(
+            f"{CARBONMARK_V17_API_URL}/carbonProjects/{project_id}",
+            headers=conditional_headers
+        )
+
+    try:
+        status, project_data = await project_cache.get(project_id, fetch_project)
+        if status == 404:
+            return JSONResponse(
+                content={"error": f"Project with ID '{project_id}' not found"}, 
+                status_code=404
+            )
+
         # Return the project data directly
-        project_data = response.json()
         return JSONResponse(content=project_data)
         
-    except requests.HTTPError as e:
+    except CarbonmarkHTTPError as e:
         if e.response.status_code == 404:
             return JSONResponse(
                 content={"error": f"Project with ID '{project_id}' not found"}, 
@@ -1176,12 +1726,41 @@ async def get_project_details(project_id: str):
                 content={"error": f"HTTP error occurred: {e.response.status_code}"}, 
                 status_code=e.response.status_code
             )
-    except requests.RequestException as e:
+    except CircuitOpenError:
+        return JSONResponse(
+            content={"error": "Carbonmark is temporarily unavailable"},
+            status_code=503
+        )
+    except CarbonmarkRequestError as e:
         return JSONResponse(
             content={"error": "Failed to fetch project details from Carbonmark API"}, 
             status_code=500
         )
 
+@app.get("/quote_store_status")
+async def quote_store_status():
+    """Size, memory estimate and expiry/eviction counters of the quote store, plus quote pre-warming"""
+    stats = await quote_storage.stats()
+    stats["prewarm"] = quote_prewarmer.stats()
+    return stats
+
+@app.get("/carbonmark_status")
+async def carbonmark_status():
+    """Upstream client statistics (coalescing, circuit breakers, retry budget, quote format probes, caches)"""
+    stats = carbonmark_client.stats()
+    stats["quoteFormats"] = quote_formats.to_dict()
+    stats["caches"] = {
+        "reference": reference_cache.stats(),
+        "projects": project_cache.stats(),
+        "priceBooks": {
+            **price_book_cache.stats(),
+            # Numeric columns of the cached price books
+            "columnBytes": sum(entry.value.nbytes() for entry in price_book_cache.entries.values())
+        },
+        "searchFallback": search_fallback_cache.stats()
+    }
+    return stats
+
 @app.get("/funding_tree")
 async def funding_tree():
     """API endpoint to return the funding tree JSON for frontend visualization."""
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Recompute the order summary collections (user_impact, project_retirements,
+order_rollups) from order_history.
+
+Usage: python rebuild_order_summaries.py [users|projects|rollups]
+"""
+import sys
+import os
+import asyncio
+
+# Add the current directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import (
+    db, connect_to_mongo, close_mongo_connection, rebuild_user_impact, rebuild_project_retirements,
+    backfill_order_rollups
+)
+
+REBUILDERS = {
+    "users": rebuild_user_impact,
+    "projects": rebuild_project_retirements,
+    # Streams order_history in batches instead of aggregating it in one pass
+    "rollups": backfill_order_rollups
+}
+
+
+async def main():
+    selected = sys.argv[1:] or list(REBUILDERS)
+    unknown = [name for name in selected if name not in REBUILDERS]
+    if unknown:
+        print(f"Unknown summaries {unknown}; choose from {list(REBUILDERS)}")
+        return
+
+    await connect_to_mongo()
+    try:
+        if db.is_fallback:
+            print("FAILED: MongoDB Atlas is unavailable - the in-memory database has no orders to rebuild from")
+            return
+        for name in selected:
+            await REBUILDERS[name]()
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,70 @@
+"""
+Regression tests for quote pre-warming (cancelled pre-warms must not leave quotes pending)
+"""
+import sys
+import os
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.models import QuoteStorage
+from app.quote_store import quote_storage
+from app.quote_prewarm import QuotePrewarmer, PENDING, FAILED
+
+
+async def never_ready(sources, retirement_details):
+    await asyncio.sleep(3600)
+
+
+def pending_quote() -> QuoteStorage:
+    now = datetime.utcnow()
+    return QuoteStorage(quoteId=str(uuid.uuid4()), carbonmarkQuoteStatus=PENDING, projectId="VCS-0", quantity=1,
+                        selectedSources=[], totalCost=1, createdAt=now, expiresAt=now + timedelta(minutes=5))
+
+
+def test_timed_out_prewarm_is_not_waited_on_again():
+    async def run():
+        prewarmer = QuotePrewarmer(never_ready)
+        prewarmer.wait_timeout = 0.05
+        quote = pending_quote()
+        await quote_storage.put(quote)
+        prewarmer.start(quote, {})
+
+        # What /purchase does: wait, give up, cancel and create its own upstream quote
+        waited = await prewarmer.wait(quote)
+        assert waited.carbonmarkQuoteStatus == PENDING
+        await prewarmer.cancel(quote.quoteId)
+
+        stored = await quote_storage.get(quote.quoteId)
+        assert stored.carbonmarkQuoteStatus == FAILED
+
+        # A retry of the purchase goes straight on without waiting for the timeout again
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await prewarmer.wait(stored)
+        assert loop.time() - started < prewarmer.wait_timeout
+        assert prewarmer.waits == 1 and prewarmer.wait_timeouts == 1
+
+    asyncio.run(run())
+
+
+def test_stopped_prewarm_is_marked_failed():
+    async def run():
+        prewarmer = QuotePrewarmer(never_ready)
+        quote = pending_quote()
+        await quote_storage.put(quote)
+        prewarmer.start(quote, {})
+        await asyncio.sleep(0)
+
+        await prewarmer.stop()
+        stored = await quote_storage.get(quote.quoteId)
+        assert stored.carbonmarkQuoteStatus == FAILED
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_timed_out_prewarm_is_not_waited_on_again()
+    test_stopped_prewarm_is_marked_failed()
+    print("Quote pre-warm tests passed")
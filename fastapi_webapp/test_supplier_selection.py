@@ -0,0 +1,113 @@
+"""
+Regression tests for the supplier selection solver (minimum lots and the supplier cap)
+"""
+import sys
+import os
+import random
+import itertools
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from app.models import AssetSource
+from app.price_book import PriceBook
+from app.supplier_selection import (
+    select_suppliers, select_multi_supplier, solve_min_cost, remaining_supply, _fill_cost, EPSILON
+)
+
+
+def listing(source_id, price, supply, min_quantity=None, listing_id=None):
+    return AssetSource(sourceId=source_id, purchasePrice=price, supply=supply, poolName="",
+                       assetPriceSourceId=source_id, listingId=listing_id, minQuantity=min_quantity)
+
+
+def brute_force_cost(prices, supplies, mins, quantity, max_suppliers):
+    """Cheapest exact fill over every combination of listings, or None"""
+    order = np.argsort(prices, kind="stable")
+    prices, supplies, mins = prices[order], supplies[order], np.nan_to_num(mins[order], nan=0.0)
+    best = None
+    for size in range(1, (max_suppliers or len(prices)) + 1):
+        for combination in itertools.combinations(range(len(prices)), size):
+            if any(supplies[i] < mins[i] for i in combination):
+                continue
+            use = np.zeros(len(prices), dtype=bool)
+            use[list(combination)] = True
+            result = _fill_cost(prices, supplies, mins, use, quantity)
+            if result is not None and (best is None or result[0] < best):
+                best = result[0]
+    return best
+
+
+def test_minimum_lot_does_not_block_fill():
+    # Taking all of a leaves 3t, below b's minimum of 4; a fill still exists
+    book = PriceBook.from_sources([listing("a", 2.0, 2.0), listing("b", 3.0, 5.0, min_quantity=4.0)])
+
+    selection = select_suppliers(book, quantity=5, expected_cost=100)
+    assert selection.canFulfillQuantity
+    assert abs(selection.totalSupply - 5) < EPSILON
+
+    # Combining: 1t of a plus b's minimum lot of 4t beats b alone ($15)
+    selection = select_multi_supplier(book, quantity=5, expected_cost=100)
+    assert selection.canFulfillQuantity
+    assert abs(selection.totalCost - 14) < 1e-6
+    amounts = {source.sourceId: source.supply for source in selection.selectedSources}
+    assert amounts == {"a": 1.0, "b": 4.0}
+
+
+def test_capped_fill_searches_combinations():
+    prices = np.array([1.0, 1.0, 3.0, 3.0])
+    supplies = np.array([2.0, 1.0, 2.0, 3.0])
+    mins = np.array([1.0, np.nan, 0.0, 2.0])
+    indices, amounts = solve_min_cost(prices, supplies, 7.0, mins, max_suppliers=3)
+
+    assert len(indices) <= 3
+    assert abs(amounts.sum() - 7) < 1e-6
+    assert abs(float(np.dot(amounts, prices[indices])) - brute_force_cost(prices, supplies, mins, 7.0, 3)) < 1e-6
+
+
+def test_matches_brute_force_on_random_books():
+    rng = random.Random(7)
+    for _ in range(2000):
+        count = rng.randint(1, 6)
+        prices = np.array([rng.choice([1, 2, 3, 4, 5]) for _ in range(count)], dtype=np.float64)
+        supplies = np.array([rng.randint(1, 6) for _ in range(count)], dtype=np.float64)
+        mins = np.array([rng.choice([np.nan, 0, 1, 2, 3, 4]) for _ in range(count)], dtype=np.float64)
+        quantity = float(rng.randint(1, 15))
+        max_suppliers = rng.choice([None, None, 1, 2, 3])
+
+        indices, amounts = solve_min_cost(prices, supplies, quantity, mins, max_suppliers)
+        expected = brute_force_cost(prices, supplies, mins, quantity, max_suppliers)
+        filled = amounts.sum() >= quantity - EPSILON
+
+        assert filled == (expected is not None), (prices, supplies, mins, quantity, max_suppliers)
+        if filled:
+            assert abs(float(np.dot(amounts, prices[indices])) - expected) < 1e-6
+            assert not max_suppliers or len(indices) <= max_suppliers
+            lots = np.nan_to_num(mins[indices], nan=0.0)
+            assert (amounts >= lots - EPSILON).all() and (amounts <= supplies[indices] + EPSILON).all()
+
+
+def test_remaining_supply_deducts_from_the_listing_taken():
+    # Two listings share a source ID; only the one that was sold from loses supply
+    book = PriceBook.from_sources([
+        listing("a", 2.0, 3.0, listing_id="l1"),
+        listing("a", 1.0, 4.0, listing_id="l2"),
+        listing("b", 5.0, 10.0, listing_id="l3")
+    ])
+    selection = select_multi_supplier(book, quantity=6, expected_cost=100)
+    left = remaining_supply(book, selection)
+    assert left.supplies.tolist() == [1.0, 0.0, 10.0]
+
+    # Identical rows are drawn down in order
+    book = PriceBook.from_sources([listing("a", 1.0, 2.0), listing("a", 1.0, 2.0)])
+    selection = select_multi_supplier(book, quantity=3, expected_cost=100)
+    left = remaining_supply(book, selection)
+    assert abs(left.supplies.sum() - 1.0) < EPSILON
+
+
+if __name__ == "__main__":
+    test_minimum_lot_does_not_block_fill()
+    test_capped_fill_searches_combinations()
+    test_matches_brute_force_on_random_books()
+    test_remaining_supply_deducts_from_the_listing_taken()
+    print("Supplier selection tests passed")